@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Benchmark p2d on a synthetic problemset (see p2d.tests.synthetic).
+
+Times each stage of Problem.run() (config, validator, data, submissions,
+archive) in this process, then the end-to-end conversion by the p2d
+command, both from scratch and with nothing to do. Results can be saved
+as JSON and compared with those of another commit:
+
+    python benchmarks/bench.py --save before.json
+    git checkout ...
+    python benchmarks/bench.py --compare before.json
+"""
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def argparser():
+    parser = ArgumentParser(description='Benchmark p2d on a synthetic problemset.')
+    parser.add_argument('--problems', type=int, default=8, help='number of problems (default: 8)')
+    parser.add_argument('--tests', type=int, default=50, help='number of tests per problem (default: 50)')
+    parser.add_argument('--test-size', type=int, default=64 * 1024, help='size of each test in bytes (default: 64 KiB)')
+    parser.add_argument('--answer-size', type=int, default=1024, help='size of each answer in bytes (default: 1 KiB)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs of each benchmark (default: 3)')
+    parser.add_argument('--p2d-args', default='', help='extra arguments of the end-to-end runs, e.g. "-j 4"')
+    parser.add_argument('--workdir', help='directory to work in (default: a temporary directory, removed)')
+    parser.add_argument('--save', metavar='JSON', help='save the results to this file')
+    parser.add_argument('--compare', metavar='JSON', help='compare the results with those saved in this file')
+    return parser
+
+
+def summary(samples):
+    return {'min': min(samples), 'median': statistics.median(samples), 'runs': len(samples)}
+
+
+def bench_stages(problemset, repeat):
+    """Time the stages of Problem.run() for every problem, in this process
+    (the environment must already point p2d to the synthetic config).
+
+    Returns:
+        {stage: summary of the seconds spent in it over all problems}.
+    """
+    from p2d import main
+    from p2d import problems
+
+    args = main.default_args()
+    args.force = True
+    main.Problem.problem_config = problems.load_problem_config(problemset)
+    stages = ['config', 'validator', 'data', 'submissions', 'archive']
+    samples = {stage: [] for stage in stages}
+    problemdirs = sorted(os.path.join(problemset, _) for _ in os.listdir(problemset)
+                         if os.path.isdir(os.path.join(problemset, _)))
+    for _ in range(repeat):
+        totals = dict.fromkeys(stages, 0.0)
+        for problemdir in problemdirs:
+            with main.Problem(problemdir) as prob:
+                aspects = {'config': prob.config, 'validator': prob.output_validator,
+                           'data': prob.testdata, 'submissions': prob.submissions}
+                for stage, aspect in aspects.items():
+                    aspect.process = timed(aspect.process, totals, stage)
+                open_archive = prob.open_archive
+
+                def open_timed_archive(*args, **kwargs):
+                    writer = open_archive(*args, **kwargs)
+                    writer.close = timed(writer.close, totals, 'archive')
+                    return writer
+
+                prob.open_archive = open_timed_archive
+                with contextlib.redirect_stdout(io.StringIO()):
+                    errors, _ = prob.run(args)
+                if errors:
+                    raise RuntimeError('%s failed to convert' % problemdir)
+        for stage in stages:
+            samples[stage].append(totals[stage])
+    return {stage: summary(samples[stage]) for stage in stages}
+
+
+def timed(function, totals, stage):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            totals[stage] += time.perf_counter() - start
+    return wrapper
+
+
+def bench_main(problemset, env, repeat, extra_args, force):
+    """Time the p2d command converting the whole problemset."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'p2d.main', problemset, '-l', 'error'] +
+                       (['--force'] if force else []) + extra_args,
+                       env=env, check=True, stdout=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return summary(samples)
+
+
+def compare(results, baseline):
+    print('\n%-20s %10s %10s %8s' % ('benchmark', 'baseline', 'current', 'ratio'))
+    for name, result in results['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if old is None:
+            continue
+        ratio = result['min'] / old['min'] if old['min'] else float('inf')
+        print('%-20s %9.3fs %9.3fs %7.2fx' % (name, old['min'], result['min'], ratio))
+
+
+def main():
+    args = argparser().parse_args()
+    from p2d.tests import synthetic
+
+    cwd = os.getcwd()
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='p2d-bench'))
+    try:
+        problemset = os.path.join(workdir, 'set')
+        config_home = os.path.join(workdir, 'config')
+        synthetic.make_problemset(problemset, config_home, problems=args.problems, tests=args.tests,
+                                  test_size=args.test_size, answer_size=args.answer_size)
+        env = dict(os.environ, PYTHONPATH=ROOT, XDG_CONFIG_HOME=config_home,
+                   P2D_CACHE_DIR=os.path.join(workdir, 'cache'))
+        os.environ.update(XDG_CONFIG_HOME=config_home, P2D_CACHE_DIR=os.path.join(workdir, 'cache'))
+        os.chdir(workdir)
+
+        benchmarks = {}
+        for stage, result in bench_stages(problemset, args.repeat).items():
+            benchmarks['stage:%s' % stage] = result
+        extra_args = args.p2d_args.split()
+        benchmarks['main:cold'] = bench_main(problemset, env, args.repeat, extra_args, force=True)
+        benchmarks['main:unchanged'] = bench_main(problemset, env, args.repeat, extra_args, force=False)
+    finally:
+        os.chdir(cwd)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'params': {key: getattr(args, key) for key in ('problems', 'tests', 'test_size', 'answer_size', 'p2d_args')},
+        'commit': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip(),
+        'benchmarks': benchmarks,
+    }
+    print('%-20s %10s %10s' % ('benchmark', 'min', 'median'))
+    for name, result in benchmarks.items():
+        print('%-20s %9.3fs %9.3fs' % (name, result['min'], result['median']))
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
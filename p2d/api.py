@@ -0,0 +1,105 @@
+"""In-process conversion API.
+
+Example:
+    configs = Configs.load('/path/to/problemset')
+    result = convert_problem('/path/to/problemset/A', '/tmp/A.zip', {'werror': True}, configs)
+    if not result.ok:
+        print(result.messages)
+
+convert_problem() uses no global state: calls may run concurrently in
+several threads, sharing the same (read-only) Configs.
+"""
+import argparse
+
+from . import checkers
+from . import misc
+from . import problems
+from . import results
+from .main import Problem, default_args
+
+
+class Configs(object):
+    """The configurations a conversion depends on, loaded once and shared
+    by any number of conversions.
+    """
+
+    def __init__(self, problem_config, checker_config, result_config, misc_config):
+        self.problem_config = problem_config
+        self.checker_config = checker_config
+        self.result_config = result_config
+        self.misc_config = misc_config
+
+    @staticmethod
+    def load(problemsetdir=None):
+        """Load the configuration files (see README), with the
+        problems.yaml of problemsetdir if given.
+        """
+        return Configs(problems.load_problem_config(problemsetdir), checkers.load_checker_config(),
+                       results.load_result_config(), misc.load_misc_config())
+
+
+class ConversionResult(object):
+    """Outcome of convert_problem()."""
+
+    def __init__(self, problem):
+        self.errors = problem.errors
+        self.warnings = problem.warnings
+        # List of (level, message) for every error and warning.
+        self.messages = list(problem.messages)
+        self.output_path = problem.output
+        # Whether the package was already up to date.
+        self.skipped = problem.skipped
+        # Metrics of the stages, see p2d.metrics.Recorder.as_dict().
+        self.metrics = problem.metrics.as_dict()
+
+    @property
+    def ok(self):
+        return self.errors == 0
+
+    def __repr__(self):
+        return 'ConversionResult(%r, errors=%d, warnings=%d)' % (self.output_path, self.errors, self.warnings)
+
+
+def make_options(values=None):
+    """Return the options of a conversion: the defaults of the command line
+    arguments (see p2d.main.argparser()), updated with values.
+
+    Args:
+        values (dict or argparse.Namespace): options to change, by their
+            destination name, e.g. {'werror': True, 'compress_level': 9}.
+    """
+    args = default_args()
+    if values is None:
+        return args
+    if isinstance(values, argparse.Namespace):
+        values = vars(values)
+    for (key, value) in values.items():
+        if not hasattr(args, key):
+            raise ValueError('Unknown option "%s"' % key)
+        setattr(args, key, value)
+    return args
+
+
+def convert_problem(probdir, output_path, options=None, configs=None):
+    """Convert the Polygon package in probdir to a DOMjudge package.
+
+    Args:
+        probdir (str): directory of the Polygon package.
+        output_path (str): path of the DOMjudge package, a zip or a
+            directory depending on options['output_format']. Its manifest
+            is written next to it.
+        options (dict or argparse.Namespace): see make_options().
+        configs (Configs): configurations, loaded with Configs.load()
+            for this call only if None: load them once and pass them to
+            convert several problems.
+
+    Returns:
+        a ConversionResult. Errors in the package are reported there,
+        nothing is printed (but the messages are logged).
+    """
+    args = make_options(options)
+    if configs is None:
+        configs = Configs.load()
+    with Problem(probdir, configs, werror=args.werror, output=output_path, quiet=True) as problem:
+        problem.run(args)
+    return ConversionResult(problem)
@@ -0,0 +1,924 @@
+import concurrent.futures
+import os
+import queue
+import shutil
+import struct
+import sys
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+
+from . import metrics
+from . import package
+from . import scan
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl cloning a file on copy-on-write filesystems (btrfs, xfs), see ioctl_ficlone(2).
+_FICLONE = 0x40049409
+
+
+class ArchiveWriter(object):
+    """Base class of the backends a DOMjudge package is written to.
+
+    Members are addressed by their path inside the package, using '/'
+    as separator, e.g. 'data/secret/01.in'.
+
+    If a manifest (see p2d.manifest) is given, the files written are
+    hashed into it on the way.
+    """
+
+    manifest = None
+
+    def mkdir(self, arcname):
+        """Create a directory (and its parents) in the package."""
+        raise NotImplementedError
+
+    def write_str(self, arcname, data):
+        """Write a text member encoded as UTF-8."""
+        raise NotImplementedError
+
+    def write_file(self, arcname, src, *scanners):
+        """Write a member with the content of the file src, a path or a
+        p2d.package.Member.
+
+        Every chunk written is also fed to the given scanners (see
+        p2d.scan), so the file is checked in the same pass.
+        """
+        raise NotImplementedError
+
+    def write_files(self, files):
+        """Write several members with the content of files, see
+        write_file(). Backends may read and write them concurrently.
+
+        Args:
+            files: iterable of (arcname, src, scanners) tuples.
+
+        Returns:
+            a list of concurrent.futures.Future, one for each file in
+            the same order, whose result() raises the error (e.g.
+            FileNotFoundError) that prevented writing it, if any. The
+            scanners of a file are complete once its future is done.
+        """
+        results = []
+        for arcname, src, scanners in files:
+            future = concurrent.futures.Future()
+            try:
+                self.write_file(arcname, src, *scanners)
+                future.set_result(None)
+            except package.READ_ERRORS as err:
+                future.set_exception(err)
+            results.append(future)
+        return results
+
+    def _scanners(self, arcname, src, scanners):
+        # Members of an archive package are fingerprinted with the archive.
+        if self.manifest is not None and not isinstance(src, package.Member):
+            return scanners + (self.manifest.hasher(src, arcname),)
+        return scanners
+
+    def close(self):
+        """Finish the package."""
+        raise NotImplementedError
+
+    def abort(self):
+        """Discard an unfinished package. Does nothing once closed."""
+        raise NotImplementedError
+
+
+class CompressionPolicy(object):
+    """Decide how each member of a zip is stored.
+
+    The first sample_size bytes of a file are compressed at the fastest
+    level: if that does not shrink them to at most min_ratio of their
+    size, the file is considered incompressible (random or already dense
+    data) and stored as is, otherwise it is deflated at the given level.
+    """
+
+    def __init__(self, level=6, sample_size=65536, min_ratio=0.9):
+        self.level = level
+        self.sample_size = sample_size
+        self.min_ratio = min_ratio
+
+    def compress_type(self, sample):
+        """Return the compression method for a file starting with sample."""
+        sample = sample[:self.sample_size]
+        if self.level == 0 or not sample:
+            return zipfile.ZIP_STORED
+        compressor = zlib.compressobj(1, zlib.DEFLATED, -15)
+        compressed_size = len(compressor.compress(sample)) + len(compressor.flush())
+        if compressed_size > len(sample) * self.min_ratio:
+            return zipfile.ZIP_STORED
+        return zipfile.ZIP_DEFLATED
+
+
+def _entry_overhead(arcname):
+    """Bytes a member takes in a zip besides its data: its local header
+    and its central directory entry.
+    """
+    return 30 + 46 + 2 * len(arcname.encode('utf-8'))
+
+
+def estimate_sizes(files, policy, samples=16):
+    """Estimate the size each file will take in a zip, without
+    compressing the files.
+
+    Deflated members of a zip package are copied as they are, so their
+    size is known. The first policy.sample_size bytes of the samples
+    largest other files are compressed as the policy would, the others
+    are assumed to compress like those did on average.
+
+    Args:
+        files: list of (arcname, src) tuples, src being a path or a
+            p2d.package.Member, for existing files.
+        policy (CompressionPolicy): how the files will be compressed.
+        samples (int): number of files to sample.
+
+    Returns:
+        the list of (size, estimated size in the zip) of the files.
+    """
+    sizes = [src.size if isinstance(src, package.Member) else os.path.getsize(src) for _, src in files]
+    estimates = [None] * len(files)
+    unknown = []
+    for i, (arcname, src) in enumerate(files):
+        if isinstance(src, package.ZipMember) and src.deflated and policy.level != 0:
+            estimates[i] = src.info.compress_size
+        else:
+            unknown.append(i)
+    unknown.sort(key=lambda i: -sizes[i])
+    sampled, compressed = 0, 0
+    for i in unknown[:samples]:
+        with package.open_source(files[i][1]) as f:
+            sample = f.read(policy.sample_size)
+        metrics.counters.read(len(sample))
+        if policy.compress_type(sample) == zipfile.ZIP_DEFLATED:
+            ratio = len(zlib.compress(sample, policy.level)) / len(sample)
+        else:
+            ratio = 1.0
+        estimates[i] = int(sizes[i] * ratio)
+        sampled += len(sample)
+        compressed += len(sample) * ratio
+    ratio = compressed / sampled if sampled else 1.0
+    for i in unknown[samples:]:
+        estimates[i] = int(sizes[i] * ratio)
+    return [(size, estimate + _entry_overhead(arcname))
+            for size, estimate, (arcname, _) in zip(sizes, estimates, files)]
+
+
+def _deflate(data, level, zdict, final):
+    """Compress one chunk of a member into raw deflate data.
+
+    Chunks are compressed independently, primed with the end of the
+    previous chunk as dictionary; all but the last one end with a sync
+    flush, so that their concatenation is a single valid deflate stream.
+    """
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def _inflated(fraw, member, scanners):
+    """Yield the compressed data of the zip package member member, read
+    from fraw, feeding its data to the scanners after inflating it, and
+    check its CRC-32 at the end.
+    """
+    crc = scan.Crc32()
+    scanners += (crc,)
+    decompressor = zlib.decompressobj(-15)
+    try:
+        with fraw:
+            for chunk in scan.iter_chunks(fraw):
+                data = decompressor.decompress(chunk, scan.CHUNK_SIZE)
+                while data:
+                    for scanner in scanners:
+                        scanner.feed(data)
+                    data = decompressor.decompress(decompressor.unconsumed_tail, scan.CHUNK_SIZE)
+                yield chunk
+        data = decompressor.flush()
+    except zlib.error as err:
+        raise zipfile.BadZipFile('Bad compressed data for %s: %s' % (member, err))
+    for scanner in scanners:
+        scanner.feed(data)
+    if crc.crc != member.info.CRC or crc.size != member.info.file_size:
+        raise zipfile.BadZipFile('Bad CRC-32 for %s' % member)
+
+
+def _chunks(fsrc, first):
+    """Yield first, then the rest of the file object fsrc, closing it."""
+    with fsrc:
+        yield first
+        yield from scan.iter_chunks(fsrc)
+
+
+class _SourceError(Exception):
+    """The source of a member could not be read, nothing was written."""
+
+
+class _Failure(object):
+    """Put instead of the next part of a member whose source failed to
+    be read or compressed, with the error.
+    """
+
+    def __init__(self, error):
+        self.error = error
+
+
+class ZipArchiveWriter(ArchiveWriter):
+    """Write the package straight into a zip file.
+
+    The zip is built under a temporary name next to path and only
+    renamed to path when closed, so a failed conversion never leaves a
+    truncated archive behind.
+
+    Members of a zip package (see p2d.package) which are deflated are
+    copied as they are, without inflating and deflating them again: they
+    are only inflated on the way to be scanned and to check their CRC-32.
+
+    If the manifest of the zip already at path is given as previous,
+    members whose source has the same content as when that zip was built
+    (same size, CRC-32 and sha256) are copied from it as they are, still
+    compressed, instead of being compressed again.
+
+    How other files are compressed is decided by policy, a
+    CompressionPolicy. With threads > 1, members are compressed chunk by
+    chunk on a pool of threads (zlib releases the GIL while compressing)
+    and a single writer thread appends the results to the zip, in the
+    order they were written. The archive is the same whatever the number
+    of threads.
+
+    With io_threads > 1, the files given to write_files() are opened and
+    read ahead on a pool of io_threads threads, so the latency of the
+    storage is paid once for several files instead of once per file.
+
+    If stream (a binary file object, e.g. sys.stdout.buffer) is given,
+    the zip is written to it instead of path, without ever seeking: the
+    CRC and sizes of compressed members follow their data in a data
+    descriptor. Whatever was written can't be taken back if the archive
+    is aborted then.
+    """
+
+    __ZDICT_SIZE = 32768
+    __FAILED = object()
+    __PREVIOUS = object()
+    __PACKAGE = object()
+
+    def __init__(self, path, manifest=None, previous=None, policy=None, threads=1, io_threads=1, stream=None):
+        self.path = path
+        self.manifest = manifest
+        self.policy = policy if policy is not None else CompressionPolicy()
+        self._previous = None
+        self._stream = stream
+        if previous is not None and manifest is not None and stream is None:
+            try:
+                self._previous_zip = zipfile.ZipFile(path)
+                self._previous = previous
+            except (OSError, zipfile.BadZipFile):
+                pass
+        if stream is not None:
+            self._tmp_path = None
+            self._output = _StreamOutput(stream)
+            self._zip = zipfile.ZipFile(self._output, 'w', zipfile.ZIP_DEFLATED)
+        else:
+            self._tmp_path = os.path.join(os.path.dirname(os.path.abspath(path)),
+                                          '.%s.%s.tmp' % (os.path.basename(path), uuid.uuid4().hex[:8]))
+            self._zip = zipfile.ZipFile(self._tmp_path, 'x', zipfile.ZIP_DEFLATED)
+        self._dirs = set()
+        self._threads = threads
+        self._executor = None
+        self._io = None
+        self._writer = None
+        self._error = None
+        if threads > 1:
+            self._executor = concurrent.futures.ThreadPoolExecutor(threads)
+        if io_threads > 1:
+            self._io = concurrent.futures.ThreadPoolExecutor(io_threads)
+        if threads > 1 or io_threads > 1:
+            self._jobs = queue.Queue(4 * max(threads, io_threads))
+            self._writer = threading.Thread(target=self.__write_jobs, name='zip writer %s' % path, daemon=True)
+            self._writer.start()
+
+    def __write_jobs(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            job, args, future = job
+            if self._error is not None:
+                future.set_exception(self._error)
+                continue
+            try:
+                future.set_result(job(*args))
+            except _SourceError as err:
+                future.set_exception(err.__cause__)
+            except BaseException as err:
+                self._error = err
+                future.set_exception(err)
+
+    def __put(self, jobs, item, check=True):
+        """Put item in a queue consumed by the writer thread, giving up
+        (raising the error if check) once the writer thread failed.
+        """
+        while True:
+            if self._error is not None:
+                if check:
+                    raise self._error
+                return
+            try:
+                jobs.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def __parts(self, parts):
+        """Yield the items put in parts until None, giving up once the
+        archive is aborted.
+        """
+        while True:
+            try:
+                part = parts.get(timeout=0.1)
+            except queue.Empty:
+                if self._error is not None:
+                    raise self._error
+                continue
+            if part is None:
+                return
+            yield part
+
+    def _run(self, job, *args):
+        """Run job(*args) on the writer thread, after all jobs run before.
+        Returns:
+            a future of the result of the job, or None if it was run at
+            once.
+        """
+        if self._writer is None:
+            job(*args)
+            return None
+        future = concurrent.futures.Future()
+        self.__put(self._jobs, (job, args, future))
+        return future
+
+    def mkdir(self, arcname):
+        path = ''
+        for part in arcname.strip('/').split('/'):
+            path += part + '/'
+            if path not in self._dirs:
+                self._dirs.add(path)
+                info = zipfile.ZipInfo(path, time.localtime(time.time())[:6])
+                info.external_attr = 0o40775 << 16 | 0x10
+                self._run(self._zip.writestr, info, b'')
+
+    def __mkparent(self, arcname):
+        if '/' in arcname:
+            self.mkdir(arcname.rsplit('/', 1)[0])
+
+    def write_str(self, arcname, data):
+        self.__mkparent(arcname)
+        data = data.encode('utf-8')
+        info = zipfile.ZipInfo(arcname, time.localtime(time.time())[:6])
+        info.external_attr = 0o644 << 16
+        info.file_size = len(data)
+        info.compress_type = self.policy.compress_type(data)
+        self._write_member(info, [data])
+
+    def write_file(self, arcname, src, *scanners):
+        self.__mkparent(arcname)
+        info, chunks, raw = self.__open_member(arcname, src, scanners)
+        if raw is not None:
+            self._run(self._write_raw, info, chunks)
+        else:
+            self._write_member(info, chunks)
+
+    def write_files(self, files):
+        if self._io is None:
+            return super().write_files(files)
+        results = []
+        for arcname, src, scanners in files:
+            self.__mkparent(arcname)
+            parts = queue.Queue(2 * self._threads)
+            results.append(self._run(self.__write_produced, parts))
+            self._io.submit(self.__produce, arcname, src, scanners, parts)
+        return results
+
+    def __open_member(self, arcname, src, scanners):
+        """Prepare writing the file src as the member arcname.
+        Returns:
+            (info, chunks, raw): the ZipInfo of the member and its data,
+            as an iterable of bytes chunks. If raw is None, the data has
+            to be compressed with info.compress_type. Otherwise info is
+            complete and the data is already compressed: it is read from
+            the previous zip if raw is __PREVIOUS (only on the writer
+            thread then), or from a zip package if raw is __PACKAGE.
+        """
+        if isinstance(src, package.Member):
+            return self.__open_package_member(arcname, src, scanners)
+        info = zipfile.ZipInfo.from_file(src, arcname)
+        previous = self.__previous_member(arcname, src, info.file_size)
+        if previous is not None:
+            # Read the source anyway, the scanners need it, but that's
+            # still much cheaper than compressing it.
+            hasher = self.manifest.hasher(src, arcname)
+            scan.scan_file(src, hasher, *scanners)
+            old_info, fingerprint = previous
+            if (hasher.size == old_info.file_size and hasher.crc == old_info.CRC and
+                    hasher.hexdigest() == fingerprint['sha256']):
+                info.compress_type = old_info.compress_type
+                info.CRC = old_info.CRC
+                info.file_size = old_info.file_size
+                info.compress_size = old_info.compress_size
+                return info, self.__read_raw(old_info), self.__PREVIOUS
+            # Same size but different content: compress it after all.
+            scanners = ()
+        else:
+            scanners = self._scanners(arcname, src, scanners)
+        return self.__open_data(info, open(src, 'rb', buffering=0), scanners)
+
+    def __open_package_member(self, arcname, member, scanners):
+        info = zipfile.ZipInfo(arcname, member.date_time)
+        info.external_attr = 0o644 << 16
+        if isinstance(member, package.ZipMember) and member.deflated and self.policy.level != 0:
+            fraw = member.open_raw()
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.CRC = member.info.CRC
+            info.file_size = member.info.file_size
+            info.compress_size = member.info.compress_size
+            return info, _inflated(fraw, member, scanners), self.__PACKAGE
+        fsrc = member.open()
+        info.file_size = member.size
+        return self.__open_data(info, fsrc, scanners)
+
+    def __open_data(self, info, fsrc, scanners):
+        try:
+            first = fsrc.read(scan.CHUNK_SIZE)
+        except BaseException:
+            fsrc.close()
+            raise
+        metrics.counters.read(len(first))
+        info.compress_type = self.policy.compress_type(first)
+        return info, scan.scanned(_chunks(fsrc, first), *scanners), None
+
+    def __produce(self, arcname, src, scanners, parts):
+        """Read a member for write_files(), on an I/O thread.
+
+        The first item put in parts is (info, raw chunks, None) for data
+        to be read from the previous zip, or (info, None, crc) followed by
+        the compressed parts of the data, or (__FAILED, error, None) if the
+        source could not be opened.
+        """
+        try:
+            info, chunks, raw = self.__open_member(arcname, src, scanners)
+        except BaseException as err:
+            self.__put(parts, (self.__FAILED, err, None), check=False)
+            return
+        if raw is self.__PREVIOUS:
+            self.__put(parts, (info, chunks, None), check=False)
+            return
+        crc = scan.Crc32()
+        try:
+            self.__put(parts, (info, None, crc))
+            if raw is self.__PACKAGE:
+                # _inflated() checks the data against them.
+                crc.crc, crc.size = info.CRC, info.file_size
+            else:
+                chunks = self.__compress(info, chunks, crc)
+            for part in chunks:
+                self.__put(parts, part)
+        except BaseException as err:
+            self.__put(parts, _Failure(err), check=False)
+            raise
+        finally:
+            self.__put(parts, None, check=False)
+
+    def __write_produced(self, parts):
+        parts = self.__parts(parts)
+        info, raw, crc = next(parts)
+        if info is self.__FAILED:
+            raise _SourceError() from raw
+        if crc is None:
+            self._write_raw(info, raw)
+        else:
+            self.__write_compressed(info, parts, crc)
+
+    def __previous_member(self, arcname, src, size):
+        if self._previous is None or self._previous.members.get(arcname) != self.manifest.name(src):
+            return None
+        fingerprint = self._previous.source_of(arcname)
+        try:
+            old_info = self._previous_zip.getinfo(arcname)
+        except KeyError:
+            return None
+        if fingerprint is None or fingerprint['size'] != size or old_info.file_size != size:
+            return None
+        return old_info, fingerprint
+
+    def __read_raw(self, info):
+        """Yield the compressed data of a member of the previous zip."""
+        fp = self._previous_zip.fp
+        fp.seek(info.header_offset)
+        header = fp.read(30)
+        if len(header) != 30 or header[:4] != b'PK\x03\x04':
+            raise zipfile.BadZipFile('Bad local file header of %s' % info.filename)
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        fp.seek(name_length + extra_length, os.SEEK_CUR)
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = fp.read(min(remaining, scan.CHUNK_SIZE))
+            if not chunk:
+                raise zipfile.BadZipFile('Truncated data of %s' % info.filename)
+            remaining -= len(chunk)
+            metrics.counters.read(len(chunk))
+            yield chunk
+
+    def __compress(self, info, chunks, crc):
+        """Yield the compressed chunks of a member (or futures of them),
+        computing the CRC of the data on the way.
+        """
+        submit = self._executor.submit if self._executor is not None else lambda fn, *args: fn(*args)
+        chunks = scan.scanned(chunks, crc)
+        if info.compress_type != zipfile.ZIP_DEFLATED:
+            yield from chunks
+            return
+        level = self.policy.level
+        previous, zdict = None, b''
+        for chunk in chunks:
+            if previous is not None:
+                yield submit(_deflate, previous, level, zdict, False)
+                zdict = previous[-self.__ZDICT_SIZE:]
+            previous = chunk
+        yield submit(_deflate, previous or b'', level, zdict, True)
+
+    def _write_member(self, info, chunks):
+        """Append a member, compressing the data given as an iterable of
+        bytes chunks with info.compress_type.
+
+        info.file_size must be set to the expected size of the data, it
+        decides whether the member needs zip64 extensions.
+        """
+        crc = scan.Crc32()
+        if self._writer is None:
+            self.__write_compressed(info, self.__compress(info, chunks, crc), crc)
+            return
+        parts = queue.Queue(2 * self._threads)
+        self._run(self.__write_compressed, info, self.__parts(parts), crc)
+        try:
+            for part in self.__compress(info, chunks, crc):
+                self.__put(parts, part)
+        except BaseException as err:
+            self.__put(parts, _Failure(err), check=False)
+            raise
+        finally:
+            self.__put(parts, None, check=False)
+
+    def __write_compressed(self, info, parts, crc):
+        zip64 = info.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        fp = self._zip.fp
+        if self._stream is None:
+            fp.seek(self._zip.start_dir)
+        else:
+            info.flag_bits |= _DATA_DESCRIPTOR
+        info.header_offset = fp.tell()
+        info.CRC = info.compress_size = 0
+        fp.write(info.FileHeader(zip64))
+        compress_size = 0
+        for part in parts:
+            if isinstance(part, _Failure):
+                # The member is half written, the archive is lost.
+                raise part.error
+            if isinstance(part, concurrent.futures.Future):
+                part = part.result()
+            fp.write(part)
+            compress_size += len(part)
+        if not zip64 and max(crc.size, compress_size) > zipfile.ZIP64_LIMIT:
+            raise zipfile.LargeZipFile('%s grew too large while being compressed' % info.filename)
+        info.CRC, info.file_size, info.compress_size = crc.crc, crc.size, compress_size
+        if self._stream is None:
+            end = fp.tell()
+            fp.seek(info.header_offset)
+            fp.write(info.FileHeader(zip64))
+            fp.seek(end)
+        else:
+            fp.write(struct.pack('<4sLQQ' if zip64 else '<4sLLL', b'PK\x07\x08', info.CRC, info.compress_size,
+                                 info.file_size))
+        self._zip.start_dir = fp.tell()
+        self._zip.filelist.append(info)
+        self._zip.NameToInfo[info.filename] = info
+        metrics.counters.written(self._zip.start_dir - info.header_offset, files=1)
+
+    def _write_raw(self, info, chunks):
+        """Append a member whose CRC, sizes and compressed data are already
+        known, the data being given as an iterable of bytes chunks.
+        """
+        zip64 = info.file_size > zipfile.ZIP64_LIMIT or info.compress_size > zipfile.ZIP64_LIMIT
+        fp = self._zip.fp
+        if self._stream is None:
+            fp.seek(self._zip.start_dir)
+        info.header_offset = fp.tell()
+        fp.write(info.FileHeader(zip64))
+        for chunk in chunks:
+            fp.write(chunk)
+        self._zip.start_dir = fp.tell()
+        self._zip.filelist.append(info)
+        self._zip.NameToInfo[info.filename] = info
+        metrics.counters.written(self._zip.start_dir - info.header_offset, files=1)
+
+    def __finish(self):
+        """Wait for the writer thread and release all resources."""
+        if self._writer is not None:
+            self._jobs.put(None)
+            self._writer.join()
+            self._writer = None
+            if self._executor is not None:
+                self._executor.shutdown()
+            if self._io is not None:
+                self._io.shutdown()
+        if self._previous is not None:
+            self._previous_zip.close()
+            self._previous = None
+        if self._stream is not None and self._error is not None:
+            # A failed zip being streamed is left without its central
+            # directory, so that it can't be taken for a complete package.
+            self._output.discard = True
+        self._zip.close()
+        self._zip = None
+
+    def close(self):
+        if self._zip is None:
+            return
+        self.__finish()
+        if self._stream is not None:
+            self._stream.flush()
+            if self._error is not None:
+                raise self._error
+            return
+        if self._error is not None:
+            os.remove(self._tmp_path)
+            raise self._error
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        if self._zip is None:
+            return
+        if self._error is None:
+            # Stop the writer thread and the I/O threads early.
+            self._error = RuntimeError('%s aborted' % self.path)
+        self.__finish()
+        if self._tmp_path is not None:
+            os.remove(self._tmp_path)
+
+
+# General purpose bit flag of the members whose CRC and sizes follow
+# their data.
+_DATA_DESCRIPTOR = 0x08
+
+
+class _StreamOutput(object):
+    """Write-only file object over a stream which can't seek, counting
+    the bytes written for tell(). It has no seek(), so that zipfile
+    writes data descriptors too (for the directories).
+
+    Once discard is set, the data is counted but no longer written.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._offset = 0
+        self.discard = False
+
+    def write(self, data):
+        if not self.discard:
+            self._stream.write(data)
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        self._stream.flush()
+
+
+class SplitArchiveWriter(ArchiveWriter):
+    """Write a package as several archives, to keep each one under an
+    upload limit.
+
+    The secret test data is spread over the archives following plan, a
+    dict giving the index of the archive of each test by name (0 by
+    default). The problem configuration and the output validators are
+    written to every archive, so that each of them can be imported on
+    its own into the same problem, and everything else (samples,
+    submissions) to the first one.
+    """
+
+    SHARED = ('domjudge-problem.ini', 'problem.yaml')
+
+    def __init__(self, writers, plan):
+        self.writers = writers
+        self.plan = plan
+
+    def _targets(self, arcname):
+        if arcname.startswith('data/secret/'):
+            test = os.path.splitext(arcname.rsplit('/', 1)[1])[0]
+            return [self.writers[self.plan.get(test, 0)]]
+        if arcname in self.SHARED or arcname.startswith('output_validators/'):
+            return self.writers
+        return self.writers[:1]
+
+    def mkdir(self, arcname):
+        for writer in self.writers:
+            writer.mkdir(arcname)
+
+    def write_str(self, arcname, data):
+        for writer in self._targets(arcname):
+            writer.write_str(arcname, data)
+
+    def write_file(self, arcname, src, *scanners):
+        for i, writer in enumerate(self._targets(arcname)):
+            # Scan the file once.
+            writer.write_file(arcname, src, *(scanners if i == 0 else ()))
+
+    def write_files(self, files):
+        # Files written to several archives are only written this way to
+        # the first one: only use write_file() for them.
+        files = list(files)
+        results = [None] * len(files)
+        batches = {}
+        for i, (arcname, src, scanners) in enumerate(files):
+            writer = self._targets(arcname)[0]
+            batches.setdefault(id(writer), (writer, []))[1].append(i)
+        for writer, indexes in batches.values():
+            for i, future in zip(indexes, writer.write_files([files[i] for i in indexes])):
+                results[i] = future
+        return results
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+    def abort(self):
+        for writer in self.writers:
+            writer.abort()
+
+
+def _link_file(fsrc, src, dst):
+    """Make dst a copy of the file src (opened as fsrc) without copying
+    its content through user space: as a hard link if possible,
+    otherwise as a reflink, otherwise with copy_file_range().
+    Returns:
+        the number of bytes copied (0 for links), or None if dst was not
+        created and must be copied normally.
+    """
+    try:
+        os.link(src, dst)
+        return 0
+    except OSError:
+        pass
+    with open(dst, 'wb') as fdst:
+        if fcntl is not None and sys.platform.startswith('linux'):
+            try:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                return 0
+            except OSError:
+                pass
+        copy_file_range = getattr(os, 'copy_file_range', None)
+        if copy_file_range is not None:
+            offset = 0
+            try:
+                while True:
+                    copied = copy_file_range(fsrc.fileno(), fdst.fileno(), scan.CHUNK_SIZE << 3, offset, offset)
+                    if copied == 0:
+                        return offset
+                    offset += copied
+            except OSError:
+                pass
+    return None
+
+
+class DirectoryArchiveWriter(ArchiveWriter):
+    """Write the package as a plain directory tree.
+
+    With io_threads > 1, the files given to write_files() are copied on
+    a pool of io_threads threads.
+
+    With link, files are not copied but hard linked into the tree when
+    possible (or reflinked, or copied in the kernel, see _link_file()),
+    so beware that modifying a file of the tree may modify its source.
+    """
+
+    def __init__(self, root, manifest=None, io_threads=1, link=False):
+        self.root = root
+        self.manifest = manifest
+        self.io_threads = io_threads
+        self.link = link
+
+    def _path(self, arcname):
+        return os.path.join(self.root, *arcname.split('/'))
+
+    def mkdir(self, arcname):
+        os.makedirs(self._path(arcname), exist_ok=True)
+
+    def __mkparent(self, arcname):
+        os.makedirs(os.path.dirname(self._path(arcname)), exist_ok=True)
+
+    def write_str(self, arcname, data):
+        self.__mkparent(arcname)
+        data = data.encode('utf-8')
+        with open(self._path(arcname), 'wb') as f:
+            f.write(data)
+        metrics.counters.written(len(data), files=1)
+
+    def write_file(self, arcname, src, *scanners):
+        self.__mkparent(arcname)
+        dst = self._path(arcname)
+        scanners = self._scanners(arcname, src, scanners)
+        with package.open_source(src) as fsrc:
+            # Never write through an existing file, it may be a link.
+            try:
+                os.remove(dst)
+            except FileNotFoundError:
+                pass
+            copied = _link_file(fsrc, src, dst) if self.link and not isinstance(src, package.Member) else None
+            if copied is not None:
+                scan.scan_stream(fsrc, *scanners)
+                metrics.counters.written(copied, files=1)
+                return
+            with open(dst, 'wb') as fdst:
+                scan.copy_stream(fsrc, fdst, *scanners)
+                metrics.counters.written(fdst.tell(), files=1)
+
+    def write_files(self, files):
+        if self.io_threads <= 1:
+            return super().write_files(files)
+        files = list(files)
+        for arcname, _, _ in files:
+            self.__mkparent(arcname)
+        with concurrent.futures.ThreadPoolExecutor(self.io_threads) as pool:
+            return [pool.submit(self.write_file, arcname, src, *scanners) for arcname, src, scanners in files]
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class StagingArchiveWriter(DirectoryArchiveWriter):
+    """Stage the package in a directory and zip it when closed.
+
+    This is the old way of building packages, kept for debugging: the
+    staging directory is left in place so it can be inspected.
+    """
+
+    def __init__(self, root, path, manifest=None, io_threads=1):
+        super().__init__(root, manifest, io_threads, link=True)
+        self.path = path
+
+    def close(self):
+        # Not shutil.make_archive(), which may chdir() to the root.
+        with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED) as z:
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                dirnames.sort()
+                for name in dirnames + sorted(filenames):
+                    path = os.path.join(dirpath, name)
+                    z.write(path, os.path.relpath(path, self.root))
+
+
+class UnpackedArchiveWriter(DirectoryArchiveWriter):
+    """Write the package as a directory tree at path, e.g. to rsync it to
+    the DOMjudge host.
+
+    Like with ZipArchiveWriter, the tree is built under a temporary name
+    next to path and only replaces path when closed. Files are linked
+    (see DirectoryArchiveWriter) unless link is False.
+    """
+
+    def __init__(self, path, manifest=None, io_threads=1, link=True):
+        self.path = path
+        root = os.path.join(os.path.dirname(os.path.abspath(path)),
+                            '.%s.%s.tmp' % (os.path.basename(path), uuid.uuid4().hex[:8]))
+        os.mkdir(root)
+        super().__init__(root, manifest, io_threads, link)
+        self._closed = False
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if os.path.isdir(self.path):
+            old = '%s.old' % self.root
+            os.rename(self.path, old)
+            os.rename(self.root, self.path)
+            shutil.rmtree(old)
+        else:
+            os.replace(self.root, self.path)
+
+    def abort(self):
+        if self._closed:
+            return
+        self._closed = True
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,65 @@
+import json
+import os
+import threading
+
+from ._version import __version__
+
+
+def cache_dir():
+    """
+    Directory of the persistent p2d caches: $P2D_CACHE_DIR if defined
+    (caching is disabled if it is empty), otherwise polygon2domjudge in
+    $XDG_CACHE_HOME (~/.cache by default).
+    """
+    if 'P2D_CACHE_DIR' in os.environ:
+        return os.environ['P2D_CACHE_DIR']
+    return os.path.join(os.environ.get('XDG_CACHE_HOME',
+                                       os.path.join(os.path.expanduser('~'), '.cache')),
+                        'polygon2domjudge')
+
+
+def load(name):
+    """Load the cache entry name.
+    Returns:
+        the cached object, or None if there is no valid entry.
+    """
+    if not cache_dir():
+        return None
+    try:
+        with open(os.path.join(cache_dir(), name), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data['version'] != __version__:
+            return None
+        return data['value']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save(name, value):
+    """Save value (a JSON serializable object) as the cache entry name.
+
+    Caches are an optimization only, so failing to write one is not an
+    error.
+    """
+    if not cache_dir():
+        return
+    path = os.path.join(cache_dir(), name)
+    tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': __version__, 'value': value}, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def stat_key(path):
+    """Return what identifies the content of the file at path for caches:
+    its size and mtime, or None if there is no such file.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
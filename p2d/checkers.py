@@ -1,7 +1,11 @@
 import hashlib
+import os
 import re
 
+from . import cache
 from . import config
+from . import package
+from . import scan
 
 
 class CheckerConfigError(Exception):
@@ -114,18 +118,57 @@ class Checkers(object):
                                          (checker_name, self._md5sums[checker.md5sum], checker.md5sum))
             self._md5sums[checker.md5sum] = checker_name
 
+    __MD5_CACHE = 'checker-md5.json'
+    _md5_cache = None
+
+    @staticmethod
+    def _hash_source(source):
+        """md5 of a source file with its line breaks normalized to '\\n',
+        computed on bytes chunk by chunk, whatever the encoding.
+        """
+        file_md5 = hashlib.md5()
+        carry = b''
+        with package.open_source(source) as f:
+            for chunk in scan.iter_chunks(f):
+                chunk = carry + chunk
+                # A '\r' at the end of a chunk may start a '\r\n' split
+                # across chunks, keep it for the next one.
+                carry = b'\r' if chunk.endswith(b'\r') else b''
+                if carry:
+                    chunk = chunk[:-1]
+                file_md5.update(chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n'))
+        if carry:
+            file_md5.update(b'\n')
+        return file_md5.hexdigest().lower()
+
     @staticmethod
     def _get_md5(source):
+        """md5 of a checker source, memoized by (path, size, mtime) in a
+        persistent cache (see p2d.cache) unless it is a member of an
+        archive package.
+        """
         if source is None:
             return None
-        with open(source, 'r', encoding='utf-8') as f:
-            file_md5 = hashlib.md5(f.read().replace('\r\n', '\n').encode('utf-8'))
-        return file_md5.hexdigest().lower()
+        if isinstance(source, package.Member):
+            return Checkers._hash_source(source)
+        path = os.path.realpath(source)
+        key = cache.stat_key(path)
+        if Checkers._md5_cache is None:
+            Checkers._md5_cache = cache.load(Checkers.__MD5_CACHE) or {}
+        cached = Checkers._md5_cache.get(path)
+        if cached is not None and key is not None and cached[:2] == key:
+            return cached[2]
+        md5 = Checkers._hash_source(source)
+        if key is not None:
+            Checkers._md5_cache = cache.load(Checkers.__MD5_CACHE) or {}
+            Checkers._md5_cache[path] = key + [md5]
+            cache.save(Checkers.__MD5_CACHE, Checkers._md5_cache)
+        return md5
 
     def detect_checker(self, source):
         """Get the checker name for the given source.
         Args:
-            source (byte): path of the source file.
+            source (str or p2d.package.Member): the source file.
         Returns:
             checker name of the source, or None if don't know.
         """
@@ -0,0 +1,146 @@
+"""Compile checks of the custom checkers and interactors, with --compile.
+
+DOMjudge compiles the output validators on the judgehosts, so a broken
+one would only show up during the contest. The source is compiled with
+testlib.h next to it in the background, while the rest of the problem
+is converted (see CompileCheck).
+
+Outcomes are cached persistently (see p2d.cache) by the hash of the
+source, testlib.h, the compiler and its flags: unchanged validators are
+not compiled again.
+"""
+import hashlib
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from . import cache
+from . import package
+
+COMPILE_CACHE = 'compile.json'
+# Outcomes kept in the cache, the oldest ones are dropped first.
+CACHE_SIZE = 256
+# Bytes of compiler output kept for the messages.
+MAX_OUTPUT = 4096
+
+__versions = {}
+__versions_lock = threading.Lock()
+
+
+def compiler_version(compiler):
+    """Return the first line of `compiler --version`, or None if compiler
+    can't be run.
+    """
+    with __versions_lock:
+        if compiler not in __versions:
+            try:
+                output = subprocess.run([compiler, '--version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                        timeout=30).stdout
+                __versions[compiler] = output.decode('utf-8', 'replace').partition('\n')[0]
+            except (OSError, subprocess.SubprocessError):
+                __versions[compiler] = None
+        return __versions[compiler]
+
+
+def compile_key(source, testlib, command):
+    """Key of a compilation in the cache.
+
+    Args:
+        source (bytes): the validator source.
+        testlib (bytes): testlib.h.
+        command (list): the compiler, its version and its flags.
+    """
+    key = hashlib.sha256()
+    for part in [source, testlib] + [_.encode('utf-8') for _ in command]:
+        key.update(b'%d:' % len(part))
+        key.update(part)
+    return key.hexdigest()
+
+
+class CompileCheck(object):
+    """Compilation of a validator, started in the background on creation.
+
+    Args:
+        source (str or p2d.package.Member): the validator source.
+        testlib (str): path of testlib.h.
+        compiler (str): the compiler, e.g. 'g++'.
+        flags (str): the flags of the compiler, split as by a shell.
+        timeout (float): seconds the compilation may take.
+    """
+
+    def __init__(self, source, testlib, compiler, flags, timeout=120):
+        with package.open_source(source) as f:
+            self._source = f.read()
+        with open(testlib, 'rb') as f:
+            self._testlib = f.read()
+        self._command = [compiler] + shlex.split(flags)
+        self._timeout = timeout
+        self._tmpdir = None
+        self._process = None
+        self.cached = False
+        self._result = None
+
+        version = compiler_version(compiler)
+        if version is None:
+            self._result = (False, 'compiler %s not found' % compiler)
+            return
+        self.key = compile_key(self._source, self._testlib, [version] + self._command)
+        cached = (cache.load(COMPILE_CACHE) or {}).get(self.key)
+        if cached is not None:
+            self.cached = True
+            self._result = tuple(cached)
+            return
+
+        self._tmpdir = tempfile.mkdtemp(prefix='p2d-compile')
+        with open(os.path.join(self._tmpdir, 'testlib.h'), 'wb') as f:
+            f.write(self._testlib)
+        with open(os.path.join(self._tmpdir, 'validator.cpp'), 'wb') as f:
+            f.write(self._source)
+        try:
+            self._process = subprocess.Popen(self._command + ['validator.cpp', '-o', 'validator'], cwd=self._tmpdir,
+                                             stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                             stderr=subprocess.STDOUT)
+        except OSError as err:
+            self._result = (False, 'cannot run %s: %s' % (compiler, err))
+            self.close()
+
+    def wait(self):
+        """Wait for the compilation to finish.
+        Returns:
+            (ok, output): whether it succeeded, and the output of the
+            compiler (truncated).
+        """
+        if self._result is not None:
+            return self._result
+        try:
+            output, _ = self._process.communicate(timeout=self._timeout)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.communicate()
+            self._result = (False, 'compilation took more than %d seconds' % self._timeout)
+        else:
+            output = output.decode('utf-8', 'replace')
+            if len(output) > MAX_OUTPUT:
+                output = output[:MAX_OUTPUT] + '\n...'
+            self._result = (self._process.returncode == 0, output)
+            entries = cache.load(COMPILE_CACHE) or {}
+            entries.pop(self.key, None)
+            entries[self.key] = list(self._result)
+            while len(entries) > CACHE_SIZE:
+                del entries[next(iter(entries))]
+            cache.save(COMPILE_CACHE, entries)
+        finally:
+            self.close()
+        return self._result
+
+    def close(self):
+        """Stop the compilation if it still runs, and clean up."""
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.communicate()
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
@@ -1,7 +1,19 @@
-import collections
+import collections.abc
+import hashlib
+import json
 import os
 import yaml
 
+from . import cache
+
+# Use the libyaml based loader when available, it is much faster.
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+CONFIG_CACHE = 'config.json'
+# Merged configurations kept in the cache, the oldest ones are dropped
+# first.
+CACHE_SIZE = 64
+
 
 class ConfigError(Exception):
     pass
@@ -14,18 +26,48 @@ def load_config(configuration_file, *args):
         configuration_file (str): name of configuration file.  Name is
         relative to config directory so typically just a file name
         without paths, e.g. "checkers.yaml".
+
+    The merged configuration is cached on disk (see p2d.cache) by the
+    paths of all the files it is merged from, and is valid as long as
+    their sizes and mtimes are unchanged.
     """
 
+    paths = [os.path.abspath(os.path.join(dirname, configuration_file))
+             for dirname in __config_file_paths(*args)]
+    key = [[path, cache.stat_key(path)] for path in paths]
+    name = hashlib.sha256(json.dumps(paths).encode('utf-8')).hexdigest()[:16]
+    entries = cache.load(CONFIG_CACHE)
+    if not isinstance(entries, dict):
+        entries = {}
+    cached = entries.get(name)
+    if isinstance(cached, dict) and cached.get('key') == key:
+        return cached['config']
+
+    res = __merge_config(configuration_file, paths)
+
+    try:
+        if json.loads(json.dumps(res)) == res:
+            entries.pop(name, None)
+            entries[name] = {'key': key, 'config': res}
+            while len(entries) > CACHE_SIZE:
+                del entries[next(iter(entries))]
+            cache.save(CONFIG_CACHE, entries)
+    except (TypeError, ValueError):
+        pass  # not representable in JSON, just don't cache it
+
+    return res
+
+
+def __merge_config(configuration_file, paths):
     res = None
 
-    for dirname in __config_file_paths(*args):
-        path = os.path.join(dirname, configuration_file)
+    for path in paths:
         new_config = None
         if os.path.isfile(path):
             try:
                 with open(path, 'r', encoding='utf-8') as config:
-                    new_config = yaml.safe_load(config.read())
-            except (yaml.parser.ParserError, yaml.parser.ScannerError) as err:
+                    new_config = yaml.load(config.read(), Loader=YamlLoader)
+            except yaml.YAMLError as err:
                 raise ConfigError('Config file %s: failed to parse: %s' % (path, err))
         if res is None:
             if new_config is None:
@@ -61,8 +103,8 @@ def __update_dict(orig, update):
     """
     for (key, value) in update.items():
         if (key in orig and
-            isinstance(value, collections.Mapping) and
-                isinstance(orig[key], collections.Mapping)):
+            isinstance(value, collections.abc.Mapping) and
+                isinstance(orig[key], collections.abc.Mapping)):
             __update_dict(orig[key], value)
         else:
             orig[key] = value
@@ -0,0 +1,351 @@
+"""Local judging of the jury solutions, with --verify.
+
+The solutions are compiled and run on all the tests on a pool of
+threads, each driving one process at a time, and their verdicts are
+compared to the results their Polygon tags map to (see results.yaml).
+The CPU time of every run is measured, to suggest a DOMjudge time limit
+from the slowest solution expected to be accepted.
+
+Outputs are checked with the custom checker compiled with testlib.h, or
+with default_validate(), which compares tokens as the default output
+validator of DOMjudge does.
+
+Once a solution which is not expected to be accepted failed a test,
+its verdict is known: it is not run on the later tests not started yet.
+"""
+import concurrent.futures
+import math
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from . import package
+
+ACCEPTED = 'accepted'
+WRONG_ANSWER = 'wrong_answer'
+TIME_LIMIT = 'time_limit_exceed'
+RUN_ERROR = 'run_time_error'
+
+# Languages of the solutions by extension, see Judge.prepare().
+LANGUAGES = {'.cpp': 'cpp', '.cc': 'cpp', '.cxx': 'cpp', '.c': 'c', '.py': 'python'}
+C_COMMAND = ['gcc', '-x', 'c', '-std=gnu11', '-O2', '-pipe']
+
+
+class JudgeError(Exception):
+    """A solution or the checker can't be compiled or run."""
+    pass
+
+
+def _is_number(token):
+    try:
+        float(token)
+    except ValueError:
+        return False
+    return True
+
+
+def default_validate(output, answer, flags=None):
+    """Compare output to answer (bytes) as the default output validator of
+    DOMjudge: token by token, case insensitive unless case_sensitive,
+    whitespace insensitive unless space_change_sensitive, and numbers with
+    float_tolerance, float_relative_tolerance or float_absolute_tolerance.
+
+    Returns:
+        whether the output is accepted.
+    """
+    args = (flags or '').split()
+    case_sensitive = 'case_sensitive' in args
+    space_sensitive = 'space_change_sensitive' in args
+    relative, absolute = None, None
+    for i, arg in enumerate(args[:-1]):
+        if arg in ('float_tolerance', 'float_relative_tolerance'):
+            relative = float(args[i + 1])
+        if arg in ('float_tolerance', 'float_absolute_tolerance'):
+            absolute = float(args[i + 1])
+
+    if space_sensitive:
+        output_tokens, answer_tokens = re.split(rb'(\s+)', output.strip()), re.split(rb'(\s+)', answer.strip())
+    else:
+        output_tokens, answer_tokens = output.split(), answer.split()
+    if len(output_tokens) != len(answer_tokens):
+        return False
+    for out, ans in zip(output_tokens, answer_tokens):
+        if out == ans or (not case_sensitive and out.lower() == ans.lower()):
+            continue
+        if (relative is None and absolute is None) or not _is_number(ans) or not _is_number(out):
+            return False
+        out, ans = float(out), float(ans)
+        if not ((absolute is not None and abs(out - ans) <= absolute) or
+                (relative is not None and abs(out - ans) <= relative * abs(ans))):
+            return False
+    return True
+
+
+def _limit_memory(command, memory_limit):
+    """Return command run with its address space limited to memory_limit
+    bytes, through a shell which sets the limit and execs it: preexec_fn
+    could deadlock the child, as other threads run.
+    """
+    if memory_limit is None or os.name != 'posix':
+        return command
+    return ['/bin/sh', '-c', 'ulimit -v %d && exec "$@"' % (memory_limit // 1024), 'sh'] + command
+
+
+def _exit_code(status):
+    """Decode a wait status like Popen.returncode."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def run_process(command, stdin_path, stdout_path, wall_limit, memory_limit=None, cwd=None):
+    """Run command with its input and output redirected to files, killing
+    it after wall_limit seconds.
+
+    Returns:
+        (exit code, CPU seconds, whether it was killed); the exit code is
+        negative if the process was killed by a signal.
+    """
+    killed = []
+
+    def kill():
+        killed.append(True)
+        process.kill()
+
+    start = time.perf_counter()
+    with open(stdin_path, 'rb') as fin, open(stdout_path, 'wb') as fout:
+        try:
+            process = subprocess.Popen(_limit_memory(command, memory_limit), stdin=fin, stdout=fout,
+                                       stderr=subprocess.DEVNULL, cwd=cwd)
+        except OSError as err:
+            raise JudgeError('cannot run %s: %s' % (command[0], err))
+    timer = threading.Timer(wall_limit, kill)
+    timer.start()
+    try:
+        if hasattr(os, 'wait4'):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = _exit_code(status)
+            seconds = usage.ru_utime + usage.ru_stime
+        else:
+            process.wait()
+            seconds = time.perf_counter() - start
+    finally:
+        timer.cancel()
+    return process.returncode, seconds, bool(killed)
+
+
+class Run(object):
+    """A run of a solution on a test."""
+
+    __slots__ = ('test', 'verdict', 'seconds')
+
+    def __init__(self, test, verdict, seconds):
+        self.test = test
+        self.verdict = verdict
+        self.seconds = seconds
+
+    def as_dict(self):
+        return {'test': self.test, 'verdict': self.verdict, 'seconds': round(self.seconds, 3)}
+
+
+class Solution(object):
+    """A jury solution, with its expected result and its runs once
+    judged.
+    """
+
+    def __init__(self, name, source, expected):
+        self.name = name
+        self.source = source
+        self.expected = expected
+        self.command = None
+        # Why the solution was not judged, if so.
+        self.skipped = None
+        self.runs = []
+
+    @property
+    def verdict(self):
+        """Verdict of the first test not accepted, in test order."""
+        for run in self.runs:
+            if run.verdict != ACCEPTED:
+                return run.verdict
+        return ACCEPTED
+
+    @property
+    def slowest(self):
+        """The run which took the most CPU time, or None."""
+        return max(self.runs, key=lambda run: run.seconds, default=None)
+
+    def as_dict(self):
+        return {'expected': self.expected, 'verdict': None if self.skipped else self.verdict,
+                'skipped': self.skipped, 'runs': [run.as_dict() for run in self.runs]}
+
+
+class Judge(object):
+    """Judge solutions of a problem in the directory workdir.
+
+    Args:
+        workdir (str): an empty directory, for the binaries and outputs.
+        tests (list): list of (test, input source, answer source) tuples,
+            the sources being paths or p2d.package.Members.
+        time_limit (float): time limit in seconds.
+        memory_limit (int): memory limit in bytes, or None.
+        threads (int): number of runs at the same time.
+        compiler (str): the C++ compiler, with compile_flags.
+    """
+
+    def __init__(self, workdir, tests, time_limit, memory_limit, threads, compiler, compile_flags):
+        self.workdir = workdir
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        # Runs are killed after this long, which leaves time to measure
+        # solutions somewhat slower than the time limit.
+        self.wall_limit = 2 * time_limit + 1
+        self.threads = threads
+        self.cpp_command = [compiler] + shlex.split(compile_flags)
+        self.tests = [(test, self._file(src, 'tests', test), self._file(ans, 'tests', test + '.a'))
+                      for test, src, ans in tests]
+        self.checker = None
+        self.validator_flags = None
+        # Index of the first test failed by each solution so far, by name.
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    def _file(self, src, *names):
+        """Path of the file src, written in workdir if it is a Member.
+        Raises:
+            JudgeError if the member can't be read.
+        """
+        if not isinstance(src, package.Member):
+            return src
+        path = os.path.join(self.workdir, *names)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with src.open() as fsrc, open(path, 'wb') as fdst:
+                shutil.copyfileobj(fsrc, fdst, 1 << 20)
+        except package.READ_ERRORS as err:
+            raise JudgeError('cannot read %s: %s' % (src.name, err))
+        return path
+
+    def _compile(self, command, src, name):
+        """Compile the source at src to workdir/bin/name.
+        Returns:
+            the path of the binary.
+        Raises:
+            JudgeError if it does not compile.
+        """
+        binary = os.path.join(self.workdir, 'bin', name)
+        os.makedirs(os.path.dirname(binary), exist_ok=True)
+        try:
+            result = subprocess.run(command + [src, '-o', binary], cwd=os.path.dirname(src),
+                                    stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    timeout=120)
+        except (OSError, subprocess.SubprocessError) as err:
+            raise JudgeError('cannot compile %s: %s' % (name, err))
+        if result.returncode != 0:
+            raise JudgeError('%s does not compile:\n%s' % (name, result.stdout.decode('utf-8', 'replace')[:4096]))
+        return binary
+
+    def set_checker(self, source, testlib):
+        """Check the outputs with a testlib checker instead of
+        default_validate().
+        """
+        checkerdir = os.path.join(self.workdir, 'checker')
+        os.makedirs(checkerdir)
+        shutil.copyfile(testlib, os.path.join(checkerdir, 'testlib.h'))
+        src = os.path.join(checkerdir, 'checker.cpp')
+        with package.open_source(source) as fsrc, open(src, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst)
+        self.checker = self._compile(self.cpp_command, src, 'checker')
+
+    def prepare(self, solution):
+        """Compile solution, or mark it as skipped if its language is not
+        supported or it can't be read or compiled.
+        """
+        language = LANGUAGES.get(os.path.splitext(solution.name)[1].lower())
+        if language is None:
+            solution.skipped = 'language not supported'
+            return
+        try:
+            src = self._file(solution.source, 'solutions', solution.name)
+            if language == 'python':
+                solution.command = [sys.executable, os.path.abspath(src)]
+                return
+            solution.command = [self._compile(self.cpp_command if language == 'cpp' else C_COMMAND,
+                                              os.path.abspath(src), 'solution-%s' % solution.name)]
+        except JudgeError as err:
+            solution.skipped = str(err)
+
+    def _check(self, test_input, output, answer):
+        if self.checker is None:
+            with open(output, 'rb') as fout, open(answer, 'rb') as fans:
+                return default_validate(fout.read(), fans.read(), self.validator_flags)
+        try:
+            result = subprocess.run([self.checker, test_input, output, answer], stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                    timeout=self.wall_limit * 10)
+        except (OSError, subprocess.SubprocessError) as err:
+            raise JudgeError('the checker failed on %s: %s' % (output, err))
+        if result.returncode not in (0, 1, 2):
+            raise JudgeError('the checker failed (exit code %d) on %s' % (result.returncode, output))
+        return result.returncode == 0
+
+    def _run(self, solution, index):
+        # Once a solution which is not expected to pass failed a test, its
+        # verdict is known.
+        with self._lock:
+            if solution.expected != ACCEPTED and self._failed.get(solution.name, index) < index:
+                return None
+        test, test_input, answer = self.tests[index]
+        output = os.path.join(self.workdir, 'out', '%s.%s' % (solution.name, test))
+        code, seconds, killed = run_process(solution.command, test_input, output, self.wall_limit,
+                                            self.memory_limit)
+        if killed or seconds > self.time_limit:
+            verdict = TIME_LIMIT
+        elif code != 0:
+            verdict = RUN_ERROR
+        else:
+            verdict = ACCEPTED if self._check(test_input, output, answer) else WRONG_ANSWER
+        os.remove(output)
+        if verdict != ACCEPTED:
+            with self._lock:
+                self._failed[solution.name] = min(index, self._failed.get(solution.name, index))
+        return Run(test, verdict, seconds)
+
+    def judge(self, solutions):
+        """Compile and run the solutions on all the tests, in parallel.
+        Raises:
+            JudgeError if the checker fails.
+        """
+        os.makedirs(os.path.join(self.workdir, 'out'), exist_ok=True)
+        with concurrent.futures.ThreadPoolExecutor(self.threads) as pool:
+            list(pool.map(self.prepare, solutions))
+            runs = [(solution, pool.submit(self._run, solution, index))
+                    for index in range(len(self.tests)) for solution in solutions if solution.skipped is None]
+            for solution, future in runs:
+                run = future.result()
+                if run is not None:
+                    solution.runs.append(run)
+
+
+def suggest_timelimit(solutions, factor):
+    """Suggest a time limit: the CPU time of the slowest run of the
+    solutions expected to be accepted, multiplied by factor and rounded up
+    to a tenth of a second. Those which are only too slow count, as the
+    time limit may well be too tight for this machine.
+
+    Returns:
+        (time limit in seconds, slowest solution, slowest run), or None
+        if no accepted solution was judged.
+    """
+    slowest = [(solution.slowest, solution) for solution in solutions
+               if solution.expected == ACCEPTED and solution.slowest is not None and
+               solution.verdict in (ACCEPTED, TIME_LIMIT)]
+    if not slowest:
+        return None
+    run, solution = max(slowest, key=lambda _: _[0].seconds)
+    return max(0.1, math.ceil(run.seconds * factor * 10) / 10), solution, run
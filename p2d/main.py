@@ -1,18 +1,31 @@
+import contextlib
+import io
+import json
 import logging
+import multiprocessing
 import os
 import re
 import shutil
 import sys
 import tempfile
-import xml.etree.ElementTree
-from argparse import ArgumentParser
+import time
+from argparse import ArgumentParser, ArgumentTypeError
 
 import yaml
 
+from . import archive
 from . import checkers
+from . import compiler
+from . import judge
+from . import manifest
+from . import metrics
 from . import misc
+from . import package
+from . import polygon
 from . import problems
 from . import results
+from . import scan
+from . import watch
 from ._version import __version__
 
 
@@ -21,24 +34,26 @@ class ProcessError(Exception):
 
 
 class ProblemAspect:
-    errors = 0
-    warnings = 0
+    consider_warnings_errors = False
     basename_regex = re.compile('^[a-zA-Z0-9][a-zA-Z0-9_.-]*[a-zA-Z0-9]$')
 
     def error(self, msg):
-        ProblemAspect.errors += 1
+        self._problem.errors += 1
+        self._problem.messages.append(('error', '%s: %s' % (self, msg)))
         logging.error('in %s: %s', self, msg)
         raise ProcessError(msg)
 
     def warning(self, msg):
-        if ProblemAspect.consider_warnings_errors:
+        if self._problem.werror:
             self.error(msg)
             return
-        ProblemAspect.warnings += 1
+        self._problem.warnings += 1
+        self._problem.messages.append(('warning', '%s: %s' % (self, msg)))
         logging.warning('in %s: %s', self, msg)
 
     def msg(self, msg):
-        print(msg)
+        if not self._problem.quiet:
+            print(msg)
 
     def info(self, msg):
         logging.info(': %s', msg)
@@ -62,18 +77,19 @@ class ProblemConfig(ProblemAspect):
     def __init__(self, problem):
         self.debug('Parse \'problem.xml\'')
         self._problem = problem
-        self.configfile = os.path.join(problem.probdir, 'problem.xml')
-        self._data = None
-        if os.path.isfile(self.configfile):
-            config = Problem.problem_config.problems.get(problem.shortname)
+        self.configfile = problem.package.source('problem.xml')
+        self.model = None
+        if problem.package.isfile('problem.xml'):
+            config = problem.problem_config.problems.get(problem.shortname)
             if config is None:
                 self.warning('Can not find config of %s, use default.' % problem.shortname)
                 config = ProblemConfig.__DEFAULT_CONFIG
-            self._data = xml.etree.ElementTree.parse(self.configfile)
-            self.name = self._data.find('names').find('name').attrib['value']
-            self.timelimit = str(float(self._data.find('judging').find('testset').find('time-limit').text) / 1000.0)
-            self.checker = self._data.find('assets').find('checker')
-            self.interactor = self._data.find('assets').find('interactor')
+            # Shared with the other problems converted from the same problem.xml.
+            self.model = polygon.load(self.configfile)
+            self.name = self.model.name
+            self.timelimit = str(float(self.model.testset.time_limit) / 1000.0)
+            self.checker = self.model.checker
+            self.interactor = self.model.interactor
             self.probid = config.probid
             self.color = config.color
             self.samples = config.samples
@@ -85,9 +101,20 @@ class ProblemConfig(ProblemAspect):
     def __str__(self):
         return 'problem configuration'
 
+    def source_files(self):
+        return [self.configfile]
+
+    def digest(self):
+        return {
+            'probid': self.probid,
+            'color': self.color,
+            'samples': self.samples,
+            'validation': self.validation,
+            'validator_flags': self.validator_flags
+        }
+
     def process(self):
         self.info('Add \'domjudge-problem.ini\'')
-        ini_file = os.path.join(self._problem.tmpdir, 'domjudge-problem.ini')
         ini_content = [
             '  probid = %s' % self.probid,
             '  name = %s' % self.name.replace("'", "`"),
@@ -95,8 +122,7 @@ class ProblemConfig(ProblemAspect):
             '  color = %s' % self.color
         ]
         [*map(self.info, ini_content)]
-        with open(ini_file, 'w', encoding='utf-8') as f:
-            f.writelines(map(lambda s: s.strip() + '\n', ini_content))
+        self._problem.archive.write_str('domjudge-problem.ini', ''.join(map(lambda s: s.strip() + '\n', ini_content)))
 
 
 class ProblemStatement(ProblemAspect):
@@ -114,62 +140,101 @@ class OutputValidator(ProblemAspect):
             if problem.config.validation == 'default':
                 self._source = None
             elif problem.config.validation == 'custom' and problem.config.checker is not None:
-                self._source = os.path.join(problem.probdir, problem.config.checker.find('source').attrib['path'])
+                self._source = problem.package.source(problem.config.checker.path)
             elif problem.config.validation == 'custom interactive' and problem.is_interactive:
-                self._source = os.path.join(problem.probdir, problem.config.interactor.find('source').attrib['path'])
+                self._source = problem.package.source(problem.config.interactor.path)
             else:
                 self.error('No checker/interactor found')
         else:
             if problem.is_interactive:
-                self._source = os.path.join(problem.probdir, problem.config.interactor.find('source').attrib['path'])
+                self._source = problem.package.source(problem.config.interactor.path)
             elif problem.config.checker is not None:
-                self._source = os.path.join(problem.probdir, problem.config.checker.find('source').attrib['path'])
+                self._source = problem.package.source(problem.config.checker.path)
             else:
                 self.error('No checker/interactor found')
+        # Compilation of the custom validator running in the background,
+        # with --compile.
+        self._compile = None
+        # How outputs are validated, set by process(): the source of the
+        # custom checker, or the flags of the default validator.
+        self.custom_checker = None
+        self.validator_flags = None
 
     def __str__(self):
         return 'output validators'
 
+    def source_files(self):
+        files = [self._problem.misc_config.testlib]
+        if self._source is not None:
+            files.append(self._source)
+        return files
+
     def process(self):
         self.info('Add output validator')
-        if not self._source.endswith('.cpp'):
+        if self._source is not None and not str(self._source).endswith('.cpp'):
             self.error('only support checker/interactor written with testlib.')
-        testlib = Problem.misc_config.testlib
+        testlib = self._problem.misc_config.testlib
+        writer = self._problem.archive
         data = {}
-        with open(os.path.join(self._problem.tmpdir, 'problem.yaml'), 'w', encoding='utf-8') as yaml_file:
-            if self._problem.is_interactive:
-                self.info('Use custom interactor')
-                data['validation'] = 'custom interactive'
-                yaml.safe_dump(data, yaml_file)
-                self._problem.ensure_dir('output_validators', 'interactor')
-                shutil.copyfile(testlib, os.path.join(self._problem.tmpdir,
-                                                      'output_validator', 'interactor', 'testlib.h'))
-                shutil.copyfile(self._source, os.path.join(self._problem.tmpdir,
-                                                           'output_validator', 'interactor', 'interactor.cpp'))
+        if self._problem.is_interactive:
+            self.info('Use custom interactor')
+            data['validation'] = 'custom interactive'
+            writer.write_str('problem.yaml', yaml.safe_dump(data))
+            writer.mkdir('output_validators/interactor')
+            writer.write_file('output_validators/interactor/testlib.h', testlib)
+            writer.write_file('output_validators/interactor/interactor.cpp', self._source)
+            self.__start_compile()
+        else:
+            checker_name = self._problem.checker_config.detect_checker(self._source)
+            if self._source is None:
+                self.info('  Use default checker')
+                data['validation'] = 'default'
+                if self._problem.config.validator_flags is not None:
+                    data['validator_flags'] = self.validator_flags = self._problem.config.validator_flags
+                writer.write_str('problem.yaml', yaml.safe_dump(data, default_flow_style=False))
+            elif checker_name is not None:
+                self.info('  find std checker: std::%s' % checker_name)
+                data['validation'] = 'default'
+                validator_flags = self._problem.checker_config.checkers[checker_name].validator_flags
+                if validator_flags is not None:
+                    data['validator_flags'] = self.validator_flags = validator_flags
+                writer.write_str('problem.yaml', yaml.safe_dump(data, default_flow_style=False))
             else:
-                checker_name = Problem.checker_config.detect_checker(self._source)
-                if self._source is None:
-                    self.info('  Use default checker')
-                    data['validation'] = 'default'
-                    if self._problem.config.validator_flags is not None:
-                        data['validator_flags'] = self._problem.config.validator_flags
-                    yaml.safe_dump(data, yaml_file, default_flow_style=False)
-                elif checker_name is not None:
-                    self.info('  find std checker: std::%s' % checker_name)
-                    data['validation'] = 'default'
-                    validator_flags = Problem.checker_config.checkers[checker_name].validator_flags
-                    if validator_flags is not None:
-                        data['validator_flags'] = validator_flags
-                    yaml.safe_dump(data, yaml_file, default_flow_style=False)
-                else:
-                    self.info('Use custom checker')
-                    data['validation'] = 'custom'
-                    yaml.safe_dump(data, yaml_file, default_flow_style=False)
-                    self._problem.ensure_dir('output_validators', 'checker')
-                    shutil.copyfile(testlib, os.path.join(self._problem.tmpdir,
-                                                          'output_validator', 'checker', 'testlib.h'))
-                    shutil.copyfile(self._source, os.path.join(self._problem.tmpdir,
-                                                               'output_validator', 'checker', 'interactor.cpp'))
+                self.info('Use custom checker')
+                data['validation'] = 'custom'
+                self.custom_checker = self._source
+                writer.write_str('problem.yaml', yaml.safe_dump(data, default_flow_style=False))
+                writer.mkdir('output_validators/checker')
+                writer.write_file('output_validators/checker/testlib.h', testlib)
+                writer.write_file('output_validators/checker/interactor.cpp', self._source)
+                self.__start_compile()
+
+    def __start_compile(self):
+        if self._problem.compile:
+            misc_config = self._problem.misc_config
+            self._compile = compiler.CompileCheck(self._source, misc_config.testlib, misc_config.compiler,
+                                                  misc_config.compile_flags)
+
+    def check_compile(self):
+        """Wait for the compilation of the custom validator started by
+        process() with --compile, if any, and report its errors.
+        """
+        if self._compile is None:
+            return
+        check, self._compile = self._compile, None
+        ok, output = check.wait()
+        name = 'interactor' if self._problem.is_interactive else 'checker'
+        if check.cached:
+            self.info('  %s compilation cached' % name)
+        if not ok:
+            self.error('the %s does not compile:\n%s' % (name, output.rstrip()))
+        if output.strip():
+            self.debug(output.rstrip())
+
+    def close(self):
+        if self._compile is not None:
+            self._compile.close()
+            self._compile = None
 
 
 class TestCases(ProblemAspect):
@@ -179,128 +244,555 @@ class TestCases(ProblemAspect):
         if problem.config.samples >= 100:
             self.error('Too many samples')
         self._samples = ['{0:02d}'.format(i + 1) for i in range(problem.config.samples)]
-        self._tests = os.path.join(problem.probdir, 'tests')
+        self._package = problem.package
+        # Statistics of the files (see scan.LintScanner.stats()) by member name, with --lint.
+        self.index = {}
 
     def __str__(self):
         return 'test cases'
 
-    def _check_newlines(self, filename):
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = f.read()
-        if data.find('\r') != -1:
+    def source_files(self):
+        return [self._package.source('tests/' + _) for _ in sorted(self._package.listdir('tests'))]
+
+    def _check_newlines(self, filename, scanner):
+        if scanner.has_cr:
             self.warning('The file %s contains non-standard line breaks.' % filename)
-        if len(data) > 0 and data[-1] != '\n':
+        if not scanner.ends_with_newline:
             self.warning("The file %s does not end with '\\n'." % filename)
 
+    def _lint(self, filename, arcname, scanner):
+        stats = scanner.stats()
+        for issue in stats['issues']:
+            # Line breaks are checked by _check_newlines().
+            if issue not in ('cr', 'no_final_newline'):
+                self.warning('The file %s %s.' % (filename, scan.ISSUES[issue]))
+        self.index[arcname] = stats
+
+    @staticmethod
+    def __size(src):
+        try:
+            return src.size if isinstance(src, package.Member) else os.path.getsize(src)
+        except OSError:
+            return None
+
+    def _candidates(self, tests):
+        """Return the set of the tests sharing their input and answer
+        sizes with another test, the only ones which may be identical to
+        another: rarely more than a few of them.
+
+        Args:
+            tests: list of (test, kind, input source, answer source).
+        """
+        by_size = {}
+        for test, kind, input_src, output_src in tests:
+            sizes = (self.__size(input_src), self.__size(output_src))
+            if None not in sizes:
+                by_size.setdefault(sizes, []).append(test)
+        return {test for group in by_size.values() if len(group) > 1 for test in group}
+
+    def _duplicates(self, tests, candidates, hashes=None):
+        """Find the tests whose input and answer are both byte-identical.
+
+        Args:
+            tests: list of (test, kind, input source, answer source).
+            candidates: the tests which may be identical to another (see
+                _candidates()), the only ones compared.
+            hashes: {test: (input hash, answer hash)} of the candidates if
+                they were hashed already, e.g. while they were copied.
+                Otherwise they are read and hashed here.
+        Returns:
+            the groups of identical tests (lists of (test, kind)) in the
+            order of tests.
+        """
+        groups = {}
+        for test, kind, input_src, output_src in tests:
+            if test in candidates:
+                key = hashes[test] if hashes is not None else (manifest.hash_file(input_src),
+                                                               manifest.hash_file(output_src))
+                groups.setdefault(key, []).append((test, kind))
+        return [_ for _ in groups.values() if len(_) > 1]
+
+    def _report_duplicates(self, groups):
+        for group in groups:
+            self.info('  identical tests: %s' % ', '.join('%s (%s)' % _ for _ in group))
+
+    def _dropped_duplicates(self, groups):
+        """Decide which duplicates to drop with --dedup: the secret copies
+        of a sample, and all but the first copy of a secret test.
+        Returns:
+            {dropped test: test it is the same as}.
+        """
+        dropped = {}
+        for group in groups:
+            samples = [test for test, kind in group if kind == 'sample']
+            kept = samples[0] if samples else group[0][0]
+            for test, kind in group:
+                if kind == 'secret' and test != kept:
+                    dropped[test] = kept
+        return dropped
+
+    def tests(self):
+        """Return the list of (test, kind, input source, answer source) of
+        the tests, in name order.
+        """
+        names = sorted(_ for _ in self._package.listdir('tests') if not _.endswith(self._problem.misc_config.out))
+        return [(test, 'sample' if test in self._samples else 'secret', self._package.source('tests/' + test),
+                 self._package.source('tests/' + test + self._problem.misc_config.out)) for test in names]
+
     def process(self):
         self.info('Add tests')
         self._problem.ensure_dir('data', 'sample')
         self._problem.ensure_dir('data', 'secret')
 
-        for test in filter(lambda x: not x.endswith(Problem.misc_config.out), os.listdir(self._tests)):
-            input_src = os.path.join(self._tests, test)
-            output_src = os.path.join(self._tests, test + Problem.misc_config.out)
-            self._check_newlines(input_src)
-            self._check_newlines(output_src)
-            if test in self._samples:
-                input_dst = os.path.join(self._problem.tmpdir, 'data', 'sample', '%s.in' % test)
-                output_dst = os.path.join(self._problem.tmpdir, 'data', 'sample', '%s.ans' % test)
-                self.info('  sample: %s.(in/ans)' % test)
-            else:
-                input_dst = os.path.join(self._problem.tmpdir, 'data', 'secret', '%s.in' % test)
-                output_dst = os.path.join(self._problem.tmpdir, 'data', 'secret', '%s.ans' % test)
-                self.info('  secret: %s.(in/ans)' % test)
+        sources = self.tests()
+        names = [_[0] for _ in sources]
+        candidates = self._candidates(sources)
+        dropped = {}
+        if self._problem.dedup:
+            # The duplicates must be known before copying the tests.
+            groups = self._duplicates(sources, candidates)
+            self._report_duplicates(groups)
+            dropped = self._dropped_duplicates(groups)
+            for test, same in sorted(dropped.items()):
+                self.info('  drop secret test %s, the same as %s' % (test, same))
+
+        tests = []
+        files = []
+        for test in names:
+            if test in dropped:
+                continue
+            kind = 'sample' if test in self._samples else 'secret'
+            test_files = []
+            for arcname, src in [('data/%s/%s.in' % (kind, test), self._package.source('tests/' + test)),
+                                 ('data/%s/%s.ans' % (kind, test),
+                                  self._package.source('tests/' + test + self._problem.misc_config.out))]:
+                scanners = (scan.LineEndingScanner(),)
+                if self._problem.lint:
+                    scanners += (scan.LintScanner(self._problem.misc_config.lint_max_line_length),)
+                if not self._problem.dedup and test in candidates:
+                    # Hashed as it is copied, to report the duplicates.
+                    scanners += (manifest.Hasher(),)
+                files.append((arcname, src, scanners))
+                test_files.append((arcname, src, scanners))
+            tests.append((test, kind, test_files))
+
+        # The files are copied concurrently, but checked and reported in order.
+        results = iter(self._problem.archive.write_files(files))
+        self.index = {}
+        for test, kind, test_files in tests:
+            self.info('  %s: %s.(in/ans)' % (kind, test))
             try:
-                shutil.copyfile(input_src, input_dst)
-                shutil.copyfile(output_src, output_dst)
+                next(results).result()
+                next(results).result()
             except FileNotFoundError:
                 self.error('data not found')
+            except package.READ_ERRORS as err:
+                self.error('cannot read test %s: %s' % (test, err))
+            for arcname, src, scanners in test_files:
+                self._check_newlines(src, scanners[0])
+                if self._problem.lint:
+                    self._lint(src, arcname, scanners[1])
+        if not self._problem.dedup:
+            hashes = {test: tuple(scanners[-1].hexdigest() for _, _, scanners in test_files)
+                      for test, _, test_files in tests if test in candidates}
+            self._report_duplicates(self._duplicates(sources, candidates, hashes))
 
 
 class Submissions(ProblemAspect):
 
     def __init__(self, problem):
         self._problem = problem
-        self._submissions = os.path.join(problem.probdir, 'solutions')
+        self._package = problem.package
+        self._submissions = None
 
     def __str__(self):
         return 'submissions'
 
+    def source_files(self):
+        return [self._package.source('solutions/' + _) for _ in sorted(self._package.listdir('solutions'))]
+
     def __get_submission(self, desc):
         result = {}
-        desc_file = os.path.join(self._submissions, desc)
-        with open(desc_file, 'r', encoding='utf-8') as f:
+        desc_file = 'solutions/' + desc
+        with io.TextIOWrapper(self._package.open(desc_file), encoding='utf-8') as f:
             for _ in f.readlines():
                 key, value = _.strip().split(': ', maxsplit=2)
                 if key == 'File name':
                     result[key] = value
                 elif key == 'Tag':
-                    if value not in Problem.result_config.tags.keys():
-                        self.warning('Unknown tag: %s, treat as \'accepted\'')
-                    result[key] = Problem.result_config.tags.get(value, 'accepted')
+                    if value not in self._problem.result_config.tags.keys():
+                        self.warning('Unknown tag: %s, treat as \'accepted\'' % value)
+                    result[key] = self._problem.result_config.tags.get(value, 'accepted')
         if not ('File name' in result.keys() or 'Tag' in result.keys()):
             self.error('The description file %s has error.' % os.path.basename(desc_file))
         return result['File name'], result['Tag']
 
+    def submissions(self):
+        """Return the list of (file name, expected result) of the jury
+        solutions, as described by their .desc files, parsed (and their
+        issues reported) once.
+        """
+        if self._submissions is None:
+            self._submissions = [self.__get_submission(desc) for desc in self._package.listdir('solutions')
+                                 if desc.endswith(self._problem.misc_config.desc)]
+        return self._submissions
+
     def process(self):
         self.info('Add jury solutions')
-        for result in Problem.result_config.results.keys():
+        for result in self._problem.result_config.results.keys():
             self._problem.ensure_dir('submissions', result)
 
-        for desc in filter(lambda x: x.endswith(Problem.misc_config.desc), os.listdir(self._submissions)):
-            submission, result = self.__get_submission(desc)
-            src = os.path.join(self._submissions, submission)
-            dst = os.path.join(self._problem.tmpdir, 'submissions', result, submission)
+        submissions = self.submissions()
+        results = self._problem.archive.write_files(
+            ('submissions/%s/%s' % (result, submission), self._package.source('solutions/' + submission), ())
+            for submission, result in submissions)
+        for (submission, result), future in zip(submissions, results):
             try:
-                shutil.copyfile(src, dst)
+                future.result()
                 self.info('  %s (Expected Result: %s)' % (submission, result))
             except FileNotFoundError:
                 self.error('submission not found')
+            except package.READ_ERRORS as err:
+                self.error('cannot read submission %s: %s' % (submission, err))
+
+
+class Verification(ProblemAspect):
+    """Judge the jury solutions locally with --verify, see p2d.judge."""
+
+    def __init__(self, problem):
+        self._problem = problem
+        # Outcome, written next to the package by Problem.save_verification().
+        self.report = None
+
+    def __str__(self):
+        return 'verification'
+
+    def process(self, threads):
+        problem = self._problem
+        if problem.is_interactive:
+            self.msg('  Interactive problems can not be verified locally')
+            return
+        self.info('Judge jury solutions')
+        misc_config = problem.misc_config
+        testset = problem.config.model.testset
+        time_limit = float(problem.config.timelimit)
+        solutions = [judge.Solution(name, problem.package.source('solutions/' + name), result)
+                     for name, result in problem.submissions.submissions()]
+        workdir = tempfile.mkdtemp(prefix='%s-verify' % problem.shortname)
+        try:
+            tests = [(test, src, answer) for test, _, src, answer in problem.testdata.tests()]
+            judger = judge.Judge(workdir, tests, time_limit, testset.memory_limit, threads, misc_config.compiler,
+                                 misc_config.compile_flags)
+            judger.validator_flags = problem.output_validator.validator_flags
+            if problem.output_validator.custom_checker is not None:
+                judger.set_checker(problem.output_validator.custom_checker, misc_config.testlib)
+            judger.judge(solutions)
+        except judge.JudgeError as err:
+            self.error(str(err))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        for solution in solutions:
+            if solution.skipped is not None:
+                self.warning('%s not judged: %s' % (solution.name, solution.skipped))
+            elif solution.verdict != solution.expected:
+                failed = [run for run in solution.runs if run.verdict != judge.ACCEPTED]
+                self.warning('%s is expected to be %s but is %s%s' %
+                             (solution.name, solution.expected, solution.verdict,
+                              ' on test %s' % failed[0].test if failed else ''))
+            else:
+                self.info('  %s: %s (%.2f s)' % (solution.name, solution.verdict, solution.slowest.seconds
+                                                 if solution.slowest else 0))
+
+        self.report = {'timelimit': time_limit, 'timelimit_factor': misc_config.timelimit_factor,
+                       'suggested_timelimit': None,
+                       'solutions': {solution.name: solution.as_dict() for solution in solutions}}
+        suggestion = judge.suggest_timelimit(solutions, misc_config.timelimit_factor)
+        if suggestion is not None:
+            timelimit, solution, run = suggestion
+            self.report['suggested_timelimit'] = timelimit
+            self.msg('  Suggested timelimit: %g s (%s takes %.2f s on test %s, timelimit is %g s)' %
+                     (timelimit, solution.name, run.seconds, run.test, time_limit))
+
+
+class LazyConfig:
+    """Class attribute holding a configuration loaded on first use, so
+    that importing p2d does not load any configuration.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def __set_name__(self, owner, name):
+        self._name = name
+
+    def __get__(self, obj, owner):
+        config = self._loader()
+        setattr(owner, self._name, config)
+        return config
 
 
 class Problem(ProblemAspect):
     problem_config = None
-    checker_config = checkers.load_checker_config()
-    result_config = results.load_result_config()
-    misc_config = misc.load_misc_config()
-
-    def __init__(self, probdir):
+    checker_config = LazyConfig(checkers.load_checker_config)
+    result_config = LazyConfig(results.load_result_config)
+    misc_config = LazyConfig(misc.load_misc_config)
+
+    def __init__(self, probdir, configs=None, werror=None, output=None, quiet=False, stream=None):
+        """Create a problem.
+
+        Args:
+            probdir (str): directory of the Polygon package, or its zip or
+                tar archive (see p2d.package).
+            configs (Configs): configurations to use instead of the ones
+                of the class (problem_config, checker_config, ...).
+            werror (bool): consider warnings as errors, defaults to
+                ProblemAspect.consider_warnings_errors.
+            output (str): path of the DOMjudge package, by default named
+                after the problem in the --output-dir given to run().
+            quiet (bool): do not print the progress of the conversion.
+            stream (binary file): write the zip to this stream (e.g.
+                sys.stdout.buffer) instead, and no other file: the
+                problem is always converted.
+        """
+        self._problem = self
         self.probdir = os.path.realpath(probdir)
-        self.shortname = os.path.basename(probdir)
+        self.shortname = package.problem_name(self.probdir)
+        self.errors = 0
+        self.warnings = 0
+        self.messages = []
+        self.werror = ProblemAspect.consider_warnings_errors if werror is None else werror
+        self.output = output
+        self.quiet = quiet
+        self.stream = stream
+        if stream is not None:
+            self.output = '-'
+        self.skipped = False
+        self.tmpdir = None
+        self.package = None
+        self.archive = None
+        self.metrics = metrics.Recorder()
+        if configs is not None:
+            self.problem_config = configs.problem_config
+            self.checker_config = configs.checker_config
+            self.result_config = configs.result_config
+            self.misc_config = configs.misc_config
         # self.check_basename(self.shortname)
 
     def __enter__(self):
-
-        ProblemAspect.errors = 0
-        ProblemAspect.warnings = 0
-
-        self.tmpdir = tempfile.mkdtemp(prefix='%s-domjudge' % self.shortname)
-        if not os.path.isdir(self.probdir):
-            self.error("Problem directory '%s' not found" % self.probdir)
+        if not os.path.exists(self.probdir):
+            try:
+                self.error("Problem directory '%s' not found" % self.probdir)
+            except ProcessError:
+                pass
             self.shortname = None
             return self
 
         try:
-            # self.statement = ProblemStatement(self)
-            self.config = ProblemConfig(self)
-            self.is_interactive = self.config.interactor is not None
-            self.output_validator = OutputValidator(self)
-            self.testdata = TestCases(self)
-            self.submissions = Submissions(self)
-        except Exception: # maybe the directory is not a valid problem package
+            with self.metrics.stage('load'):
+                self.package = package.open_package(self.probdir)
+                # self.statement = ProblemStatement(self)
+                self.config = ProblemConfig(self)
+                self.is_interactive = self.config.interactor is not None
+                self.output_validator = OutputValidator(self)
+                self.testdata = TestCases(self)
+                self.submissions = Submissions(self)
+                self.verification = Verification(self)
+        except Exception as err: # maybe the directory is not a valid problem package
+            if not isinstance(err, ProcessError):
+                self.messages.append(('error', 'invalid problem package: %s' % err))
             self.shortname = None
 
         return self
 
     def __exit__(self, exc_type, exc_value, exc_trace_back):
-        shutil.rmtree(self.tmpdir)
+        if self.archive is not None:
+            self.archive.abort()
+        if self.package is not None:
+            self.package.close()
 
     def __str__(self):
-        return self.shortname
+        return str(self.shortname)
 
     def ensure_dir(self, *paths):
-        if not os.path.exists(os.path.join(self.tmpdir, *paths)):
-            os.makedirs(os.path.join(self.tmpdir, *paths))
+        self.archive.mkdir('/'.join(paths))
+
+    def source_files(self):
+        """Files of the polygon package the DOMjudge package is built from."""
+        files = []
+        for aspect in [self.config, self.output_validator, self.testdata, self.submissions]:
+            files += aspect.source_files()
+        if self.package.is_archive:
+            # The members of the archive are fingerprinted with it.
+            files = [self.package.path] + [_ for _ in files if not isinstance(_, package.Member)]
+        return files
+
+    def config_digest(self):
+        """Digest of all the configuration the DOMjudge package depends on."""
+        return manifest.hash_config({
+            'problem': self.config.digest(),
+            'checkers': {name: [checker.md5sum, checker.validator_flags]
+                         for (name, checker) in self.checker_config.checkers.items()},
+            'results': {name: result.tags for (name, result) in self.result_config.results.items()},
+            'misc': [self.misc_config.testlib, self.misc_config.desc, self.misc_config.out],
+            'compression': [self.compression.level, self.compression.sample_size, self.compression.min_ratio],
+            'output_format': self.output_format,
+            'werror': self.werror,
+            'lint': [self.lint, self.misc_config.lint_max_line_length],
+            'dedup': self.dedup,
+            'max_archive_size': [self.max_archive_size, self.split],
+            'compile': [self.compile, self.misc_config.compiler, self.misc_config.compile_flags],
+            'verify': [self.verify, self.misc_config.timelimit_factor]
+        })
+
+    def __sidecar_path(self, kind):
+        """Path of a file written next to the package, e.g. its manifest."""
+        if self.output_format == 'dir':
+            return '%s.%s.json' % (self.output, kind)
+        return '%s.%s.json' % (os.path.splitext(self.output)[0], kind)
+
+    def manifest_path(self):
+        return self.__sidecar_path('manifest')
+
+    def index_path(self):
+        """Path of the statistics of the tests written with --lint."""
+        return self.__sidecar_path('tests')
+
+    def verification_path(self):
+        """Path of the outcome of the local judging with --verify."""
+        return self.__sidecar_path('verify')
+
+    def save_verification(self):
+        path = self.verification_path()
+        if self.verification.report is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(dict(self.verification.report, version=__version__), f, indent=1, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+    def save_index(self):
+        path = self.index_path()
+        if not self.lint:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'version': __version__, 'tests': self.testdata.index}, f, indent=1, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+    def part_path(self, part):
+        """Path of the archive part of a split package (see plan_archive()),
+        the first one being the package itself.
+        """
+        if part == 0:
+            return self.output
+        return '%s.data-%d.zip' % (os.path.splitext(self.output)[0], part)
+
+    def plan_archive(self):
+        """Estimate the size of the zip before building it, reporting its
+        largest tests, and check it against --max-archive-size.
+
+        Returns:
+            None if the zip fits, otherwise with --split the plan of the
+            split package: the part (see part_path()) of each secret
+            test, see archive.SplitArchiveWriter.
+        """
+        budget = self.max_archive_size
+        # (arcname, source, test, kind), the kind of the other files being
+        # where they go in a split package: the first archive or all.
+        files = []
+        for test, kind, input_src, output_src in self.testdata.tests():
+            files.append(('data/%s/%s.in' % (kind, test), input_src, test, kind))
+            files.append(('data/%s/%s.ans' % (kind, test), output_src, test, kind))
+        for aspect, kind in [(self.output_validator, 'shared'), (self.submissions, 'first')]:
+            files += [(os.path.basename(str(src)), src, None, kind) for src in aspect.source_files()]
+        files = [_ for _ in files if (_[1].size is not None if isinstance(_[1], package.Member) else
+                                      os.path.isfile(_[1]))]
+        estimates = archive.estimate_sizes([(arcname, src) for arcname, src, _, _ in files], self.compression)
+
+        tests = {}
+        # 1 KiB for the configuration and the end of the zip.
+        sizes = {'first': 1024, 'shared': 0, 'secret': 0}
+        for (_, _, test, kind), (size, estimate) in zip(files, estimates):
+            sizes['first' if kind == 'sample' else kind] += estimate
+            if test is not None:
+                total = tests.setdefault(test, [kind, 0, 0])
+                total[1] += size
+                total[2] += estimate
+        total = sum(sizes.values())
+        self.info('Estimated size of the archive: %s (budget: %s)' % (format_size(total), format_size(budget)))
+        largest = sorted(tests.items(), key=lambda item: -item[1][2])[:5]
+        for test, (kind, size, estimate) in largest:
+            self.info('  %s test %s: %s, about %s compressed' % (kind, test, format_size(size), format_size(estimate)))
+        if total <= budget:
+            return None
+        if not self.split:
+            self.error('The archive would take about %s, more than the %s allowed (see --split)' %
+                       (format_size(total), format_size(budget)))
+
+        if sizes['first'] + sizes['shared'] > budget:
+            self.error('The samples, submissions and validators alone would take about %s, more than the %s allowed' %
+                       (format_size(sizes['first'] + sizes['shared']), format_size(budget)))
+        capacity = budget - sizes['shared'] - 1024
+        plan = {}
+        part, used = 1, 0
+        for test, (kind, _, estimate) in sorted(tests.items()):
+            if kind != 'secret':
+                continue
+            if estimate > capacity:
+                self.error('Test %s alone would take about %s, more than the %s allowed' %
+                           (test, format_size(estimate), format_size(budget)))
+            if used + estimate > capacity:
+                part, used = part + 1, 0
+            plan[test] = part
+            used += estimate
+        self.msg('Split the package into %d archives' % (part + 1))
+        return plan
+
+    def check_archive_size(self, parts):
+        """Remove the parts left by a previous split of the package, and
+        check the size of the archives written against the budget.
+        """
+        if self.output_format != 'zip' or self.stream is not None:
+            return
+        part = parts
+        while os.path.exists(self.part_path(part)):
+            os.remove(self.part_path(part))
+            part += 1
+        if self.max_archive_size is None:
+            return
+        for part in range(parts):
+            size = os.path.getsize(self.part_path(part))
+            if size > self.max_archive_size:
+                self.error('%s takes %s, more than the %s allowed' %
+                           (self.part_path(part), format_size(size), format_size(self.max_archive_size)))
+
+    def open_archive(self, args, package_manifest, old_manifest, plan=None):
+        path = self.output
+        if self.stream is not None:
+            return archive.ZipArchiveWriter(path, package_manifest, policy=self.compression,
+                                            threads=compress_threads(args), io_threads=args.io_threads,
+                                            stream=self.stream)
+        if plan is not None:
+            previous = old_manifest if args.update else None
+            return archive.SplitArchiveWriter(
+                [archive.ZipArchiveWriter(self.part_path(part), package_manifest, previous, self.compression,
+                                          compress_threads(args), args.io_threads)
+                 for part in range(max(plan.values(), default=0) + 1)], plan)
+        if self.output_format == 'dir':
+            return archive.UnpackedArchiveWriter(path, package_manifest, args.io_threads)
+        if args.keep_staging:
+            self.tmpdir = tempfile.mkdtemp(prefix='%s-domjudge' % self.shortname)
+            self.info('Staging package in %s' % self.tmpdir)
+            return archive.StagingArchiveWriter(self.tmpdir, path, package_manifest, args.io_threads)
+        if args.update and old_manifest is not None:
+            self.info('Reuse unchanged members of %s' % path)
+            return archive.ZipArchiveWriter(path, package_manifest, old_manifest, self.compression,
+                                            compress_threads(args), args.io_threads)
+        return archive.ZipArchiveWriter(path, package_manifest, policy=self.compression, threads=compress_threads(args),
+                                        io_threads=args.io_threads)
 
     def run(self, args=None):
         if self.shortname is None:
@@ -308,6 +800,53 @@ class Problem(ProblemAspect):
         if args is None:
             args = default_args()
 
+        self.compression = archive.CompressionPolicy(
+            self.misc_config.compress_level if args.compress_level is None else args.compress_level,
+            self.misc_config.compress_sample_size,
+            self.misc_config.compress_min_ratio)
+        # Only a zip can be streamed, as a whole.
+        self.output_format = args.output_format if self.stream is None else 'zip'
+        self.lint = args.lint
+        self.dedup = args.dedup
+        # The size limit only applies to zips.
+        self.max_archive_size = args.max_archive_size if self.output_format == 'zip' else None
+        self.split = args.split and self.stream is None
+        self.compile = args.compile
+        self.verify = args.verify
+        if self.output is None:
+            self.output = os.path.join(args.output_dir, ('%s-domjudge' if self.output_format == 'dir' else '%s.zip') %
+                                       self.shortname)
+            if os.path.realpath(self.output) == self.probdir:
+                # The package is an archive named like its output, e.g.
+                # P00.zip converted in its problemset directory.
+                self.output = os.path.join(args.output_dir, '%s-domjudge.zip' % self.shortname)
+                self.msg('Write %s, not to overwrite the package' % self.output)
+        manifest_path = self.manifest_path()
+        with self.metrics.stage('check'):
+            source_files = self.source_files()
+            config_digest = self.config_digest()
+            old_manifest = None
+            if self.stream is None and os.path.exists(self.output):
+                old_manifest = manifest.Manifest.load(manifest_path, self.package.root)
+            unchanged = (not args.force and old_manifest is not None and
+                         not old_manifest.changed(source_files, config_digest))
+            if unchanged and old_manifest.refreshed:
+                old_manifest.save(manifest_path)
+        if unchanged:
+            self.skipped = True
+            self.msg('Skip unchanged problem')
+            return [self.errors, self.warnings]
+
+        plan = None
+        if self.max_archive_size is not None:
+            try:
+                with self.metrics.stage('plan'):
+                    plan = self.plan_archive()
+            except ProcessError:
+                return [self.errors, self.warnings]
+
+        package_manifest = manifest.Manifest(self.package.root, config_digest)
+        self.archive = self.open_archive(args, package_manifest, old_manifest, plan)
         try:
             part_mapping = {
                 'config': self.config,
@@ -318,24 +857,118 @@ class Problem(ProblemAspect):
             }
             for part in part_mapping.keys():
                 self.msg('Add %s' % part)
-                part_mapping[part].process()
+                with self.metrics.stage(part):
+                    try:
+                        part_mapping[part].process()
+                    except package.READ_ERRORS as err:
+                        # e.g. a member of a broken zip package read on the way.
+                        part_mapping[part].error('cannot read the package: %s' % err)
+            with self.metrics.stage('compile'):
+                self.output_validator.check_compile()
+            if self.verify:
+                self.msg('Verify submissions')
+                with self.metrics.stage('verify'):
+                    self.verification.process(cpus_per_job(args))
+            if self.stream is not None and self.errors:
+                # A streamed zip can't be removed: it is aborted, and left
+                # incomplete.
+                return [self.errors, self.warnings]
 
             self.msg('Make archive')
-            shutil.make_archive(self.shortname, 'zip', self.tmpdir)
+            with self.metrics.stage('archive'):
+                try:
+                    self.archive.close()
+                except package.READ_ERRORS as err:
+                    self.error('cannot write %s: %s' % (self.output, err))
+            parts = max(plan.values(), default=0) + 1 if plan is not None else 1
+            self.check_archive_size(parts)
+            if self.stream is not None:
+                return [self.errors, self.warnings]
+            with self.metrics.stage('manifest'):
+                self.save_index()
+                self.save_verification()
+                package_manifest.update(source_files)
+                package_manifest.save(manifest_path)
 
         except ProcessError:
             pass
+        finally:
+            self.output_validator.close()
+            self.archive.abort()
+
+        return [self.errors, self.warnings]
+
+
+LOG_FORMAT = '%(levelname)s %(message)s'
 
-        return [ProblemAspect.errors, ProblemAspect.warnings]
+
+def parse_size(value):
+    """Parse a size in bytes, optionally followed by K, M or G (KiB, MiB,
+    GiB), e.g. '256M'.
+    """
+    match = re.match(r'^(\d+)\s*([KMG]?)(iB|B)?$', value.strip(), re.IGNORECASE)
+    if match is None:
+        raise ArgumentTypeError('invalid size: %s' % value)
+    return int(match.group(1)) << {'': 0, 'K': 10, 'M': 20, 'G': 30}[match.group(2).upper()]
+
+
+def format_size(size):
+    for unit in ['B', 'KiB', 'MiB']:
+        if size < 1024:
+            return '%.4g %s' % (size, unit)
+        size /= 1024
+    return '%.4g GiB' % size
 
 
 def argparser():
     parser = ArgumentParser(description='Process Polygon Package to Domjudge Package.')
-    parser.add_argument('problemsetdir', help='path of the polygon packages')
+    parser.add_argument('problemsetdir', help='path of the polygon packages (directories, zip or tar archives)')
     parser.add_argument('-v', '--version', action='version', version='%(prog)s ' + __version__)
     parser.add_argument('-l', '--log_level', default='info',
                         help='set log level (debug, info, warning, error, critical)')
     parser.add_argument('-e', '--werror', action='store_true', help='consider warnings as errors')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of problems to convert in parallel (0 means one per CPU)')
+    parser.add_argument('--metrics-json', metavar='FILE',
+                        help='write the time, I/O and memory used by each stage of each problem to FILE')
+    parser.add_argument('-w', '--watch', action='store_true',
+                        help='keep running and re-convert the problems whenever they change')
+    parser.add_argument('--debounce', type=float, default=1.0, metavar='SECONDS',
+                        help='with --watch, wait for the changes to settle for that long (default: 1)')
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help='directory to write the packages to (default: the current directory), or - to write '
+                             'the zip of the only problem to the standard output, and the logs to the standard error')
+    parser.add_argument('-f', '--output-format', choices=['zip', 'dir'], default='zip',
+                        help='write each package as a zip or as an unpacked directory (<name>-domjudge)')
+    parser.add_argument('--keep-staging', action='store_true',
+                        help='stage each package in a temporary directory and keep it for debugging')
+    parser.add_argument('--lint', action='store_true',
+                        help='check the tests for trailing whitespace, tabs, non-ASCII bytes, empty files and long '
+                             'lines, and write their statistics to <package>.tests.json')
+    parser.add_argument('--dedup', action='store_true',
+                        help='drop the secret tests identical (input and answer) to a sample or an earlier test')
+    parser.add_argument('--max-archive-size', type=parse_size, metavar='SIZE',
+                        help='estimate the size of each zip before building it and fail if it would be larger than '
+                             'SIZE (e.g. 256M), as DOMjudge would refuse to import it')
+    parser.add_argument('--split', action='store_true',
+                        help='with --max-archive-size, split the packages too large into a zip with the samples and '
+                             'submissions and zips <name>.data-<n>.zip of secret tests, to import one after the other')
+    parser.add_argument('--compile', action='store_true',
+                        help='compile the custom checkers and interactors (see compiler in misc.yaml) while '
+                             'converting, as DOMjudge will')
+    parser.add_argument('--verify', action='store_true',
+                        help='judge the jury solutions on the tests, check their results against their tags and '
+                             'suggest a timelimit (see timelimit_factor in misc.yaml)')
+    parser.add_argument('--force', action='store_true',
+                        help='rebuild all problems, even those unchanged since the last run')
+    parser.add_argument('-u', '--update', action='store_true',
+                        help='copy unchanged files from the previous archive instead of compressing them again')
+    parser.add_argument('-z', '--compress-level', type=int, choices=range(10), metavar='{0-9}',
+                        help='deflate level of the archive (default: compress_level in misc.yaml)')
+    parser.add_argument('-t', '--threads', type=int, default=0,
+                        help='number of threads compressing each archive (0 means share the CPUs between jobs)')
+    parser.add_argument('--io-threads', type=int, default=4,
+                        help='number of threads reading the tests and submissions of each problem (default: 4)')
     return parser
 
 
@@ -343,41 +976,209 @@ def default_args():
     return argparser().parse_args([None])
 
 
-def main():
-    args = argparser().parse_args()
+def cpus_per_job(args):
+    """Share of the CPUs of each of the --jobs problems converted at the
+    same time, to compress their zips or run their jury solutions.
+    """
+    cpus = os.cpu_count() or 1
+    jobs = args.jobs if args.jobs > 0 else cpus
+    return max(1, cpus // jobs)
 
-    fmt = "%(levelname)s %(message)s"
 
-    logging.basicConfig(stream=sys.stdout, format=fmt, level=eval("logging." + args.log_level.upper()))
+def compress_threads(args):
+    if args.threads > 0:
+        return args.threads
+    return cpus_per_job(args)
 
+
+def process_problem(problemdir, args, stream=None):
+    """Convert a single problem directory and print its summary, writing
+    its zip to stream if given (see Problem).
+
+    Returns:
+        (errors, report): number of errors found in the problem, and the
+        metrics of its stages (see p2d.metrics.Recorder.as_dict()) with
+        its numbers of errors and warnings.
+    """
+    name = package.problem_name(problemdir)
+    print('Loading problem %s' % name)
+    prob = None
+    try:
+        with Problem(problemdir, stream=stream) as prob:
+            [errors, warnings] = prob.run(args)
+        name = prob.shortname
+    except Exception as err:
+        # Only this problem fails, e.g. on a package without solutions/:
+        # the others are converted, and --watch goes on.
+        logging.exception('in %s: %s', name, err)
+        errors, warnings = (prob.errors + 1, prob.warnings) if prob is not None else (1, 0)
+
+    def p(x):
+        return '' if x == 1 else 's'
+
+    print("%s finished: %d error%s, %d warning%s" % (name, errors, p(errors), warnings, p(warnings)))
+    report = (prob.metrics if prob is not None else metrics.Recorder()).as_dict()
+    report.update(errors=errors, warnings=warnings)
+    return errors, report
+
+
+__worker_args = None
+
+
+def __init_worker(args, problem_config):
+    global __worker_args
+    __worker_args = args
     ProblemAspect.consider_warnings_errors = args.werror
+    Problem.problem_config = problem_config
+
+
+def __process_problem_worker(problemdir):
+    """Run process_problem() in a worker, capturing everything it prints
+    so that the parent can output each problem as one block.
+    """
+    output = io.StringIO()
+    handler = logging.StreamHandler(output)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(getattr(logging, __worker_args.log_level.upper()))
+    with contextlib.redirect_stdout(output):
+        errors, report = process_problem(problemdir, __worker_args)
+    return errors, report, output.getvalue()
+
+
+def convert_problems(problemdirs, args, stream=None):
+    """Convert the given problem directories (in parallel with --jobs),
+    printing their summaries and the list of problems with errors, and
+    writing the metrics of the run to --metrics-json if given. With
+    stream, the zip of the only problem is written to it.
+
+    Returns:
+        total number of errors.
+    """
     total_errors = 0
-
-    Problem.problem_config = problems.load_problem_config(os.path.realpath(args.problemsetdir))
+    outcomes = []
+    start = time.perf_counter()
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    if jobs > 1 and len(problemdirs) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(problemdirs)), initializer=__init_worker,
+                                    initargs=(args, Problem.problem_config))
+        with pool:
+            for problemdir, (errors, report, output) in zip(problemdirs,
+                                                            pool.imap(__process_problem_worker, problemdirs)):
+                sys.stdout.write(output)
+                sys.stdout.flush()
+                outcomes.append((problemdir, errors, report))
+    else:
+        for problemdir in problemdirs:
+            outcomes.append((problemdir,) + process_problem(problemdir, args, stream))
 
     error_list = []
-    for _ in os.listdir(args.problemsetdir):
-        problemdir = os.path.join(args.problemsetdir, _)
-        if os.path.isdir(problemdir):
-            print('Loading problem %s' % os.path.basename(os.path.realpath(problemdir)))
-            with Problem(problemdir) as prob:
-                [errors, warnings] = prob.run(args)
-
-                def p(x):
-                    return '' if x == 1 else 's'
-
-                print("%s finished: %d error%s, %d warning%s" %
-                      (prob.shortname, errors, p(errors), warnings, p(warnings)))
-                if errors:
-                    error_list.append(os.path.basename(os.path.realpath(problemdir)))
-                total_errors += errors
+    reports = {}
+    for problemdir, errors, report in outcomes:
+        name = package.problem_name(problemdir)
+        if errors:
+            error_list.append(name)
+        total_errors += errors
+        reports[name] = report
+
+    if args.metrics_json:
+        with open(args.metrics_json, 'w', encoding='utf-8') as f:
+            json.dump(metrics.run_report(reports, time.perf_counter() - start), f, indent=1, sort_keys=True)
 
     if error_list:
         print('These problem got errors:')
         for item in error_list:
             print('  ' + item)
 
-    sys.exit(1 if total_errors > 0 else 0)
+    return total_errors
+
+
+def watch_problems(args):
+    """Re-convert the problems of args.problemsetdir whenever they change,
+    until interrupted. Changes to problems.yaml reload it and re-convert
+    every problem (unchanged ones are skipped, see Problem.run()).
+    """
+    watcher = watch.watcher(args.problemsetdir)
+    print('Watching %s for changes (%s), press Ctrl-C to stop' %
+          (args.problemsetdir, 'inotify' if isinstance(watcher, watch.InotifyWatcher) else 'polling'))
+    sys.stdout.flush()
+    for changed in watch.debounced(watcher, args.debounce):
+        if 'problems.yaml' in changed:
+            try:
+                Problem.problem_config = problems.load_problem_config(os.path.realpath(args.problemsetdir))
+            except Exception as err:
+                logging.error('in problems.yaml: %s', err)
+                continue
+            changed = os.listdir(args.problemsetdir)
+        # Skip whatever is not a Polygon package, e.g. the packages written
+        # in the problemset directory itself.
+        problemdirs = [os.path.join(args.problemsetdir, _) for _ in sorted(changed)]
+        problemdirs = [_ for _ in problemdirs if package.is_package(_)]
+        if problemdirs:
+            convert_problems(problemdirs, args)
+            sys.stdout.flush()
+
+
+def cli(argv=None):
+    """Run the p2d command with the arguments argv (sys.argv[1:] by
+    default), or the conversion server (see p2d.serve) if the first one
+    is 'serve'.
+
+    Returns:
+        the exit status of the command.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['serve']:
+        from . import serve
+        return serve.main(argv[1:])
+    parser = argparser()
+    args = parser.parse_args(argv)
+    # With -o -, the zip is written to the standard output, and everything
+    # else to the standard error.
+    stream = None
+    if args.output_dir == '-':
+        if args.watch or args.split or args.output_format != 'zip':
+            parser.error('-o - writes a single zip, it can not be used with --watch, --split or -f dir')
+        stream = sys.stdout.buffer
+
+    logging.basicConfig(stream=sys.stdout if stream is None else sys.stderr, format=LOG_FORMAT,
+                        level=eval("logging." + args.log_level.upper()))
+
+    ProblemAspect.consider_warnings_errors = args.werror
+
+    Problem.problem_config = problems.load_problem_config(os.path.realpath(args.problemsetdir))
+
+    problemdirs = [os.path.join(args.problemsetdir, _) for _ in os.listdir(args.problemsetdir)]
+    # Skip whatever is not a Polygon package, e.g. the packages written in
+    # the problemset directory by a previous run.
+    problemdirs = [_ for _ in problemdirs if package.is_package(_)]
+
+    if stream is not None:
+        if len(problemdirs) != 1:
+            logging.error('-o - writes the zip of a single problem, but %s holds %d', args.problemsetdir,
+                          len(problemdirs))
+            return 1
+        with contextlib.redirect_stdout(sys.stderr):
+            total_errors = convert_problems(problemdirs, args, stream)
+        return 1 if total_errors > 0 else 0
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    total_errors = convert_problems(problemdirs, args)
+
+    if args.watch:
+        try:
+            watch_problems(args)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    return 1 if total_errors > 0 else 0
+
+
+def main():
+    sys.exit(cli())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import zlib
+
+from . import scan
+from ._version import __version__
+
+
+def hash_file(path):
+    """Return the sha256 hex digest of a file (or of a p2d.package.Member)."""
+    sha = hashlib.sha256()
+    for chunk in scan.read_chunks(path):
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+def hash_config(data):
+    """Return the sha256 hex digest of a JSON serializable object."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class Hasher(object):
+    """Scanner (see p2d.scan) computing the sha256 and the CRC-32 of a
+    file as it is copied.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.crc = 0
+        self._sha = hashlib.sha256()
+
+    def feed(self, chunk):
+        self._sha.update(chunk)
+        self.crc = zlib.crc32(chunk, self.crc)
+        self.size += len(chunk)
+
+    def hexdigest(self):
+        return self._sha.hexdigest()
+
+
+class Manifest(object):
+    """Fingerprints of the files and the configuration a package was
+    built from.
+
+    Files are recorded by their path relative to the problem directory
+    (or absolute, for files outside of it) with their size, mtime and
+    sha256, so that an unchanged problem can be detected by stat()ing
+    its files, hashing only the ones whose size or mtime changed.
+
+    The members of the package copied from these files are recorded
+    too, so that unchanged members can be found in the package.
+    """
+
+    def __init__(self, root, config, files=None, members=None):
+        """Create a manifest.
+
+        Args:
+            root (str): the problem directory.
+            config (str): digest of the configuration, see hash_config().
+            files (dict): fingerprints of the files, by name.
+            members (dict): name of the file each member of the package
+                was copied from, by member name.
+        """
+        self.root = root
+        self.config = config
+        self.files = files if files is not None else {}
+        self.members = members if members is not None else {}
+        self.refreshed = False
+        self._hashers = {}
+
+    @staticmethod
+    def load(path, root):
+        """Load a manifest saved by save().
+        Returns:
+            the manifest, or None if there is no (usable) manifest at path.
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data['version'] != __version__:
+                return None
+            return Manifest(root, data['config'], data['files'], data.get('members'))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def name(self, path):
+        path = os.path.join(self.root, path)
+        relpath = os.path.relpath(path, self.root)
+        if relpath.startswith(os.pardir):
+            return os.path.realpath(path)
+        return relpath.replace(os.sep, '/')
+
+    def path(self, name):
+        if os.path.isabs(name):
+            return name
+        return os.path.join(self.root, *name.split('/'))
+
+    def hasher(self, path, arcname=None):
+        """Return a scanner recording the hash of the file at path while
+        it is being copied (to the member arcname), so save() needn't
+        read it again.
+        """
+        hasher = Hasher()
+        self._hashers[self.name(path)] = hasher
+        if arcname is not None:
+            self.members[arcname] = self.name(path)
+        return hasher
+
+    def source_of(self, arcname):
+        """Return the fingerprint of the file the member arcname was
+        copied from, or None.
+        """
+        name = self.members.get(arcname)
+        if name is None:
+            return None
+        return self.files.get(name)
+
+    def fingerprint(self, name):
+        st = os.stat(self.path(name))
+        hasher = self._hashers.get(name)
+        if hasher is not None and hasher.size == st.st_size:
+            digest = hasher.hexdigest()
+        else:
+            digest = hash_file(self.path(name))
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+
+    def changed(self, paths, config):
+        """Check whether the package built from the given files and
+        configuration would differ from the one this manifest describes.
+
+        Recorded mtimes of files found unchanged by their hash are
+        refreshed, so the next check only needs to stat() them.
+        """
+        names = [self.name(path) for path in paths]
+        if config != self.config or set(names) != set(self.files.keys()):
+            return True
+        for name in names:
+            old = self.files[name]
+            try:
+                st = os.stat(self.path(name))
+            except OSError:
+                return True
+            if st.st_size == old['size'] and st.st_mtime_ns == old['mtime_ns']:
+                continue
+            if st.st_size != old['size'] or hash_file(self.path(name)) != old['sha256']:
+                return True
+            old['mtime_ns'] = st.st_mtime_ns
+            self.refreshed = True
+        return False
+
+    def update(self, paths):
+        """Fingerprint the given files, replacing all recorded ones."""
+        self.files = {}
+        for path in paths:
+            name = self.name(path)
+            self.files[name] = self.fingerprint(name)
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': __version__, 'config': self.config, 'files': self.files, 'members': self.members},
+                      f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
@@ -0,0 +1,133 @@
+import contextlib
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Counters(object):
+    """Bytes read and written and package members written, counted by the
+    I/O functions of p2d (see p2d.scan and p2d.archive) in the whole
+    process, from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.files = 0
+
+    def read(self, size):
+        with self._lock:
+            self.bytes_read += size
+
+    def written(self, size, files=0):
+        with self._lock:
+            self.bytes_written += size
+            self.files += files
+
+    def snapshot(self):
+        with self._lock:
+            return self.bytes_read, self.bytes_written, self.files
+
+
+counters = Counters()
+
+
+def peak_rss():
+    """Return the peak resident set size of the process in bytes, or 0 if
+    unknown.
+    """
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class Metrics(object):
+    """Resources used by some work: wall and CPU time in seconds, bytes
+    read and written, package members written, and the peak RSS of the
+    process in bytes.
+    """
+
+    FIELDS = ['wall', 'cpu', 'bytes_read', 'bytes_written', 'files', 'peak_rss']
+
+    def __init__(self, values=None):
+        for field in Metrics.FIELDS:
+            setattr(self, field, 0)
+        if values is not None:
+            for field in Metrics.FIELDS:
+                setattr(self, field, values.get(field, 0))
+
+    def add(self, other):
+        """Accumulate other in self, the peak RSS being the maximum."""
+        for field in Metrics.FIELDS:
+            if field == 'peak_rss':
+                self.peak_rss = max(self.peak_rss, other.peak_rss)
+            else:
+                setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in Metrics.FIELDS}
+
+
+class Recorder(object):
+    """Metrics of the stages of the conversion of a problem.
+
+    I/O is counted process-wide, so the stages of problems converted at
+    the same time in a process would be mixed up; and the zip writer
+    thread may still be writing the members of a stage when the next one
+    starts, in which case they are counted in the latter.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measure the body of the with statement as (part of) stage name."""
+        wall, cpu = time.perf_counter(), time.process_time()
+        read, written, files = counters.snapshot()
+        try:
+            yield
+        finally:
+            metrics = Metrics()
+            metrics.wall = time.perf_counter() - wall
+            metrics.cpu = time.process_time() - cpu
+            metrics.bytes_read, metrics.bytes_written, metrics.files = [
+                now - before for now, before in zip(counters.snapshot(), (read, written, files))]
+            metrics.peak_rss = peak_rss()
+            self.stages.setdefault(name, Metrics()).add(metrics)
+
+    def total(self):
+        total = Metrics()
+        for metrics in self.stages.values():
+            total.add(metrics)
+        return total
+
+    def as_dict(self):
+        return {'stages': {name: metrics.as_dict() for name, metrics in self.stages.items()},
+                'total': self.total().as_dict()}
+
+
+def run_report(problems, wall):
+    """Aggregate the metrics of the problems of a run.
+
+    Args:
+        problems (dict): Recorder.as_dict() of each problem, by name.
+        wall (float): wall time of the whole run.
+
+    Returns:
+        a JSON serializable report of the run.
+    """
+    total = Metrics()
+    for problem in problems.values():
+        total.add(Metrics(problem['total']))
+    total.wall = wall
+    total.peak_rss = max(total.peak_rss, peak_rss())
+    return {'problems': problems, 'total': total.as_dict()}
@@ -9,12 +9,20 @@ class MiscConfigError(Exception):
 
 class Misc(object):
     """Misc config object."""
-    __KEYS = ['testlib', 'desc', 'out']
+    __KEYS = ['testlib', 'desc', 'out', 'compress_level', 'compress_sample_size', 'compress_min_ratio',
+              'lint_max_line_length', 'compiler', 'compile_flags', 'timelimit_factor']
 
     def __init__(self, data):
         self.testliblib = None
         self.desc = None
         self.out = None
+        self.compress_level = 6
+        self.compress_sample_size = 65536
+        self.compress_min_ratio = 0.9
+        self.lint_max_line_length = 1 << 20
+        self.compiler = 'g++'
+        self.compile_flags = '-x c++ -std=gnu++17 -O2 -pipe'
+        self.timelimit_factor = 2.0
         self.update(data)
 
     def update(self, values):
@@ -33,6 +41,24 @@ class Misc(object):
             elif key == 'out':
                 if not isinstance(value, str):
                     raise MiscConfigError('output extension path must be a string but is %s' % type(value))
+            elif key == 'compress_level':
+                if not isinstance(value, int) or not 0 <= value <= 9:
+                    raise MiscConfigError('compress level must be an integer between 0 and 9 but is %s' % value)
+            elif key == 'compress_sample_size':
+                if not isinstance(value, int) or value <= 0:
+                    raise MiscConfigError('compress sample size must be a positive integer but is %s' % value)
+            elif key == 'compress_min_ratio':
+                if not isinstance(value, (int, float)) or not 0 <= value <= 1:
+                    raise MiscConfigError('compress min ratio must be a number between 0 and 1 but is %s' % value)
+            elif key == 'lint_max_line_length':
+                if not isinstance(value, int) or value <= 0:
+                    raise MiscConfigError('lint max line length must be a positive integer but is %s' % value)
+            elif key == 'timelimit_factor':
+                if not isinstance(value, (int, float)) or value <= 0:
+                    raise MiscConfigError('timelimit factor must be a positive number but is %s' % value)
+            elif key in ('compiler', 'compile_flags'):
+                if not isinstance(value, str):
+                    raise MiscConfigError('%s must be a string but is %s' % (key.replace('_', ' '), type(value)))
 
             self.__dict__[key] = value
 
@@ -0,0 +1,336 @@
+"""Polygon packages, read from a directory or straight from the zip (or
+tar) archive Polygon builds, without extracting it.
+
+Files of a package are addressed by their path relative to the root of
+the package, using '/' as separator, e.g. 'tests/01'. The source of a
+file (see source()) is its path for a directory, and a Member for an
+archive; open_source() opens either.
+"""
+import bz2
+import errno
+import gzip
+import io
+import lzma
+import os
+import re
+import shutil
+import struct
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+
+ZIP_SUFFIXES = ('.zip',)
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# Errors reading a file of a package, e.g. a member of a corrupted or
+# truncated archive.
+READ_ERRORS = (OSError, EOFError, zipfile.BadZipFile, zlib.error)
+
+# Polygon names its packages <short name>-<revision>$<type>.zip.
+__ARCHIVE_NAME = re.compile(r'^(?P<name>.+?)(-\d+\$[a-z]+)?(%s)$' %
+                            '|'.join(re.escape(_) for _ in ZIP_SUFFIXES + TAR_SUFFIXES), re.IGNORECASE)
+
+
+def is_archive(path):
+    """Whether path is named like an archive package."""
+    return path.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES)
+
+
+def is_archive_package(path):
+    """Whether path is a file which looks like an archive package. Zips
+    must contain a problem.xml, so that DOMjudge packages are not taken
+    for Polygon packages.
+    """
+    if not os.path.isfile(path) or not is_archive(path):
+        return False
+    if path.lower().endswith(ZIP_SUFFIXES):
+        try:
+            with zipfile.ZipFile(path) as z:
+                return _root_prefix(z.namelist()) is not None
+        except (OSError, zipfile.BadZipFile):
+            return False
+    return True
+
+
+def is_package(path):
+    """Whether path looks like a Polygon package: a directory holding a
+    problem.xml (not e.g. a DOMjudge package written with -f dir), or an
+    archive package.
+    """
+    return os.path.isfile(os.path.join(path, 'problem.xml')) or is_archive_package(path)
+
+
+def problem_name(path):
+    """Return the name of the problem of the package at path: the name of
+    the directory, or of the archive without its suffix and the
+    -<revision>$<type> added by Polygon (e.g. 'aplusb' for
+    'aplusb-3$linux.zip').
+    """
+    name = os.path.basename(os.path.realpath(path))
+    match = __ARCHIVE_NAME.match(name)
+    return match.group('name') if match else name
+
+
+def open_package(path):
+    """Open the package at path, a directory or an archive.
+    Returns:
+        a DirectoryPackage, ZipPackage or TarPackage, to be closed.
+    Raises:
+        ValueError if path is not a package.
+    """
+    if os.path.isdir(path):
+        return DirectoryPackage(path)
+    if path.lower().endswith(ZIP_SUFFIXES):
+        return ZipPackage(path)
+    if path.lower().endswith(TAR_SUFFIXES):
+        return TarPackage(path)
+    raise ValueError('%s is neither a directory nor a zip or tar archive' % path)
+
+
+def open_source(src):
+    """Open the source of a file (a path or a Member) for binary reading."""
+    if isinstance(src, Member):
+        return src.open()
+    return open(src, 'rb', buffering=0)
+
+
+def _root_prefix(names):
+    """Return the prefix of the names of the members of an archive under
+    which problem.xml is: '' or a single directory, or None.
+    """
+    names = [_[2:] if _.startswith('./') else _ for _ in names]
+    if 'problem.xml' in names:
+        return ''
+    prefixes = [_[:-len('problem.xml')] for _ in names if _.count('/') == 1 and _.endswith('/problem.xml')]
+    return prefixes[0] if len(prefixes) == 1 else None
+
+
+class DirectoryPackage(object):
+    """A package extracted in a directory."""
+
+    is_archive = False
+
+    def __init__(self, path):
+        self.path = os.path.realpath(path)
+        # Directory the paths of the package are relative to, see
+        # p2d.manifest.Manifest.
+        self.root = self.path
+
+    def source(self, name):
+        return os.path.join(self.path, *name.split('/'))
+
+    def isfile(self, name):
+        return os.path.isfile(self.source(name))
+
+    def listdir(self, name):
+        return os.listdir(self.source(name))
+
+    def open(self, name):
+        return open(self.source(name), 'rb')
+
+    def close(self):
+        pass
+
+
+class Member(object):
+    """A file of an archive package, the source of a file instead of its
+    path.
+    """
+
+    def __init__(self, package, name, size=None, date_time=None):
+        self.package = package
+        self.name = name
+        # The size is None if there is no such file in the package.
+        self.size = size
+        self.date_time = date_time
+
+    def open(self):
+        """Open the file for binary reading.
+        Raises:
+            FileNotFoundError if there is no such file in the package.
+        """
+        if self.size is None:
+            raise FileNotFoundError(errno.ENOENT, 'No such file in the package', str(self))
+        return self._open()
+
+    def _open(self):
+        raise NotImplementedError
+
+    def __str__(self):
+        return '%s/%s' % (self.package.path, self.name)
+
+
+class _Slice(io.RawIOBase):
+    """Read size bytes from offset in a file, with a file descriptor of
+    its own so that slices can be read from several threads.
+    """
+
+    def __init__(self, path, offset, size):
+        self._f = open(path, 'rb', buffering=0)
+        self._f.seek(offset)
+        self._remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._remaining == 0:
+            return 0
+        n = self._f.readinto(memoryview(b)[:self._remaining])
+        if not n:
+            raise EOFError('Unexpected end of %s' % self._f.name)
+        self._remaining -= n
+        return n
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+class ArchivePackage(object):
+    """Base class of the packages read from an archive, whose files are
+    Members.
+    """
+
+    is_archive = True
+
+    def __init__(self, path):
+        self.path = os.path.realpath(path)
+        self.root = os.path.dirname(self.path)
+        self._members = {}
+        self._dirs = {}
+
+    def _add(self, member):
+        self._members[member.name] = member
+        parts = member.name.split('/')
+        for i in range(len(parts)):
+            self._dirs.setdefault('/'.join(parts[:i]), set()).add(parts[i])
+
+    def source(self, name):
+        member = self._members.get(name)
+        return member if member is not None else Member(self, name)
+
+    def isfile(self, name):
+        return name in self._members
+
+    def listdir(self, name):
+        try:
+            return sorted(self._dirs[name.strip('/')])
+        except KeyError:
+            raise FileNotFoundError(errno.ENOENT, 'No such directory in the package', '%s/%s' % (self.path, name))
+
+    def open(self, name):
+        return self.source(name).open()
+
+    def close(self):
+        pass
+
+
+class ZipMember(Member):
+
+    def __init__(self, package, name, info):
+        super().__init__(package, name, info.file_size, info.date_time)
+        self.info = info
+
+    @property
+    def deflated(self):
+        """Whether the data of the member is deflated, so that it can be
+        copied as is into another zip (see open_raw()).
+        """
+        return self.info.compress_type == zipfile.ZIP_DEFLATED and not self.info.flag_bits & 0x1
+
+    def _open(self):
+        return self.package.zip.open(self.info)
+
+    def open_raw(self):
+        """Open the compressed data of the member for binary reading."""
+        with open(self.package.path, 'rb') as f:
+            f.seek(self.info.header_offset)
+            header = f.read(30)
+        if len(header) != 30 or header[:4] != b'PK\x03\x04':
+            raise zipfile.BadZipFile('Bad local file header of %s' % self)
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        return _Slice(self.package.path, self.info.header_offset + 30 + name_length + extra_length,
+                      self.info.compress_size)
+
+
+class ZipPackage(ArchivePackage):
+    """A package read from a zip, e.g. as downloaded from Polygon.
+
+    The package may also be in a single directory of the zip.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        try:
+            self.zip = zipfile.ZipFile(self.path)
+        except zipfile.BadZipFile as err:
+            raise ValueError('%s: %s' % (path, err))
+        prefix = _root_prefix(self.zip.namelist())
+        if prefix is None:
+            self.zip.close()
+            raise ValueError('%s: problem.xml not found' % path)
+        for info in self.zip.infolist():
+            name = info.filename[2:] if info.filename.startswith('./') else info.filename
+            if not info.is_dir() and name.startswith(prefix):
+                self._add(ZipMember(self, name[len(prefix):], info))
+
+    def close(self):
+        self.zip.close()
+
+
+class TarMember(Member):
+
+    def __init__(self, package, name, info):
+        date_time = time.localtime(max(info.mtime, 315532800))[:6]  # zips date from 1980
+        super().__init__(package, name, info.size, date_time)
+        self.offset = info.offset_data
+
+    def _open(self):
+        return io.BufferedReader(_Slice(self.package.data_path, self.offset, self.size))
+
+
+class TarPackage(ArchivePackage):
+    """A package read from a tar archive.
+
+    The files of an uncompressed tar are read in place. A compressed tar
+    is decompressed once into a temporary file, as its files can't be
+    read in any order.
+    """
+
+    __DECOMPRESS = [(b'\x1f\x8b', gzip.open), (b'BZh', bz2.open), (b'\xfd7zXZ\x00', lzma.open)]
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.data_path = self.path
+        self._tmp_path = None
+        with open(self.path, 'rb') as f:
+            magic = f.read(6)
+        try:
+            for prefix, decompress in TarPackage.__DECOMPRESS:
+                if magic.startswith(prefix):
+                    fd, self._tmp_path = tempfile.mkstemp(suffix='.tar', prefix='p2d-')
+                    with open(fd, 'wb') as fdst, decompress(self.path, 'rb') as fsrc:
+                        shutil.copyfileobj(fsrc, fdst, 1 << 20)
+                    self.data_path = self._tmp_path
+            with tarfile.open(self.data_path, 'r:') as tar:
+                infos = tar.getmembers()
+        except (OSError, EOFError, lzma.LZMAError, zlib.error, tarfile.TarError) as err:
+            self.close()
+            raise ValueError('%s: %s' % (path, err))
+        names = [_.name for _ in infos if _.isfile()]
+        prefix = _root_prefix(names)
+        if prefix is None:
+            self.close()
+            raise ValueError('%s: problem.xml not found' % path)
+        for info in infos:
+            name = info.name[2:] if info.name.startswith('./') else info.name
+            if info.isfile() and name.startswith(prefix):
+                self._add(TarMember(self, name[len(prefix):], info))
+
+    def close(self):
+        if self._tmp_path is not None:
+            os.remove(self._tmp_path)
+            self._tmp_path = None
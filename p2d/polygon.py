@@ -0,0 +1,163 @@
+"""Model of the problem.xml of a Polygon package.
+
+problem.xml is parsed incrementally with iterparse(): every element is
+freed once read, so the memory used does not grow with the number of
+tests (and their descriptions) listed in it. Only what the conversion
+needs is kept, in objects with __slots__.
+
+Parsed models are cached in the process by (path, size, mtime) of the
+file, see load().
+"""
+import collections
+import os
+import threading
+import xml.etree.ElementTree
+
+from . import package
+
+
+class Name(object):
+    __slots__ = ('language', 'value')
+
+    def __init__(self, language, value):
+        self.language = language
+        self.value = value
+
+
+class Testset(object):
+    """A testset of the problem, limits in milliseconds and bytes."""
+
+    __slots__ = ('name', 'time_limit', 'memory_limit', 'test_count', 'input_path_pattern', 'answer_path_pattern',
+                 'samples')
+
+    def __init__(self, name):
+        self.name = name
+        self.time_limit = None
+        self.memory_limit = None
+        self.test_count = None
+        self.input_path_pattern = None
+        self.answer_path_pattern = None
+        # Numbers of the sample tests, starting at 1.
+        self.samples = []
+
+
+class Source(object):
+    """The checker or the interactor of the problem: the path of its
+    source in the package and its Polygon type (e.g. 'cpp.g++17').
+    """
+
+    __slots__ = ('path', 'type')
+
+    def __init__(self, path, type):
+        self.path = path
+        self.type = type
+
+
+class ProblemXml(object):
+    __slots__ = ('short_name', 'revision', 'names', 'testsets', 'checker', 'interactor')
+
+    def __init__(self):
+        self.short_name = None
+        self.revision = None
+        self.names = []
+        self.testsets = []
+        self.checker = None
+        self.interactor = None
+
+    @property
+    def name(self):
+        """The first name of the problem."""
+        return self.names[0].value
+
+    @property
+    def testset(self):
+        """The first testset, the one the problem is judged with."""
+        return self.testsets[0]
+
+
+def parse(f):
+    """Parse problem.xml from the binary file object f.
+    Returns:
+        a ProblemXml.
+    Raises:
+        ValueError if problem.xml lacks the names or the testsets.
+    """
+    model = ProblemXml()
+    path = []
+    parents = []
+    testset = None
+    test = 0
+    for event, elem in xml.etree.ElementTree.iterparse(f, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            path.append(tag)
+            parents.append(elem)
+            if len(path) <= 3:
+                if path == ['problem']:
+                    model.short_name = elem.get('short-name')
+                    model.revision = elem.get('revision')
+                elif path == ['problem', 'judging', 'testset']:
+                    testset = Testset(elem.get('name'))
+                    test = 0
+            continue
+
+        depth = len(path)
+        # Tests are most of the elements, handle them first.
+        if tag == 'test' and depth == 5 and path[2] == 'testset' and path[1] == 'judging':
+            test += 1
+            if elem.get('sample') == 'true':
+                testset.samples.append(test)
+        elif depth == 3 and path == ['problem', 'names', 'name']:
+            model.names.append(Name(elem.get('language'), elem.get('value')))
+        elif depth == 3 and path == ['problem', 'judging', 'testset']:
+            model.testsets.append(testset)
+        elif depth == 4 and path[1] == 'judging' and path[2] == 'testset':
+            if tag in ('time-limit', 'memory-limit', 'test-count'):
+                setattr(testset, tag.replace('-', '_'), int(elem.text))
+            elif tag in ('input-path-pattern', 'answer-path-pattern'):
+                setattr(testset, tag.replace('-', '_'), elem.text)
+        elif depth == 4 and tag == 'source' and path[1] == 'assets' and path[2] in ('checker', 'interactor'):
+            setattr(model, path[2], Source(elem.get('path'), elem.get('type')))
+        path.pop()
+        parents.pop()
+        # Free the element, and all its previous siblings with it.
+        elem.clear()
+        if parents:
+            del parents[-1][:]
+
+    if not model.names:
+        raise ValueError('problem.xml has no name')
+    if not model.testsets:
+        raise ValueError('problem.xml has no testset')
+    return model
+
+
+__cache = collections.OrderedDict()
+__cache_lock = threading.Lock()
+CACHE_SIZE = 64
+
+
+def load(src):
+    """Parse the problem.xml src (a path or a p2d.package.Member), or
+    return the model already parsed from the same file if its size and
+    mtime did not change (the model must not be modified).
+    """
+    if isinstance(src, package.Member):
+        # Members change with their archive.
+        st = os.stat(src.package.path)
+        key = (str(src), src.size, st.st_mtime_ns)
+    else:
+        st = os.stat(src)
+        key = (os.path.realpath(src), st.st_size, st.st_mtime_ns)
+    with __cache_lock:
+        model = __cache.get(key)
+        if model is not None:
+            __cache.move_to_end(key)
+            return model
+    with package.open_source(src) as f:
+        model = parse(f)
+    with __cache_lock:
+        __cache[key] = model
+        while len(__cache) > CACHE_SIZE:
+            __cache.popitem(last=False)
+    return model
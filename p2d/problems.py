@@ -126,5 +126,8 @@ class Problems(object):
                 self.problems[problem_name].update(problem_spec)
 
 
-def load_problem_config(rootdir):
-    return Problems(config.load_config('problems.yaml', rootdir))
+def load_problem_config(rootdir=None):
+    """Load problem configuration, with the problems.yaml of rootdir (the
+    problemset directory) if given.
+    """
+    return Problems(config.load_config('problems.yaml', *([rootdir] if rootdir is not None else [])))
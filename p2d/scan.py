@@ -0,0 +1,223 @@
+import zlib
+
+from . import metrics
+from . import package
+
+CHUNK_SIZE = 1 << 20
+
+# numpy, imported on the first use by _numpy() as it takes a while to
+# import, or False if it is not installed.
+__numpy = None
+
+
+class LineEndingScanner(object):
+    """Check the line endings of a file fed to it chunk by chunk.
+
+    Only a constant amount of state is kept, so files of any size can be
+    checked with bounded memory, and no decoding is done, so binary
+    files are fine too.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.has_cr = False
+        self._last = b''
+
+    def feed(self, chunk):
+        """Scan the next chunk (bytes) of the file."""
+        if not chunk:
+            return
+        if not self.has_cr and chunk.find(b'\r') != -1:
+            self.has_cr = True
+        self._last = chunk[-1:]
+        self.size += len(chunk)
+
+    @property
+    def ends_with_newline(self):
+        """Whether the file is empty or its last byte is '\\n'."""
+        return self.size == 0 or self._last == b'\n'
+
+
+_ASCII = bytes(range(128))
+_TRAILING_WHITESPACE = (b' \n', b'\t\n', b' \r\n', b'\t\r\n')
+
+
+def _numpy():
+    global __numpy
+    if __numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        __numpy = numpy
+    return __numpy
+
+
+def _newlines(chunk):
+    """Find the line breaks of a chunk in bulk.
+    Returns:
+        (count, first, last, longest): the number of '\n' in the chunk,
+        the offsets of the first and last ones (-1 if none), and the
+        length of the longest line between them (0 if none).
+    """
+    numpy = _numpy()
+    if numpy:
+        offsets = numpy.flatnonzero(numpy.frombuffer(chunk, numpy.uint8) == 0x0a)
+        if len(offsets) == 0:
+            return 0, -1, -1, 0
+        longest = int(numpy.diff(offsets).max()) - 1 if len(offsets) > 1 else 0
+        return len(offsets), int(offsets[0]), int(offsets[-1]), longest
+    count = chunk.count(b'\n')
+    if count == 0:
+        return 0, -1, -1, 0
+    first, last = chunk.find(b'\n'), chunk.rfind(b'\n')
+    longest = max(map(len, chunk[first + 1:last].split(b'\n'))) if count > 1 else 0
+    return count, first, last, longest
+
+
+class LintScanner(object):
+    """Check a test file fed to it chunk by chunk for common mistakes
+    (see issues()) and compute its statistics: size, number of lines and
+    length of the longest line in bytes, without its '\n'.
+
+    Every check runs over whole chunks with the bulk operations of bytes
+    (or NumPy, if installed): nothing is done in Python per line, and
+    only a constant amount of state is kept between chunks.
+    """
+
+    def __init__(self, max_line_length=1 << 20):
+        self.max_line_length = max_line_length
+        self.size = 0
+        self.newlines = 0
+        self.longest_line = 0
+        self.has_cr = False
+        self.has_tab = False
+        self.non_ascii = False
+        self.trailing_whitespace = False
+        self._line = 0
+        self._tail = b''
+
+    def feed(self, chunk):
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if not self.has_cr and b'\r' in chunk:
+            self.has_cr = True
+        if not self.has_tab and b'\t' in chunk:
+            self.has_tab = True
+        if not self.non_ascii and chunk.translate(None, _ASCII):
+            self.non_ascii = True
+        if not self.trailing_whitespace:
+            # Also look for whitespace at the end of a line split across chunks.
+            edge = self._tail + chunk[:3]
+            self.trailing_whitespace = any(_ in edge or _ in chunk for _ in _TRAILING_WHITESPACE)
+        self._tail = (self._tail + chunk[-3:])[-3:]
+
+        count, first, last, longest = _newlines(chunk)
+        if count == 0:
+            self._line += len(chunk)
+            return
+        self.newlines += count
+        self.longest_line = max(self.longest_line, self._line + first, longest)
+        self._line = len(chunk) - last - 1
+
+    @property
+    def lines(self):
+        return self.newlines + (1 if self._line else 0)
+
+    def issues(self):
+        """Return the names of the mistakes found in the file, in the order
+        of ISSUES.
+        """
+        longest_line = max(self.longest_line, self._line)
+        found = {
+            'empty': self.size == 0,
+            'cr': self.has_cr,
+            'no_final_newline': self._line > 0,
+            'trailing_whitespace': self.trailing_whitespace or self._tail.endswith((b' ', b'\t')),
+            'tab': self.has_tab,
+            'non_ascii': self.non_ascii,
+            'long_line': longest_line > self.max_line_length,
+        }
+        return [_ for _ in ISSUES if found[_]]
+
+    def stats(self):
+        """Return the statistics and issues of the file, as a dict."""
+        return {'size': self.size, 'lines': self.lines, 'max_line_length': max(self.longest_line, self._line),
+                'issues': self.issues()}
+
+
+# Descriptions of the issues LintScanner finds.
+ISSUES = {
+    'empty': 'is empty',
+    'cr': 'contains non-standard line breaks',
+    'no_final_newline': "does not end with '\\n'",
+    'trailing_whitespace': 'has trailing whitespace',
+    'tab': 'contains tabs',
+    'non_ascii': 'contains non-ASCII bytes',
+    'long_line': 'has lines longer than the limit',
+}
+
+
+class Crc32(object):
+    """Compute the CRC-32 and the size of a file fed chunk by chunk."""
+
+    def __init__(self):
+        self.crc = 0
+        self.size = 0
+
+    def feed(self, chunk):
+        self.crc = zlib.crc32(chunk, self.crc)
+        self.size += len(chunk)
+
+
+def iter_chunks(f, chunk_size=None):
+    """Yield the content of a binary file object as bytes chunks of at
+    most chunk_size (CHUNK_SIZE by default).
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        metrics.counters.read(len(chunk))
+        yield chunk
+
+
+def read_chunks(path, chunk_size=None):
+    """Yield the content of the file at path (or of a member of an
+    archive package, see p2d.package), see iter_chunks().
+    """
+    with package.open_source(path) as f:
+        yield from iter_chunks(f, chunk_size)
+
+
+def scan_stream(f, *scanners):
+    """Feed the rest of a binary file object to every scanner."""
+    for chunk in iter_chunks(f):
+        for scanner in scanners:
+            scanner.feed(chunk)
+
+
+def scan_file(path, *scanners):
+    """Feed the whole content of a file to every scanner."""
+    with open(path, 'rb', buffering=0) as f:
+        scan_stream(f, *scanners)
+
+
+def scanned(chunks, *scanners):
+    """Yield the given chunks, feeding each one to the scanners first."""
+    for chunk in chunks:
+        for scanner in scanners:
+            scanner.feed(chunk)
+        yield chunk
+
+
+def copy_stream(fsrc, fdst, *scanners):
+    """Copy fsrc to fdst, feeding every chunk to the scanners on the way,
+    so that checking and copying a file reads it only once.
+    """
+    for chunk in iter_chunks(fsrc):
+        for scanner in scanners:
+            scanner.feed(chunk)
+        fdst.write(chunk)
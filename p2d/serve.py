@@ -0,0 +1,328 @@
+"""Local conversion server: p2d serve.
+
+POST a Polygon package (zip) to /convert?name=<problem> to get the
+DOMjudge package back, GET /stats for the queue and latency statistics.
+Conversions run on a pool of worker processes which load the
+configurations once.
+"""
+import concurrent.futures
+import io
+import json
+import logging
+import os
+import shutil
+import socket
+import socketserver
+import stat
+import tempfile
+import threading
+import time
+import urllib.parse
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from . import api
+from . import package
+from .main import ProblemAspect
+
+
+def _compress_level(value):
+    level = int(value)
+    if not 0 <= level <= 9:
+        raise ValueError('compress_level must be between 0 and 9')
+    return level
+
+
+# Options of a conversion a request may set in its query string, with
+# their parser, raising ValueError for invalid values.
+REQUEST_OPTIONS = {'werror': lambda value: value.lower() in ('1', 'true', 'yes'),
+                   'compress_level': _compress_level}
+
+# Bytes read or written at once when receiving a package or sending one.
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+__configs = None
+
+
+def _configs(problemsetdir):
+    """Return the configurations of the worker, loaded on first use."""
+    global __configs
+    if __configs is None:
+        __configs = api.Configs.load(problemsetdir)
+    return __configs
+
+
+def _convert(path, output, options, problemsetdir=None):
+    """Convert the Polygon package (zip) at path to output in a worker,
+    with the configurations of problemsetdir. The problem is named after
+    path, and the zip is converted as is, see p2d.package.
+
+    The workers convert one problem each at a time, so the conversion
+    itself is not spread on more threads.
+
+    Returns:
+        a dict describing the ConversionResult.
+    Raises:
+        ValueError if path is not a package.
+    """
+    start = time.perf_counter()
+    package.open_package(path).close()
+    result = api.convert_problem(path, output, dict(options, force=True, threads=1, io_threads=1),
+                                 _configs(problemsetdir))
+    return {'errors': result.errors, 'warnings': result.warnings, 'messages': result.messages,
+            'metrics': result.metrics, 'seconds': time.perf_counter() - start}
+
+
+class Stats(object):
+    """Queue and latency statistics of the server."""
+
+    def __init__(self, workers, max_pending):
+        self._lock = threading.Lock()
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        # Seconds from the request to the response, and spent converting
+        # in a worker, of the last requests.
+        self.latencies = []
+        self.conversions = []
+
+    def try_accept(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                return False
+            self.pending += 1
+            return True
+
+    def done(self, ok, latency, conversion):
+        with self._lock:
+            self.pending -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+            if latency is not None:
+                self.latencies = (self.latencies + [latency])[-1000:]
+                self.conversions = (self.conversions + [conversion])[-1000:]
+
+    @staticmethod
+    def __summary(samples):
+        if not samples:
+            return None
+        samples = sorted(samples)
+        return {'count': len(samples), 'mean': sum(samples) / len(samples),
+                'p50': samples[len(samples) // 2], 'p95': samples[min(len(samples) - 1, len(samples) * 95 // 100)],
+                'max': samples[-1]}
+
+    def as_dict(self):
+        with self._lock:
+            running = min(self.pending, self.workers)
+            return {'workers': self.workers, 'running': running, 'queue_depth': self.pending - running,
+                    'max_pending': self.max_pending, 'completed': self.completed, 'failed': self.failed,
+                    'rejected': self.rejected, 'latency': self.__summary(self.latencies),
+                    'conversion': self.__summary(self.conversions),
+                    'queue_wait': self.__summary([a - b for a, b in zip(self.latencies, self.conversions)])}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = 'p2d-serve'
+
+    def address_string(self):
+        # Unix sockets have no client address.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'local'
+
+    def log_message(self, format, *args):
+        logging.info('%s %s', self.address_string(), format % args)
+
+    def __reply(self, status, body, content_type='application/json', headers=None):
+        """Send body, bytes, an object to send as JSON, or an open file."""
+        if isinstance(body, io.IOBase):
+            length = os.fstat(body.fileno()).st_size
+        else:
+            if not isinstance(body, bytes):
+                body = json.dumps(body, indent=1).encode('utf-8')
+            length = len(body)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if isinstance(body, io.IOBase):
+            shutil.copyfileobj(body, self.wfile, UPLOAD_CHUNK_SIZE)
+        else:
+            self.wfile.write(body)
+
+    def __receive(self, path, length):
+        """Write the body of the request, of length bytes, to path.
+        Raises:
+            ValueError if the client sends less.
+        """
+        with open(path, 'wb') as f:
+            while length > 0:
+                chunk = self.rfile.read(min(length, UPLOAD_CHUNK_SIZE))
+                if not chunk:
+                    raise ValueError('incomplete package')
+                f.write(chunk)
+                length -= len(chunk)
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if path == '/stats':
+            self.__reply(200, self.server.stats.as_dict())
+        elif path == '/health':
+            self.__reply(200, {'status': 'ok'})
+        else:
+            self.__reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != '/convert':
+            self.__reply(404, {'error': 'not found'})
+            return
+        query = urllib.parse.parse_qs(url.query)
+        name = query.pop('name', ['problem'])[0]
+        options = {}
+        try:
+            if not ProblemAspect.basename_regex.match(name):
+                raise ValueError('Invalid problem name "%s"' % name)
+            for key, values in query.items():
+                if key not in REQUEST_OPTIONS:
+                    raise ValueError('Unknown option "%s"' % key)
+                options[key] = REQUEST_OPTIONS[key](values[0])
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError as err:
+            self.__reply(400, {'error': str(err)})
+            return
+        # Requests are rejected before their body is read, which is left
+        # unread: the connection can't be reused.
+        if length > self.server.max_upload:
+            self.close_connection = True
+            self.__reply(413, {'error': 'package larger than %d bytes' % self.server.max_upload})
+            return
+        stats = self.server.stats
+        if not stats.try_accept():
+            self.close_connection = True
+            self.__reply(503, {'error': 'too many pending conversions'}, headers={'Retry-After': '1'})
+            return
+
+        start = time.perf_counter()
+        result = None
+        tmpdir = None
+        try:
+            try:
+                tmpdir = tempfile.mkdtemp(prefix='p2d-serve')
+                path = os.path.join(tmpdir, '%s.zip' % name)
+                output = os.path.join(tmpdir, 'domjudge', '%s.zip' % name)
+                os.mkdir(os.path.dirname(output))
+                self.__receive(path, length)
+                result = self.server.pool.submit(_convert, path, output, options, self.server.problemsetdir).result()
+            except ValueError as err:
+                reply = 400, {'error': str(err)}
+            except Exception as err:
+                logging.exception('conversion of %s failed', name)
+                reply = 500, {'error': str(err)}
+            else:
+                reply = 422, result
+            # Counted before replying, so that the client sees the request
+            # in the statistics once it has the response.
+            ok = result is not None and result['errors'] == 0
+            stats.done(ok, time.perf_counter() - start if result else None, result['seconds'] if result else None)
+            if ok:
+                with open(output, 'rb') as f:
+                    self.__reply(200, f, 'application/zip',
+                                 {'Content-Disposition': 'attachment; filename="%s.zip"' % name,
+                                  'X-P2D-Warnings': str(result['warnings'])})
+            else:
+                self.__reply(*reply)
+        finally:
+            if tmpdir is not None:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(_Server):
+    address_family = getattr(socket, 'AF_UNIX', None)
+
+    def server_bind(self):
+        # HTTPServer.server_bind() expects a (host, port) address.
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+
+class ConversionServer(object):
+    """HTTP server converting packages on a pool of worker processes.
+
+    Conversion requests beyond workers + queue_size pending ones are
+    rejected with 503, so the queue stays bounded.
+    """
+
+    def __init__(self, address=('127.0.0.1', 8080), unix_socket=None, workers=None, queue_size=16,
+                 problemsetdir=None, max_upload=1 << 30):
+        workers = workers or os.cpu_count() or 1
+        if unix_socket is not None:
+            if os.path.exists(unix_socket) and stat.S_ISSOCK(os.stat(unix_socket).st_mode):
+                os.remove(unix_socket)  # left by a server that was killed
+            self.httpd = _UnixServer(unix_socket, RequestHandler)
+        else:
+            self.httpd = _Server(address, RequestHandler)
+        # The workers load the configurations on their first conversion.
+        self.httpd.pool = concurrent.futures.ProcessPoolExecutor(workers)
+        self.httpd.problemsetdir = problemsetdir
+        self.httpd.stats = Stats(workers, workers + queue_size)
+        self.httpd.max_upload = max_upload
+        self.unix_socket = unix_socket
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def close(self):
+        """Stop serving (if serve_forever() runs in another thread) and
+        release the pool.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.httpd.pool.shutdown()
+        if self.unix_socket is not None and os.path.exists(self.unix_socket):
+            os.remove(self.unix_socket)
+
+
+def argparser():
+    parser = ArgumentParser(prog='p2d serve', description='Serve conversions of Polygon packages over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on (default: 8080)')
+    parser.add_argument('--unix', metavar='PATH', help='listen on this Unix socket instead')
+    parser.add_argument('-j', '--workers', type=int, default=0,
+                        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help='number of conversions waiting for a worker before rejecting requests (default: 16)')
+    parser.add_argument('--problemset', metavar='DIR', help='problemset directory whose problems.yaml to use')
+    parser.add_argument('-l', '--log_level', default='info',
+                        help='set log level (debug, info, warning, error, critical)')
+    return parser
+
+
+def main(argv=None):
+    args = argparser().parse_args(argv)
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
+                        level=getattr(logging, args.log_level.upper()))
+    problemsetdir = os.path.realpath(args.problemset) if args.problemset else None
+    server = ConversionServer((args.host, args.port), args.unix, args.workers, args.queue_size, problemsetdir)
+    logging.info('Serving on %s', args.unix or 'http://%s:%d' % server.address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
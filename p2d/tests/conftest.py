@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmpdir, monkeypatch):
+    """Keep the persistent caches of the tests out of the user's cache."""
+    monkeypatch.setenv('P2D_CACHE_DIR', str(tmpdir.join('p2d-cache')))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir.join('xdg-cache')))
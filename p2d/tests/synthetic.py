@@ -0,0 +1,168 @@
+"""Generator of synthetic Polygon packages, for tests and benchmarks."""
+import hashlib
+import os
+import random
+
+CHECKER = '''#include "testlib.h"
+
+int main(int argc, char *argv[]) {
+    registerTestlibCmd(argc, argv);
+    while (!ans.seekEof()) {
+        if (ouf.readToken() != ans.readToken())
+            quitf(_wa, "tokens differ");
+    }
+    quitf(_ok, "ok");
+}
+'''
+
+CUSTOM_CHECKER = CHECKER.replace('"tokens differ"', '"custom checker: tokens differ"')
+
+# Just enough of testlib for CHECKER to compile.
+TESTLIB = '''#ifndef TESTLIB_H
+#define TESTLIB_H
+// testlib stub for synthetic packages
+#include <cstdio>
+#include <cstdlib>
+#include <string>
+
+enum TResult { _ok = 0, _wa = 1 };
+
+struct InStream {
+    FILE *file = nullptr;
+    bool seekEof() {
+        int c;
+        while ((c = std::fgetc(file)) == ' ' || c == '\\n' || c == '\\r' || c == '\\t') {}
+        if (c == EOF)
+            return true;
+        std::ungetc(c, file);
+        return false;
+    }
+    std::string readToken() {
+        std::string token;
+        int c;
+        seekEof();
+        while ((c = std::fgetc(file)) != EOF && c > ' ')
+            token += (char)c;
+        return token;
+    }
+};
+
+InStream inf, ouf, ans;
+
+inline void registerTestlibCmd(int argc, char *argv[]) {
+    if (argc < 4)
+        std::exit(3);
+    inf.file = std::fopen(argv[1], "r");
+    ouf.file = std::fopen(argv[2], "r");
+    ans.file = std::fopen(argv[3], "r");
+}
+
+inline void quitf(TResult result, const char *msg) {
+    std::fprintf(stderr, "%s\\n", msg);
+    std::exit(result == _ok ? 0 : 1);
+}
+#endif
+'''
+
+SOLUTIONS = [('main.cpp', 'MAIN'), ('ok.py', 'ACCEPTED'), ('wa.cpp', 'WRONG_ANSWER'),
+             ('tle.cpp', 'TIME_LIMIT_EXCEEDED'), ('mle.cpp', 'MEMORY_LIMIT_EXCEEDED')]
+
+
+def _numbers(rng, size, crlf=False):
+    """Return about size bytes of lines of random numbers."""
+    newline = '\r\n' if crlf else '\n'
+    lines = []
+    length = 0
+    while length < size:
+        line = ' '.join(str(rng.randrange(10 ** 9)) for _ in range(8)) + newline
+        lines.append(line)
+        length += len(line)
+    return ''.join(lines)
+
+
+def make_problem(probdir, name, tests=10, test_size=4096, answer_size=64, solutions=3,
+                 custom_checker=False, crlf_tests=0, rng=None):
+    """Write a Polygon package in probdir.
+
+    Args:
+        probdir (str): directory of the package, created if needed.
+        name (str): full name of the problem.
+        tests (int): number of tests, each with its answer (.a).
+        test_size (int): approximate size of each test, in bytes.
+        answer_size (int): approximate size of each answer, in bytes.
+        solutions (int): number of solutions, see SOLUTIONS.
+        custom_checker (bool): use a checker that matches no entry of
+            checkers.yaml instead of the std::synthetic one.
+        crlf_tests (int): number of tests using '\\r\\n' line breaks.
+        rng (random.Random): source of the content, for reproducibility.
+    """
+    rng = rng or random.Random(0)
+    for subdir in ('tests', 'solutions', 'files'):
+        os.makedirs(os.path.join(probdir, subdir), exist_ok=True)
+    checker = 'check.cpp' if custom_checker else 'synthetic.cpp'
+    with open(os.path.join(probdir, 'files', checker), 'w', encoding='utf-8') as f:
+        f.write(CUSTOM_CHECKER if custom_checker else CHECKER)
+    test_list = ''.join('<test method="manual"%s/>' % (' sample="true"' if i == 0 else '') for i in range(tests))
+    with open(os.path.join(probdir, 'problem.xml'), 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8" standalone="no"?>\n'
+                '<problem revision="1" short-name="%s">\n'
+                '  <names><name language="english" value="%s"/></names>\n'
+                '  <judging cpu-name="Intel(R) Core(TM) i3-8100 CPU @ 3.60GHz" cpu-speed="3600">\n'
+                '    <testset name="tests"><time-limit>1000</time-limit><memory-limit>268435456</memory-limit>'
+                '<test-count>%d</test-count><input-path-pattern>tests/%%02d</input-path-pattern>'
+                '<answer-path-pattern>tests/%%02d.a</answer-path-pattern><tests>%s</tests></testset>\n'
+                '  </judging>\n'
+                '  <assets><checker name="%s" type="testlib"><source path="files/%s" type="cpp.g++17"/></checker>'
+                '</assets>\n'
+                '</problem>\n' % (os.path.basename(probdir), name, tests, test_list,
+                                  'check.cpp' if custom_checker else 'std::synthetic.cpp', checker))
+    for i in range(1, tests + 1):
+        with open(os.path.join(probdir, 'tests', '%02d' % i), 'w', encoding='utf-8', newline='') as f:
+            f.write(_numbers(rng, test_size, crlf=i <= crlf_tests))
+        with open(os.path.join(probdir, 'tests', '%02d.a' % i), 'w', encoding='utf-8', newline='') as f:
+            f.write(_numbers(rng, answer_size))
+    for filename, tag in SOLUTIONS[:solutions]:
+        with open(os.path.join(probdir, 'solutions', filename), 'w', encoding='utf-8') as f:
+            f.write('// %s solution of %s\nint main() { return 0; }\n' % (tag, name))
+        with open(os.path.join(probdir, 'solutions', filename + '.desc'), 'w', encoding='utf-8') as f:
+            f.write('File name: %s\nTag: %s\n' % (filename, tag))
+
+
+def make_problemset(problemsetdir, config_home, problems=3, seed=0, custom_checkers=0, **kwargs):
+    """Write a problemset of synthetic Polygon packages with its
+    problems.yaml, and the p2d configuration needed to convert it.
+
+    Args:
+        problemsetdir (str): directory of the problemset.
+        config_home (str): directory to use as $XDG_CONFIG_HOME when
+            running p2d: a checkers.yaml mapping the checker of the
+            problems to the default validator and a misc.yaml pointing
+            to a testlib.h are written in its polygon2domjudge directory.
+        problems (int): number of problems.
+        seed (int): seed of the content of the tests.
+        custom_checkers (int): number of problems with a custom checker.
+        kwargs: passed to make_problem().
+
+    Returns:
+        the names of the problems.
+    """
+    rng = random.Random(seed)
+    names = ['P%02d' % i for i in range(problems)]
+    os.makedirs(problemsetdir, exist_ok=True)
+    with open(os.path.join(problemsetdir, 'problems.yaml'), 'w', encoding='utf-8') as f:
+        for i, name in enumerate(names):
+            f.write('%s:\n  probid: %s\n  color: "#%06X"\n  samples: 1\n' % (name, name, rng.randrange(1 << 24)))
+    for i, name in enumerate(names):
+        make_problem(os.path.join(problemsetdir, name), 'Synthetic problem %d' % i,
+                     custom_checker=i < custom_checkers, rng=rng, **kwargs)
+
+    p2d_config = os.path.join(config_home, 'polygon2domjudge')
+    os.makedirs(p2d_config, exist_ok=True)
+    with open(os.path.join(p2d_config, 'testlib.h'), 'w', encoding='utf-8') as f:
+        f.write(TESTLIB)
+    with open(os.path.join(p2d_config, 'checkers.yaml'), 'w', encoding='utf-8') as f:
+        f.write('synthetic:\n  md5sum: %s\n  validator_flags: space_change_sensitive\n' %
+                hashlib.md5(CHECKER.encode('utf-8')).hexdigest())
+    with open(os.path.join(p2d_config, 'misc.yaml'), 'w', encoding='utf-8') as f:
+        f.write('testlib: %s\n' % os.path.abspath(os.path.join(p2d_config, 'testlib.h')))
+    return names
@@ -0,0 +1,91 @@
+import concurrent.futures
+import logging
+import zipfile
+
+import pytest
+
+from p2d import api
+from p2d import manifest
+from p2d.tests import synthetic
+
+
+@pytest.fixture
+def problemset(tmpdir, monkeypatch):
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmpdir.join('config')))
+    monkeypatch.setenv('P2D_CACHE_DIR', str(tmpdir.join('cache')))
+    names = synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=2,
+                                      tests=3, crlf_tests=1)
+    return tmpdir.join('set'), names
+
+
+def members(path):
+    with zipfile.ZipFile(path) as z:
+        return {info.filename: info.CRC for info in z.infolist()}
+
+
+def test_convert_problem(problemset, tmpdir):
+    root, names = problemset
+    configs = api.Configs.load(str(root))
+    output = str(tmpdir.join('out', 'A.zip'))
+    tmpdir.join('out').ensure(dir=True)
+
+    result = api.convert_problem(str(root.join(names[0])), output, configs=configs)
+    assert result.ok and not result.skipped
+    assert (result.errors, result.warnings) == (0, 1)
+    assert result.messages == [('warning', 'test cases: The file %s contains non-standard line breaks.' %
+                                root.join(names[0], 'tests', '01'))]
+    assert 'data/secret/03.ans' in members(output)
+    assert tmpdir.join('out', 'A.manifest.json').isfile()
+
+    assert api.convert_problem(str(root.join(names[0])), output, configs=configs).skipped
+
+    result = api.convert_problem(str(root.join(names[0])), output, {'werror': True}, configs)
+    assert not result.ok and result.errors == 1
+
+    with pytest.raises(ValueError):
+        api.convert_problem(str(root.join(names[0])), output, {'no_such_option': 1}, configs)
+
+    result = api.convert_problem(str(root.join('missing')), output, configs=configs)
+    assert not result.ok
+
+
+def test_convert_problem_threads(problemset, tmpdir):
+    root, names = problemset
+    configs = api.Configs.load(str(root))
+    jobs = [(name, i, i % 2 == 1) for name in names for i in range(4)]
+
+    def convert(job):
+        name, i, werror = job
+        return api.convert_problem(str(root.join(name)), str(tmpdir.join('%s-%d.zip' % (name, i))),
+                                   {'werror': werror, 'threads': 2}, configs)
+
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(convert, jobs))
+
+    for (name, i, werror), result in zip(jobs, results):
+        if werror:
+            assert result.errors == 1 and not tmpdir.join('%s-%d.zip' % (name, i)).exists()
+        else:
+            assert (result.errors, result.warnings) == (0, 1)
+            assert members(result.output_path) == members(str(tmpdir.join('%s-0.zip' % name)))
+
+
+def test_duplicates_found_while_copying(problemset, tmpdir, monkeypatch, caplog):
+    root, names = problemset
+    tests = root.join(names[0], 'tests')
+    tests.join('02').copy(tests.join('03'))
+    tests.join('02.a').copy(tests.join('03.a'))
+    tmpdir.join('out').ensure(dir=True)
+
+    hash_file = manifest.hash_file
+
+    def hash_source(path):
+        assert 'tests' not in str(path), '%s read before being copied' % path
+        return hash_file(path)
+
+    monkeypatch.setattr(manifest, 'hash_file', hash_source)
+    caplog.set_level(logging.INFO)
+    result = api.convert_problem(str(root.join(names[0])), str(tmpdir.join('out', 'A.zip')),
+                                 configs=api.Configs.load(str(root)))
+    assert result.ok
+    assert ':   identical tests: 02 (secret), 03 (secret)' in caplog.messages
@@ -0,0 +1,416 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from p2d import archive
+from p2d import manifest
+from p2d import package
+from p2d import scan
+
+
+def test_zip_writer(tmpdir):
+    src = tmpdir.join('src')
+    src.write_binary(b'1 2\n')
+    path = str(tmpdir.join('prob.zip'))
+
+    writer = archive.ZipArchiveWriter(path)
+    writer.mkdir('data/sample')
+    writer.write_str('domjudge-problem.ini', 'probid = A\n')
+    writer.write_file('data/sample/01.in', str(src))
+    writer.close()
+    writer.abort()
+
+    assert sorted(os.listdir(str(tmpdir))) == ['prob.zip', 'src']
+    with zipfile.ZipFile(path) as z:
+        assert z.namelist() == ['data/', 'data/sample/', 'domjudge-problem.ini', 'data/sample/01.in']
+        assert z.read('domjudge-problem.ini') == b'probid = A\n'
+        assert z.read('data/sample/01.in') == b'1 2\n'
+
+
+def test_zip_writer_abort(tmpdir):
+    path = str(tmpdir.join('prob.zip'))
+
+    writer = archive.ZipArchiveWriter(path)
+    writer.write_str('problem.yaml', 'validation: default\n')
+    writer.abort()
+
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_directory_writer(tmpdir):
+    src = tmpdir.join('src')
+    src.write_binary(b'1 2\n')
+    root = tmpdir.join('pkg')
+
+    writer = archive.DirectoryArchiveWriter(str(root))
+    writer.mkdir('submissions/accepted')
+    writer.write_str('problem.yaml', 'validation: default\n')
+    writer.write_file('data/secret/02.in', str(src))
+    writer.close()
+
+    assert root.join('submissions', 'accepted').isdir()
+    assert root.join('problem.yaml').read_text('utf-8') == 'validation: default\n'
+    assert root.join('data', 'secret', '02.in').read_binary() == b'1 2\n'
+
+
+def test_write_file_scans(tmpdir):
+    src = tmpdir.join('src')
+    src.write_binary(b'1 2\r\n3')
+    scanner = scan.LineEndingScanner()
+
+    writer = archive.ZipArchiveWriter(str(tmpdir.join('prob.zip')))
+    writer.write_file('data/secret/01.in', str(src), scanner)
+    writer.close()
+
+    assert scanner.has_cr
+    assert not scanner.ends_with_newline
+    assert scanner.size == 6
+
+
+def test_zip_writer_reuses_unchanged_members(tmpdir, monkeypatch):
+    tests = tmpdir.mkdir('tests')
+    tests.join('01').write_binary(b'1 2\n' * 100)
+    tests.join('02').write_binary(b'3 4\n' * 100)
+    path = str(tmpdir.join('prob.zip'))
+
+    def build(previous=None):
+        package = manifest.Manifest(str(tmpdir), 'config')
+        writer = archive.ZipArchiveWriter(path, package, previous)
+        writer.write_file('data/secret/01.in', str(tests.join('01')))
+        writer.write_file('data/secret/02.in', str(tests.join('02')))
+        writer.close()
+        package.update([str(tests.join('01')), str(tests.join('02'))])
+        return package
+
+    previous = build()
+    tests.join('02').write_binary(b'5 6\n' * 100)
+
+    reused = []
+    write_raw = archive.ZipArchiveWriter._write_raw
+
+    def record_write_raw(self, info, chunks):
+        reused.append(info.filename)
+        write_raw(self, info, chunks)
+
+    monkeypatch.setattr(archive.ZipArchiveWriter, '_write_raw', record_write_raw)
+    build(previous)
+
+    assert reused == ['data/secret/01.in']
+    with zipfile.ZipFile(path) as z:
+        assert z.testzip() is None
+        assert z.read('data/secret/01.in') == b'1 2\n' * 100
+        assert z.read('data/secret/02.in') == b'5 6\n' * 100
+
+
+def test_compression_policy():
+    policy = archive.CompressionPolicy(level=6, sample_size=4096, min_ratio=0.9)
+    assert policy.compress_type(b'1 2\n' * 1000) == zipfile.ZIP_DEFLATED
+    assert policy.compress_type(os.urandom(4096)) == zipfile.ZIP_STORED
+    assert policy.compress_type(b'') == zipfile.ZIP_STORED
+    assert archive.CompressionPolicy(level=0).compress_type(b'1 2\n' * 1000) == zipfile.ZIP_STORED
+
+
+def test_zip_writer_policy(tmpdir):
+    text = tmpdir.join('text')
+    text.write_binary(b'1 2\n' * 1000)
+    binary = tmpdir.join('binary')
+    binary.write_binary(os.urandom(100000))
+    path = str(tmpdir.join('prob.zip'))
+
+    writer = archive.ZipArchiveWriter(path, policy=archive.CompressionPolicy(level=9))
+    writer.write_file('data/secret/01.in', str(text))
+    writer.write_file('data/secret/02.in', str(binary))
+    writer.close()
+
+    with zipfile.ZipFile(path) as z:
+        assert z.testzip() is None
+        assert z.getinfo('data/secret/01.in').compress_type == zipfile.ZIP_DEFLATED
+        assert z.getinfo('data/secret/02.in').compress_type == zipfile.ZIP_STORED
+        assert z.read('data/secret/02.in') == binary.read_binary()
+
+
+def test_zip_writer_threads(tmpdir, monkeypatch):
+    monkeypatch.setattr(scan, 'CHUNK_SIZE', 1000)
+    sources = []
+    for i in range(10):
+        src = tmpdir.join('%02d' % i)
+        src.write_binary(b''.join(b'%d %d\n' % (i, j) for j in range(i * 500)))
+        sources.append(src)
+
+    def build(path, threads):
+        writer = archive.ZipArchiveWriter(path, threads=threads)
+        writer.write_str('problem.yaml', 'validation: default\n')
+        for src in sources:
+            scanner = scan.LineEndingScanner()
+            writer.write_file('data/secret/%s.in' % src.basename, str(src), scanner)
+            assert scanner.size == src.size()
+        writer.close()
+        with zipfile.ZipFile(path) as z:
+            return [(i.filename, i.CRC, i.compress_type, i.compress_size) for i in z.infolist()]
+
+    assert build(str(tmpdir.join('single.zip')), 1) == build(str(tmpdir.join('parallel.zip')), 4)
+
+    with zipfile.ZipFile(str(tmpdir.join('parallel.zip'))) as z:
+        assert z.testzip() is None
+        for src in sources:
+            assert z.read('data/secret/%s.in' % src.basename) == src.read_binary()
+
+
+def test_zip_writer_threads_abort(tmpdir):
+    path = str(tmpdir.join('prob.zip'))
+    writer = archive.ZipArchiveWriter(path, threads=4)
+    writer.write_str('problem.yaml', 'validation: default\n')
+    with pytest.raises(FileNotFoundError):
+        writer.write_file('data/secret/01.in', str(tmpdir.join('missing')))
+    writer.abort()
+    assert os.listdir(str(tmpdir)) == []
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_zip_writer_write_files(tmpdir, monkeypatch, threads):
+    monkeypatch.setattr(scan, 'CHUNK_SIZE', 1000)
+    sources = []
+    for i in range(10):
+        src = tmpdir.join('%02d' % i)
+        src.write_binary(b''.join(b'%d %d\r\n' % (i, j) for j in range(i * 300)))
+        sources.append(src)
+
+    def build(path, io_threads):
+        writer = archive.ZipArchiveWriter(path, threads=threads, io_threads=io_threads)
+        scanners = [scan.LineEndingScanner() for _ in sources]
+        files = [('data/secret/%s.in' % src.basename, str(src), (scanner,)) for src, scanner in zip(sources, scanners)]
+        files.insert(3, ('data/secret/missing.in', str(tmpdir.join('missing')), ()))
+        results = writer.write_files(files)
+        with pytest.raises(FileNotFoundError):
+            results.pop(3).result()
+        for src, scanner, result in zip(sources, scanners, results):
+            result.result()
+            assert scanner.size == src.size()
+            assert scanner.has_cr == (src.size() > 0)
+        writer.close()
+        with zipfile.ZipFile(path) as z:
+            assert z.testzip() is None
+            return [(i.filename, i.CRC, i.compress_type, i.compress_size) for i in z.infolist()]
+
+    assert build(str(tmpdir.join('single.zip')), 1) == build(str(tmpdir.join('parallel.zip')), 4)
+
+
+def test_zip_writer_write_files_abort(tmpdir):
+    sources = []
+    for i in range(20):
+        src = tmpdir.join('%02d' % i)
+        src.write_binary(b'%d\n' % i)
+        sources.append(src)
+    path = str(tmpdir.join('prob.zip'))
+    writer = archive.ZipArchiveWriter(path, io_threads=4)
+    writer.write_files(('data/secret/%s.in' % src.basename, str(src), ()) for src in sources)
+    writer.abort()
+    assert not any(name.endswith('.tmp') or name.endswith('.zip') for name in os.listdir(str(tmpdir)))
+
+
+def test_directory_writer_write_files(tmpdir):
+    root = tmpdir.join('pkg')
+    files = []
+    for i in range(10):
+        src = tmpdir.join('%02d' % i)
+        src.write_binary(b'%d\n' % i)
+        files.append(('data/secret/%02d.in' % i, str(src), (scan.LineEndingScanner(),)))
+    files.append(('data/secret/missing.in', str(tmpdir.join('missing')), ()))
+
+    writer = archive.DirectoryArchiveWriter(str(root), io_threads=4)
+    results = writer.write_files(files)
+    with pytest.raises(FileNotFoundError):
+        results[-1].result()
+    for (arcname, src, (scanner,)), result in zip(files, results[:-1]):
+        result.result()
+        assert scanner.ends_with_newline
+        assert root.join(*arcname.split('/')).read_binary() == tmpdir.join(os.path.basename(src)).read_binary()
+
+
+def test_directory_writer_link(tmpdir):
+    src = tmpdir.join('src')
+    src.write_binary(b'1 2\r\n')
+    root = tmpdir.join('pkg')
+    scanner = scan.LineEndingScanner()
+
+    writer = archive.DirectoryArchiveWriter(str(root), link=True)
+    writer.write_file('data/secret/01.in', str(src), scanner)
+    assert scanner.has_cr and scanner.size == 5
+    assert root.join('data', 'secret', '01.in').read_binary() == b'1 2\r\n'
+
+    # Writing the member again must not write through the link.
+    writer.link = False
+    other = tmpdir.join('other')
+    other.write_binary(b'3\n')
+    writer.write_file('data/secret/01.in', str(other))
+    assert root.join('data', 'secret', '01.in').read_binary() == b'3\n'
+    assert src.read_binary() == b'1 2\r\n'
+
+
+def test_unpacked_writer(tmpdir):
+    src = tmpdir.join('src')
+    src.write_binary(b'1 2\n')
+    path = tmpdir.join('A-domjudge')
+    path.ensure('stale', dir=True)
+
+    writer = archive.UnpackedArchiveWriter(str(path))
+    writer.write_str('problem.yaml', 'validation: default\n')
+    writer.write_file('data/secret/01.in', str(src))
+    writer.close()
+    writer.abort()
+
+    assert sorted(os.listdir(str(tmpdir))) == ['A-domjudge', 'src']
+    assert sorted(os.listdir(str(path))) == ['data', 'problem.yaml']
+    assert path.join('data', 'secret', '01.in').read_binary() == b'1 2\n'
+
+    writer = archive.UnpackedArchiveWriter(str(path))
+    writer.write_str('problem.yaml', 'validation: custom\n')
+    writer.abort()
+    assert sorted(os.listdir(str(tmpdir))) == ['A-domjudge', 'src']
+    assert path.join('problem.yaml').read_text('utf-8') == 'validation: default\n'
+
+
+@pytest.mark.parametrize('io_threads', [1, 4])
+def test_zip_writer_copies_package_members(tmpdir, io_threads):
+    data = b'1 2 3\n' * 10000
+    path = str(tmpdir.join('A.zip'))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('problem.xml', '<problem/>')
+        z.writestr('tests/01', data)
+        z.writestr('tests/02', b'1\r\n', zipfile.ZIP_STORED)
+    pkg = package.open_package(path)
+
+    out = str(tmpdir.join('out.zip'))
+    writer = archive.ZipArchiveWriter(out, io_threads=io_threads)
+    scanners = [scan.LineEndingScanner(), scan.LineEndingScanner()]
+    futures = writer.write_files([('data/secret/01.in', pkg.source('tests/01'), (scanners[0],)),
+                                  ('data/secret/02.in', pkg.source('tests/02'), (scanners[1],))])
+    for future in futures:
+        future.result()
+    writer.close()
+    pkg.close()
+
+    assert (scanners[0].size, scanners[0].has_cr) == (len(data), False)
+    assert (scanners[1].size, scanners[1].has_cr) == (3, True)
+    with zipfile.ZipFile(path) as src, zipfile.ZipFile(out) as z:
+        assert z.testzip() is None
+        assert z.read('data/secret/01.in') == data
+        # Copied as is.
+        assert z.getinfo('data/secret/01.in').compress_size == src.getinfo('tests/01').compress_size
+
+
+def test_zip_writer_checks_package_crc(tmpdir):
+    path = str(tmpdir.join('A.zip'))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('problem.xml', '<problem/>')
+        z.writestr('tests/01', b'1 2 3\n' * 100)
+    pkg = package.open_package(path)
+    pkg.source('tests/01').info.CRC ^= 1
+
+    writer = archive.ZipArchiveWriter(str(tmpdir.join('out.zip')))
+    with pytest.raises(zipfile.BadZipFile):
+        writer.write_file('data/secret/01.in', pkg.source('tests/01'))
+    writer.abort()
+    pkg.close()
+
+
+class _Pipe(object):
+    """A stream which can only be written to, like a pipe."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_zip_writer_stream(tmpdir, threads):
+    data = b'1 2 3\n' * 100000
+    path = str(tmpdir.join('A.zip'))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('problem.xml', '<problem/>')
+        z.writestr('tests/01', data)
+    src = tmpdir.join('02')
+    src.write_binary(os.urandom(1000) + data)
+    pkg = package.open_package(path)
+
+    pipe = _Pipe()
+    writer = archive.ZipArchiveWriter('-', threads=threads, io_threads=threads, stream=pipe)
+    writer.write_str('problem.yaml', 'validation: default\n')
+    for future in writer.write_files([('data/secret/01.in', pkg.source('tests/01'), ()),
+                                      ('data/secret/02.in', str(src), ())]):
+        if future is not None:
+            future.result()
+    writer.close()
+    pkg.close()
+
+    assert sorted(os.listdir(str(tmpdir))) == ['02', 'A.zip']
+    with zipfile.ZipFile(io.BytesIO(bytes(pipe.data))) as z:
+        assert z.testzip() is None
+        assert z.namelist() == ['problem.yaml', 'data/', 'data/secret/', 'data/secret/01.in', 'data/secret/02.in']
+        assert z.read('data/secret/01.in') == data
+        assert z.read('data/secret/02.in') == src.read_binary()
+        # The CRC and sizes of the members compressed follow their data.
+        assert z.getinfo('data/secret/02.in').flag_bits & 0x08
+        assert z.getinfo('data/secret/02.in').compress_size < len(data)
+
+
+def test_zip_writer_stream_abort():
+    pipe = _Pipe()
+    writer = archive.ZipArchiveWriter('-', stream=pipe)
+    writer.write_str('problem.yaml', 'validation: default\n')
+    writer.abort()
+    with pytest.raises(zipfile.BadZipFile):
+        zipfile.ZipFile(io.BytesIO(bytes(pipe.data)))
+
+
+def test_estimate_sizes(tmpdir):
+    files = []
+    for i in range(4):
+        src = tmpdir.join('%02d' % i)
+        src.write_binary(os.urandom(300000) if i == 0 else b''.join(b'%d\n' % j for j in range(10000 * i)))
+        files.append(('data/secret/%02d.in' % i, str(src)))
+    path = str(tmpdir.join('out.zip'))
+    writer = archive.ZipArchiveWriter(path)
+    for arcname, src in files:
+        writer.write_file(arcname, src)
+    writer.close()
+
+    # The random data and the largest file are sampled, the others are
+    # estimated from them.
+    estimates = archive.estimate_sizes(files, archive.CompressionPolicy(), samples=2)
+    assert [size for size, _ in estimates] == [os.path.getsize(src) for _, src in files]
+    with zipfile.ZipFile(path) as z:
+        assert estimates[0][1] > z.getinfo(files[0][0]).compress_size
+        assert z.getinfo(files[3][0]).compress_size < estimates[3][1] < 2 * z.getinfo(files[3][0]).compress_size
+        assert estimates[1][1] > z.getinfo(files[1][0]).compress_size
+
+
+def test_split_writer(tmpdir):
+    src = tmpdir.join('src')
+    src.write_binary(b'1 2\n')
+    paths = [str(tmpdir.join('prob.zip')), str(tmpdir.join('prob.data-1.zip'))]
+    writer = archive.SplitArchiveWriter([archive.ZipArchiveWriter(_) for _ in paths], {'02': 1})
+    writer.write_str('problem.yaml', 'validation: default\n')
+    scanner = scan.LineEndingScanner()
+    writer.write_file('output_validators/checker/checker.cpp', str(src), scanner)
+    futures = writer.write_files([('data/sample/01.in', str(src), ()), ('data/secret/02.in', str(src), ()),
+                                  ('data/secret/03.in', str(src), ()), ('data/secret/04.in', str(tmpdir.join('x')), ())])
+    writer.close()
+
+    assert scanner.size == 4
+    assert [_.exception() is None for _ in futures] == [True, True, True, False]
+    with zipfile.ZipFile(paths[0]) as z:
+        assert z.namelist() == ['problem.yaml', 'output_validators/', 'output_validators/checker/',
+                                'output_validators/checker/checker.cpp', 'data/', 'data/sample/', 'data/sample/01.in',
+                                'data/secret/', 'data/secret/03.in']
+    with zipfile.ZipFile(paths[1]) as z:
+        assert [_ for _ in z.namelist() if not _.endswith('/')] == [
+            'problem.yaml', 'output_validators/checker/checker.cpp', 'data/secret/02.in']
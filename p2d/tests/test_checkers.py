@@ -1,9 +1,13 @@
+import hashlib
 import pytest
 import os
+import shutil
+import tempfile
 
-from unittest import TestCase
+from unittest import TestCase, mock
 
 from p2d import checkers
+from p2d import scan
 
 
 class Checker_test(TestCase):
@@ -141,3 +145,51 @@ class Checkers_test(TestCase):
         assert check == 'src2'
         check = checks.detect_checker(examples_path('src3.zpp'))
         assert check == 'src3'
+
+
+class Checkers_md5_test(TestCase):
+
+    def setUp(self):
+        self.__tmpdir = tempfile.mkdtemp()
+        self.__environ = mock.patch.dict(os.environ, {'P2D_CACHE_DIR': os.path.join(self.__tmpdir, 'cache')})
+        self.__environ.start()
+        checkers.Checkers._md5_cache = None
+
+    def tearDown(self):
+        self.__environ.stop()
+        checkers.Checkers._md5_cache = None
+        shutil.rmtree(self.__tmpdir)
+
+    def __write(self, name, content):
+        path = os.path.join(self.__tmpdir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_line_breaks(self):
+        expected = hashlib.md5(b'int main() {\n  return 0;\n}\n').hexdigest()
+        for content in [b'int main() {\n  return 0;\n}\n',
+                        b'int main() {\r\n  return 0;\r\n}\r\n',
+                        b'int main() {\r  return 0;\r}\r']:
+            assert checkers.Checkers._get_md5(self.__write('src.cpp', content)) == expected
+
+    def test_line_breaks_across_chunks(self):
+        content = b'// a comment\r\n' * 1000
+        expected = hashlib.md5(content.replace(b'\r\n', b'\n')).hexdigest()
+        with mock.patch.object(scan, 'CHUNK_SIZE', 13):
+            assert checkers.Checkers._hash_source(self.__write('src.cpp', content)) == expected
+
+    def test_not_utf8(self):
+        content = '// комментарий\n'.encode('cp1251')
+        assert checkers.Checkers._get_md5(self.__write('src.cpp', content)) == hashlib.md5(content).hexdigest()
+
+    def test_cache(self):
+        path = self.__write('src.cpp', b'int main() {}\n')
+        md5 = checkers.Checkers._get_md5(path)
+        with mock.patch.object(checkers.Checkers, '_hash_source') as hash_source:
+            checkers.Checkers._md5_cache = None
+            assert checkers.Checkers._get_md5(path) == md5
+            assert not hash_source.called
+        self.__write('src.cpp', b'int main() { return 0; }\n')
+        os.utime(path, ns=(0, 10 ** 9))
+        assert checkers.Checkers._get_md5(path) == hashlib.md5(b'int main() { return 0; }\n').hexdigest()
@@ -0,0 +1,37 @@
+import shutil
+
+import pytest
+
+from p2d import compiler
+from p2d.tests import synthetic
+
+pytestmark = pytest.mark.skipif(shutil.which('g++') is None, reason='g++ is not installed')
+
+
+def test_compile_check(tmpdir, monkeypatch):
+    monkeypatch.setenv('P2D_CACHE_DIR', str(tmpdir.join('cache')))
+    testlib = tmpdir.join('testlib.h')
+    testlib.write(synthetic.TESTLIB)
+    source = tmpdir.join('check.cpp')
+    source.write(synthetic.CHECKER)
+
+    check = compiler.CompileCheck(str(source), str(testlib), 'g++', '-x c++ -O0')
+    assert not check.cached
+    assert check.wait()[0]
+    check = compiler.CompileCheck(str(source), str(testlib), 'g++', '-x c++ -O0')
+    assert check.cached and check.wait()[0]
+    # Other flags are another compilation.
+    check = compiler.CompileCheck(str(source), str(testlib), 'g++', '-x c++ -O1')
+    assert not check.cached
+    check.close()
+
+    source.write(synthetic.CHECKER.replace('ans.readToken()', 'ans.readWord()'))
+    ok, output = compiler.CompileCheck(str(source), str(testlib), 'g++', '-x c++ -O0').wait()
+    assert not ok and 'readWord' in output
+
+
+def test_missing_compiler(tmpdir):
+    testlib = tmpdir.join('testlib.h')
+    testlib.write(synthetic.TESTLIB)
+    ok, output = compiler.CompileCheck(str(testlib), str(testlib), 'no-such-compiler', '').wait()
+    assert not ok and 'no-such-compiler not found' in output
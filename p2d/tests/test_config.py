@@ -1,5 +1,8 @@
+import os
+
 import pytest
 
+from p2d import cache
 from p2d import config
 
 
@@ -49,3 +52,30 @@ def test_update_dict():
 
     update_dict(dict1, dict3)
     assert dict1 == {'a': 0, 'b': 12, 'c': 3}
+
+
+def test_load_cached_config(monkeypatch, tmpdir):
+    monkeypatch.setenv('P2D_CACHE_DIR', str(tmpdir.join('cache')))
+    base = tmpdir.mkdir('base')
+    base.join('test.yaml').write('prop1: hello\nprop2: 5\n')
+    monkeypatch.setattr(config, '__config_file_paths', lambda *args: [str(base)] + list(args))
+
+    assert config.load_config('test.yaml') == {'prop1': 'hello', 'prop2': 5}
+    assert len(tmpdir.join('cache').listdir()) == 1
+    assert config.load_config('test.yaml') == {'prop1': 'hello', 'prop2': 5}
+
+    base.join('test.yaml').write('prop1: changed\nprop2: 5\n')
+    os.utime(str(base.join('test.yaml')), ns=(0, 10 ** 9))
+    assert config.load_config('test.yaml') == {'prop1': 'changed', 'prop2': 5}
+
+    override = tmpdir.mkdir('override')
+    assert config.load_config('test.yaml', str(override)) == {'prop1': 'changed', 'prop2': 5}
+    override.join('test.yaml').write('prop2: 6\n')
+    assert config.load_config('test.yaml', str(override)) == {'prop1': 'changed', 'prop2': 6}
+    # Every set of paths has an entry in the same cache file.
+    assert tmpdir.join('cache').listdir() == [tmpdir.join('cache', 'config.json')]
+
+    monkeypatch.setattr(config, 'CACHE_SIZE', 2)
+    for i in range(3):
+        config.load_config('test.yaml', str(tmpdir.mkdir('extra%d' % i)))
+    assert len(cache.load('config.json')) == 2
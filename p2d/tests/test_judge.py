@@ -0,0 +1,103 @@
+import shutil
+import sys
+
+import pytest
+
+from p2d import judge
+from p2d.tests import synthetic
+
+needs_gxx = pytest.mark.skipif(shutil.which('g++') is None, reason='g++ is not installed')
+
+CAT = '#include <cstdio>\nint main() { int c; while ((c = getchar()) != EOF) putchar(c); }\n'
+
+
+def test_default_validate():
+    assert judge.default_validate(b'1 2\n3\n', b'1  2 3')
+    assert not judge.default_validate(b'1 2\n3\n', b'1  2 3', 'space_change_sensitive')
+    assert judge.default_validate(b'YES\n', b'yes\n')
+    assert not judge.default_validate(b'YES\n', b'yes\n', 'case_sensitive')
+    assert not judge.default_validate(b'1 2', b'1 2 3')
+    assert not judge.default_validate(b'1.0001', b'1')
+    assert judge.default_validate(b'1.0001', b'1', 'float_tolerance 1e-3')
+    assert judge.default_validate(b'1000.5', b'1000', 'float_relative_tolerance 1e-3')
+    assert not judge.default_validate(b'1000.5', b'1000', 'float_absolute_tolerance 1e-3')
+    assert not judge.default_validate(b'abc', b'1', 'float_tolerance 1e-3')
+
+
+@needs_gxx
+def test_judge(tmpdir):
+    tests = []
+    for i in range(1, 4):
+        tmpdir.join('%02d' % i).write('%d %d\n' % (i, i * i))
+        tests.append(('%02d' % i, str(tmpdir.join('%02d' % i)), str(tmpdir.join('%02d' % i))))
+    sources = {'cat.cpp': CAT, 'cat.py': 'import sys\nsys.stdout.write(sys.stdin.read())\n',
+               'wa.c': '#include <stdio.h>\nint main(void) { puts("0 0"); return 0; }\n',
+               'rte.cpp': 'int main() { return 1; }\n', 'tle.cpp': 'int main() { for (;;) {} }\n',
+               'bad.cpp': 'int main() { return x; }\n', 'sol.java': 'class Main {}\n'}
+    for name, source in sources.items():
+        tmpdir.join(name).write(source)
+    expected = {'cat.cpp': 'accepted', 'cat.py': 'accepted', 'wa.c': 'wrong_answer', 'rte.cpp': 'run_time_error',
+                'tle.cpp': 'time_limit_exceed', 'bad.cpp': 'accepted', 'sol.java': 'accepted'}
+    solutions = [judge.Solution(name, str(tmpdir.join(name)), expected[name]) for name in sorted(sources)]
+    workdir = tmpdir.mkdir('work')
+    judger = judge.Judge(str(workdir), tests, 0.3, 256 << 20, 4, 'g++', '-x c++ -O0')
+    judger.judge(solutions)
+
+    solutions = {solution.name: solution for solution in solutions}
+    for name in ['cat.cpp', 'cat.py', 'wa.c', 'rte.cpp', 'tle.cpp']:
+        assert solutions[name].skipped is None
+        assert solutions[name].verdict == expected[name], name
+    assert len(solutions['cat.py'].runs) == 3
+    assert solutions['tle.cpp'].runs[0].seconds > 0.3
+    assert 'does not compile' in solutions['bad.cpp'].skipped
+    assert solutions['sol.java'].skipped == 'language not supported'
+
+    timelimit, solution, run = judge.suggest_timelimit(solutions.values(), 2)
+    assert solution.name in ('cat.cpp', 'cat.py')
+    assert timelimit == max(0.1, -(-run.seconds * 20 // 1) / 10)
+
+
+@needs_gxx
+def test_judge_checker(tmpdir):
+    tmpdir.join('01').write('1 2\n')
+    tmpdir.join('01.a').write('1 2\n')
+    tmpdir.join('testlib.h').write(synthetic.TESTLIB)
+    tmpdir.join('check.cpp').write(synthetic.CUSTOM_CHECKER)
+    tmpdir.join('cat.cpp').write(CAT)
+    tmpdir.join('wa.cpp').write('#include <cstdio>\nint main() { puts("1 3"); }\n')
+    workdir = tmpdir.mkdir('work')
+    judger = judge.Judge(str(workdir), [('01', str(tmpdir.join('01')), str(tmpdir.join('01.a')))], 1, None, 2,
+                         'g++', '-x c++ -O0')
+    judger.set_checker(str(tmpdir.join('check.cpp')), str(tmpdir.join('testlib.h')))
+    solutions = [judge.Solution('cat.cpp', str(tmpdir.join('cat.cpp')), 'accepted'),
+                 judge.Solution('wa.cpp', str(tmpdir.join('wa.cpp')), 'wrong_answer')]
+    judger.judge(solutions)
+    assert [solution.verdict for solution in solutions] == ['accepted', 'wrong_answer']
+
+
+def test_checker_timeout(tmpdir):
+    for name in ('01', '01.a', 'out'):
+        tmpdir.join(name).write('1 2\n')
+    checker = tmpdir.join('checker')
+    checker.write('#!/bin/sh\nsleep 10\n')
+    checker.chmod(0o755)
+    judger = judge.Judge(str(tmpdir.mkdir('work')), [], 1, None, 1, 'g++', '')
+    judger.checker, judger.wall_limit = str(checker), 0.02
+    with pytest.raises(judge.JudgeError, match='the checker failed'):
+        judger._check(str(tmpdir.join('01')), str(tmpdir.join('out')), str(tmpdir.join('01.a')))
+
+
+def test_run_process(tmpdir):
+    tmpdir.join('in').write('')
+    out = str(tmpdir.join('out'))
+    python = [sys.executable, '-c']
+    assert judge.run_process(python + ['import sys; sys.exit(3)'], str(tmpdir.join('in')), out, 10)[0] == 3
+    code, _, killed = judge.run_process(python + ['import os; os.kill(os.getpid(), 9)'], str(tmpdir.join('in')),
+                                        out, 10)
+    assert (code, killed) == (-9, False)
+    code, seconds, killed = judge.run_process(python + ['while True: pass'], str(tmpdir.join('in')), out, 0.5)
+    assert killed and code < 0 and seconds > 0.2
+    # The memory limit applies.
+    code = judge.run_process(python + ['x = bytearray(512 << 20)'], str(tmpdir.join('in')), out, 10, 256 << 20)[0]
+    assert code != 0
+    assert judge.run_process(python + ['x = bytearray(16 << 20)'], str(tmpdir.join('in')), out, 10, 256 << 20)[0] == 0
@@ -0,0 +1,324 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import zipfile
+
+import pytest
+import yaml
+
+from p2d.tests import synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run_p2d(tmpdir, *args):
+    env = dict(os.environ, PYTHONPATH=ROOT, XDG_CONFIG_HOME=str(tmpdir.join('config')),
+               P2D_CACHE_DIR=str(tmpdir.join('cache')))
+    return subprocess.run([sys.executable, '-m', 'p2d.main', str(tmpdir.join('set'))] + list(args),
+                          cwd=str(tmpdir), env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          universal_newlines=True)
+
+
+def test_convert_synthetic_problemset(tmpdir):
+    names = synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=3,
+                                      custom_checkers=1, tests=4, test_size=2000, crlf_tests=1)
+
+    result = run_p2d(tmpdir, '-j', '2', '--metrics-json', 'metrics.json')
+    assert result.returncode == 0, result.stdout
+    report = json.loads(tmpdir.join('metrics.json').read_text('utf-8'))
+    assert sorted(report['problems'].keys()) == names
+    for name in names:
+        # domjudge-problem.ini, problem.yaml, the tests, the submissions
+        # and the custom checker with its testlib.h.
+        assert report['problems'][name]['total']['files'] == (15 if name == names[0] else 13)
+        assert report['problems'][name]['stages']['data']['bytes_read'] >= 4 * 2000
+    assert report['total']['files'] == sum(problem['total']['files'] for problem in report['problems'].values())
+    for name in names:
+        assert '%s finished: 0 errors, 1 warning' % name in result.stdout
+        with zipfile.ZipFile(str(tmpdir.join('%s.zip' % name))) as z:
+            assert z.testzip() is None
+            members = set(z.namelist())
+            assert {'data/sample/01.in', 'data/sample/01.ans', 'data/secret/04.in', 'data/secret/04.ans',
+                    'submissions/accepted/main.cpp', 'submissions/wrong_answer/wa.cpp'} <= members
+            assert (z.read('data/secret/03.in') ==
+                    tmpdir.join('set', name, 'tests', '03').read_binary())
+            problem_yaml = yaml.safe_load(z.read('problem.yaml'))
+            if name == names[0]:
+                assert problem_yaml == {'validation': 'custom'}
+                assert 'output_validators/checker/testlib.h' in members
+            else:
+                assert problem_yaml == {'validation': 'default', 'validator_flags': 'space_change_sensitive'}
+
+    result = run_p2d(tmpdir)
+    assert result.returncode == 0, result.stdout
+    assert result.stdout.count('Skip unchanged problem') == len(names)
+
+
+def test_convert_archive_packages(tmpdir):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=1, tests=3)
+    probdir = tmpdir.join('set', 'P00')
+    with zipfile.ZipFile(str(tmpdir.join('set', 'P00-5$linux.zip')), 'w', zipfile.ZIP_DEFLATED) as z:
+        for path in probdir.visit(lambda _: _.isfile()):
+            z.write(str(path), probdir.bestrelpath(path))
+    tests = {name: probdir.join('tests', name).read_binary() for name in ('01', '03')}
+    probdir.remove()
+
+    result = run_p2d(tmpdir)
+    assert result.returncode == 0, result.stdout
+    assert 'P00 finished: 0 errors, 0 warnings' in result.stdout
+    with zipfile.ZipFile(str(tmpdir.join('P00.zip'))) as z:
+        assert z.testzip() is None
+        assert z.read('data/sample/01.in') == tests['01'] and z.read('data/secret/03.in') == tests['03']
+        assert 'submissions/accepted/main.cpp' in z.namelist()
+
+    assert 'Skip unchanged problem' in run_p2d(tmpdir).stdout
+
+
+def test_archive_package_named_like_output(tmpdir):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=1, tests=3)
+    probdir = tmpdir.join('set', 'P00')
+    with zipfile.ZipFile(str(tmpdir.join('set', 'P00.zip')), 'w') as z:
+        for path in probdir.visit(lambda _: _.isfile()):
+            z.write(str(path), probdir.bestrelpath(path))
+    probdir.remove()
+    source = tmpdir.join('set', 'P00.zip').read_binary()
+
+    result = run_p2d(tmpdir, '-o', str(tmpdir.join('set')))
+    assert result.returncode == 0, result.stdout
+    assert tmpdir.join('set', 'P00.zip').read_binary() == source
+    with zipfile.ZipFile(str(tmpdir.join('set', 'P00-domjudge.zip'))) as z:
+        assert 'data/secret/03.in' in z.namelist()
+
+    assert 'Skip unchanged problem' in run_p2d(tmpdir, '-o', str(tmpdir.join('set'))).stdout
+
+
+def test_watch_broken_package(tmpdir):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=2, tests=2)
+    solutions = tmpdir.join('set', 'P00', 'solutions')
+    solutions.move(tmpdir.join('solutions'))
+    env = dict(os.environ, PYTHONPATH=ROOT, XDG_CONFIG_HOME=str(tmpdir.join('config')),
+               P2D_CACHE_DIR=str(tmpdir.join('cache')))
+    log = tmpdir.join('log')
+
+    def wait_for(text, count=1):
+        deadline = time.monotonic() + 30
+        while log.read_text('utf-8').count(text) < count:
+            assert process.poll() is None and time.monotonic() < deadline, log.read_text('utf-8')
+            time.sleep(0.05)
+
+    with log.open('w') as f:
+        process = subprocess.Popen([sys.executable, '-m', 'p2d.main', str(tmpdir.join('set')), '--watch',
+                                    '--debounce', '0.1'], cwd=str(tmpdir), env=env, stdout=f, stderr=subprocess.STDOUT)
+    try:
+        wait_for('Watching')
+        assert 'P00 finished: 1 error' in log.read_text('utf-8')
+        assert 'P01 finished: 0 errors' in log.read_text('utf-8')
+        # The watch goes on after a problem failed.
+        tmpdir.join('solutions').move(solutions)
+        wait_for('P00 finished: 0 errors')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def test_output_directories_in_problemset(tmpdir):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=1, tests=2)
+
+    for _ in range(2):
+        result = run_p2d(tmpdir, '-f', 'dir', '-o', str(tmpdir.join('set')))
+        assert result.returncode == 0, result.stdout
+        assert tmpdir.join('set', 'P00-domjudge', 'domjudge-problem.ini').isfile()
+        assert 'Loading problem P00-domjudge' not in result.stdout
+
+
+def test_lint(tmpdir):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=1, tests=3)
+    tmpdir.join('set', 'P00', 'tests', '02').write_binary(b'1\t2 \n')
+
+    result = run_p2d(tmpdir, '--lint')
+    assert result.returncode == 0, result.stdout
+    assert 'tests/02 has trailing whitespace' in result.stdout and 'tests/02 contains tabs' in result.stdout
+    index = json.loads(tmpdir.join('P00.tests.json').read_text('utf-8'))['tests']
+    assert sorted(index.keys())[:2] == ['data/sample/01.ans', 'data/sample/01.in']
+    assert index['data/secret/02.in'] == {'size': 5, 'lines': 1, 'max_line_length': 4,
+                                          'issues': ['trailing_whitespace', 'tab']}
+
+    assert run_p2d(tmpdir).returncode == 0
+    assert not tmpdir.join('P00.tests.json').exists()
+
+
+def test_dedup(tmpdir):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=1, tests=5)
+    tests = tmpdir.join('set', 'P00', 'tests')
+    for src, dst in [('01', '04'), ('02', '05')]:
+        tests.join(src).copy(tests.join(dst))
+        tests.join(src + '.a').copy(tests.join(dst + '.a'))
+
+    result = run_p2d(tmpdir)
+    assert 'identical tests: 01 (sample), 04 (secret)' in result.stdout
+    assert 'identical tests: 02 (secret), 05 (secret)' in result.stdout
+    with zipfile.ZipFile(str(tmpdir.join('P00.zip'))) as z:
+        assert 'data/secret/04.in' in z.namelist()
+
+    result = run_p2d(tmpdir, '--dedup')
+    assert result.returncode == 0, result.stdout
+    assert 'drop secret test 04, the same as 01' in result.stdout
+    with zipfile.ZipFile(str(tmpdir.join('P00.zip'))) as z:
+        data = [_ for _ in z.namelist() if _.endswith('.in')]
+    assert data == ['data/sample/01.in', 'data/secret/02.in', 'data/secret/03.in']
+
+
+def test_max_archive_size(tmpdir):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=1, tests=6,
+                              test_size=100000)
+    result = run_p2d(tmpdir, '--max-archive-size', '1K')
+    assert result.returncode != 0
+    assert 'more than the 1 KiB allowed' in result.stdout
+    assert not tmpdir.join('P00.zip').exists()
+
+    result = run_p2d(tmpdir, '--max-archive-size', '1M')
+    assert result.returncode == 0, result.stdout
+    assert tmpdir.join('P00.zip').exists()
+
+
+def test_split(tmpdir):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=1, tests=8,
+                              test_size=100000)
+    result = run_p2d(tmpdir, '--max-archive-size', '150K', '--split')
+    assert result.returncode == 0, result.stdout
+    parts = sorted(_.basename for _ in tmpdir.listdir('P00.data-*.zip'))
+    assert len(parts) > 1
+    secret = []
+    for part in parts:
+        assert tmpdir.join(part).size() <= 150 * 1024
+        with zipfile.ZipFile(str(tmpdir.join(part))) as z:
+            assert 'domjudge-problem.ini' in z.namelist()
+            secret += [_ for _ in z.namelist() if _.startswith('data/secret/') and _.endswith('.in')]
+    assert len(secret) == len(set(secret)) == 7
+
+
+def test_compile(tmpdir):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=2, custom_checkers=1,
+                              tests=2)
+    result = run_p2d(tmpdir, '--compile')
+    assert result.returncode == 0, result.stdout
+    assert 'compilation cached' not in result.stdout
+
+    # Unchanged checkers are not compiled again.
+    result = run_p2d(tmpdir, '--compile', '--force')
+    assert result.returncode == 0, result.stdout
+    assert 'checker compilation cached' in result.stdout
+
+    checker = tmpdir.join('set', 'P00', 'files', 'check.cpp')
+    checker.write(checker.read().replace('quitf(_ok', 'quitf(_accepted'))
+    result = run_p2d(tmpdir, '--compile')
+    assert result.returncode != 0
+    assert 'in output validators: the checker does not compile' in result.stdout
+    assert '_accepted' in result.stdout
+
+
+def test_verify(tmpdir):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=1, tests=3)
+    probdir = tmpdir.join('set', 'P00')
+    for i in range(1, 4):
+        probdir.join('tests', '%02d' % i).copy(probdir.join('tests', '%02d.a' % i))
+    probdir.join('solutions', 'main.cpp').write(
+        '#include <cstdio>\nint main() { int c; while ((c = getchar()) != EOF) putchar(c); }\n')
+    probdir.join('solutions', 'ok.py').write('import sys\nsys.stdout.write(sys.stdin.read())\n')
+    probdir.join('solutions', 'wa.cpp').write('#include <cstdio>\nint main() { puts("0"); }\n')
+
+    result = run_p2d(tmpdir, '--verify')
+    assert result.returncode == 0, result.stdout
+    assert 'P00 finished: 0 errors, 0 warnings' in result.stdout
+    assert 'Suggested timelimit:' in result.stdout
+    report = json.loads(tmpdir.join('P00.verify.json').read_text('utf-8'))
+    assert {name: solution['verdict'] for name, solution in report['solutions'].items()} == {
+        'main.cpp': 'accepted', 'ok.py': 'accepted', 'wa.cpp': 'wrong_answer'}
+    assert len(report['solutions']['main.cpp']['runs']) == 3
+    assert report['suggested_timelimit'] >= 0.1
+
+    # Unknown tags are reported once, and taken as accepted.
+    probdir.join('solutions', 'wa.cpp.desc').write('File name: wa.cpp\nTag: BOGUS\n')
+    result = run_p2d(tmpdir, '--verify')
+    assert 'wa.cpp is expected to be accepted but is wrong_answer on test 01' in result.stdout
+    assert result.stdout.count('Unknown tag: BOGUS') == 1
+    assert 'P00 finished: 0 errors, 2 warnings' in result.stdout
+
+    result = run_p2d(tmpdir, '--force')
+    assert not tmpdir.join('P00.verify.json').exists()
+
+
+def test_output_to_stdout(tmpdir):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=1, tests=3)
+    env = dict(os.environ, PYTHONPATH=ROOT, XDG_CONFIG_HOME=str(tmpdir.join('config')),
+               P2D_CACHE_DIR=str(tmpdir.join('cache')))
+    result = subprocess.run([sys.executable, '-m', 'p2d.main', str(tmpdir.join('set')), '-o', '-', '-t', '2'],
+                            cwd=str(tmpdir), env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert result.returncode == 0, result.stderr
+    assert b'P00 finished: 0 errors' in result.stderr
+    with zipfile.ZipFile(io.BytesIO(result.stdout)) as z:
+        assert z.testzip() is None
+        assert 'data/secret/03.in' in z.namelist()
+    # Nothing is written next to the package.
+    assert sorted(_.basename for _ in tmpdir.listdir()) == ['cache', 'config', 'set']
+
+    synthetic.make_problem(str(tmpdir.join('set', 'P01')), 'Another problem', tests=1)
+    result = subprocess.run([sys.executable, '-m', 'p2d.main', str(tmpdir.join('set')), '-o', '-'],
+                            cwd=str(tmpdir), env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert result.returncode == 1 and result.stdout == b''
+    assert b'writes the zip of a single problem' in result.stderr
+
+    # The zip of a failed conversion is left incomplete.
+    tmpdir.join('set', 'P01').remove()
+    tmpdir.join('set', 'P00', 'tests', '03.a').remove()
+    result = subprocess.run([sys.executable, '-m', 'p2d.main', str(tmpdir.join('set')), '-o', '-'],
+                            cwd=str(tmpdir), env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert result.returncode == 1
+    with pytest.raises(zipfile.BadZipFile):
+        zipfile.ZipFile(io.BytesIO(result.stdout))
+
+
+def test_compile_default_validation(tmpdir):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=2, tests=2)
+    problems_yaml = tmpdir.join('set', 'problems.yaml')
+    problems_yaml.write(problems_yaml.read().replace('P00:\n', 'P00:\n  validation: default\n'))
+    # Only custom validators are compiled: none is here, or this would fail.
+    tmpdir.join('config', 'polygon2domjudge', 'misc.yaml').write('compiler: no-such-compiler\n', mode='a')
+
+    result = run_p2d(tmpdir, '--compile')
+    assert result.returncode == 0, result.stdout
+    assert 'P00 finished: 0 errors' in result.stdout
+    assert 'P01 finished: 0 errors' in result.stdout
+    assert 'find std checker: std::synthetic' in result.stdout
+
+
+@pytest.mark.parametrize('io_threads', ['1', '4'])
+def test_corrupted_archive_package(tmpdir, io_threads):
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=2, tests=3,
+                              test_size=50000)
+    probdir = tmpdir.join('set', 'P00')
+    path = str(tmpdir.join('set', 'P00.zip'))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for src in probdir.visit(lambda _: _.isfile()):
+            z.write(str(src), probdir.bestrelpath(src))
+    probdir.remove()
+    with zipfile.ZipFile(path) as z:
+        info = z.getinfo('tests/02')
+    with open(path, 'r+b') as f:
+        # Damage the compressed data of the test.
+        f.seek(info.header_offset + 30 + len(info.filename) + info.compress_size // 2)
+        data = f.read(16)
+        f.seek(-16, os.SEEK_CUR)
+        f.write(bytes(255 - _ for _ in data))
+
+    result = run_p2d(tmpdir, '-j', '2', '--io-threads', io_threads)
+    assert result.returncode == 1
+    assert 'Traceback' not in result.stdout
+    # Reported with the test, or while writing the next ones.
+    assert 'in test cases: cannot read' in result.stdout and 'P00.zip/tests/02' in result.stdout
+    assert 'P00 finished: 1 error' in result.stdout
+    assert 'P01 finished: 0 errors' in result.stdout
+    assert not tmpdir.join('P00.zip').exists() and tmpdir.join('P01.zip').exists()
@@ -0,0 +1,55 @@
+import os
+
+from p2d import manifest
+
+
+def make_problem(tmpdir):
+    tmpdir.join('problem.xml').write_binary(b'<problem/>')
+    tmpdir.mkdir('tests').join('01').write_binary(b'1 2\n')
+    return [str(tmpdir.join('problem.xml')), str(tmpdir.join('tests', '01'))]
+
+
+def test_roundtrip(tmpdir):
+    files = make_problem(tmpdir)
+    path = str(tmpdir.join('A.manifest.json'))
+
+    package = manifest.Manifest(str(tmpdir), 'config')
+    package.update(files)
+    package.save(path)
+
+    loaded = manifest.Manifest.load(path, str(tmpdir))
+    assert loaded.files == package.files
+    assert sorted(loaded.files.keys()) == ['problem.xml', 'tests/01']
+    assert not loaded.changed(files, 'config')
+    assert loaded.changed(files, 'other config')
+    assert loaded.changed(files[:1], 'config')
+
+
+def test_load_missing(tmpdir):
+    assert manifest.Manifest.load(str(tmpdir.join('missing.json')), str(tmpdir)) is None
+    tmpdir.join('broken.json').write('{')
+    assert manifest.Manifest.load(str(tmpdir.join('broken.json')), str(tmpdir)) is None
+
+
+def test_hasher_is_used(tmpdir):
+    files = make_problem(tmpdir)
+    package = manifest.Manifest(str(tmpdir), 'config')
+    hasher = package.hasher(files[1])
+    hasher.feed(b'1 2\n')
+    package.update(files)
+    assert package.files['tests/01']['sha256'] == manifest.hash_file(files[1])
+
+
+def test_changed_content(tmpdir):
+    files = make_problem(tmpdir)
+    package = manifest.Manifest(str(tmpdir), 'config')
+    package.update(files)
+
+    st = os.stat(files[1])
+    os.utime(files[1], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert not package.changed(files, 'config')
+    assert package.refreshed
+    assert package.files['tests/01']['mtime_ns'] == st.st_mtime_ns + 10 ** 9
+
+    tmpdir.join('tests', '01').write_binary(b'3 4\n')
+    assert package.changed(files, 'config')
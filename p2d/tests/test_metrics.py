@@ -0,0 +1,33 @@
+from p2d import metrics
+from p2d import scan
+
+
+def test_recorder(tmpdir):
+    src = tmpdir.join('src')
+    src.write_binary(b'x' * 1000)
+    recorder = metrics.Recorder()
+    with recorder.stage('data'):
+        scan.scan_file(str(src))
+        metrics.counters.written(300, files=2)
+    with recorder.stage('data'):
+        metrics.counters.written(100, files=1)
+    with recorder.stage('archive'):
+        pass
+
+    report = recorder.as_dict()
+    assert list(report['stages'].keys()) == ['data', 'archive']
+    data = report['stages']['data']
+    assert (data['bytes_read'], data['bytes_written'], data['files']) == (1000, 400, 3)
+    assert data['wall'] >= 0 and data['cpu'] >= 0
+    assert report['total']['bytes_written'] == 400
+    assert report['total']['peak_rss'] == max(stage['peak_rss'] for stage in report['stages'].values())
+
+
+def test_run_report():
+    problem = {'stages': {}, 'total': {'wall': 1.0, 'cpu': 0.5, 'bytes_read': 10, 'bytes_written': 20, 'files': 2,
+                                       'peak_rss': 0}}
+    report = metrics.run_report({'A': problem, 'B': problem}, 1.5)
+    assert report['problems'] == {'A': problem, 'B': problem}
+    total = report['total']
+    assert (total['wall'], total['cpu'], total['bytes_read'], total['bytes_written'], total['files']) == \
+        (1.5, 1.0, 20, 40, 4)
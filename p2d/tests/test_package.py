@@ -0,0 +1,79 @@
+import tarfile
+import tempfile
+import zipfile
+
+import pytest
+
+from p2d import package
+
+
+def make_zip(path, files):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, data in files.items():
+            z.writestr(name, data)
+
+
+def test_problem_name():
+    assert package.problem_name('/set/aplusb') == 'aplusb'
+    assert package.problem_name('/set/aplusb-3$linux.zip') == 'aplusb'
+    assert package.problem_name('/set/task-1.tar.gz') == 'task-1'
+
+
+def test_zip_package(tmpdir):
+    path = str(tmpdir.join('A-2$linux.zip'))
+    make_zip(path, {'A/problem.xml': '<problem/>', 'A/tests/01': '1\n', 'A/tests/01.a': '2\n',
+                    'A/solutions/ok.cpp': ''})
+    assert package.is_archive_package(path)
+
+    pkg = package.open_package(path)
+    assert pkg.is_archive and pkg.root == str(tmpdir)
+    assert pkg.listdir('tests') == ['01', '01.a']
+    assert pkg.isfile('problem.xml') and not pkg.isfile('tests')
+    with pkg.open('tests/01.a') as f:
+        assert f.read() == b'2\n'
+    assert pkg.source('tests/01').size == 2
+    with pytest.raises(FileNotFoundError):
+        pkg.open('tests/02')
+    with pytest.raises(FileNotFoundError):
+        pkg.listdir('statements')
+    pkg.close()
+
+
+def test_not_a_package(tmpdir):
+    path = str(tmpdir.join('A.zip'))
+    make_zip(path, {'domjudge-problem.ini': ''})
+    assert not package.is_archive_package(path)
+    with pytest.raises(ValueError):
+        package.open_package(path)
+
+    tmpdir.join('A-domjudge', 'domjudge-problem.ini').write('', ensure=True)
+    tmpdir.join('B', 'problem.xml').write('<problem/>', ensure=True)
+    assert not package.is_package(path) and not package.is_package(str(tmpdir.join('A-domjudge')))
+    assert package.is_package(str(tmpdir.join('B')))
+
+
+def test_tar_package(tmpdir):
+    tmpdir.join('A', 'problem.xml').write('<problem/>', ensure=True)
+    tmpdir.join('A', 'tests', '01').write('1 2\n', ensure=True)
+    path = str(tmpdir.join('A.tar.gz'))
+    with tarfile.open(path, 'w:gz') as tar:
+        tar.add(str(tmpdir.join('A')), '.')
+
+    pkg = package.open_package(path)
+    assert pkg.listdir('') == ['problem.xml', 'tests']
+    with package.open_source(pkg.source('tests/01')) as f:
+        assert f.read() == b'1 2\n'
+    pkg.close()
+    assert tmpdir.listdir(lambda _: _.ext == '.tar') == []
+
+
+@pytest.mark.parametrize('suffix, magic', [('.tar.gz', b'\x1f\x8b\x08\x00'), ('.tar.bz2', b'BZh9'),
+                                           ('.tar.xz', b'\xfd7zXZ\x00')])
+def test_corrupted_tar_package(tmpdir, monkeypatch, suffix, magic):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmpdir.mkdir('tmp')))
+    path = str(tmpdir.join('A' + suffix))
+    tmpdir.join('A' + suffix).write_binary(magic + b'\x00' * 100)
+
+    with pytest.raises(ValueError):
+        package.open_package(path)
+    assert tmpdir.join('tmp').listdir() == []
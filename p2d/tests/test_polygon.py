@@ -0,0 +1,55 @@
+import io
+import os
+
+import pytest
+
+from p2d import polygon
+
+PROBLEM_XML = b'''<?xml version="1.0" encoding="utf-8" standalone="no"?>
+<problem revision="3" short-name="aplusb">
+  <names><name language="english" value="A + B"/><name language="russian" value="A + B"/></names>
+  <judging cpu-name="Intel(R) Core(TM) i3-8100 CPU @ 3.60GHz" cpu-speed="3600">
+    <testset name="tests">
+      <time-limit>2000</time-limit><memory-limit>268435456</memory-limit><test-count>3</test-count>
+      <input-path-pattern>tests/%02d</input-path-pattern><answer-path-pattern>tests/%02d.a</answer-path-pattern>
+      <tests><test method="manual" sample="true"/><test method="generated" cmd="gen 2"/><test sample="true"/></tests>
+    </testset>
+  </judging>
+  <assets>
+    <checker name="std::wcmp.cpp" type="testlib">
+      <source path="files/check.cpp" type="cpp.g++17"/>
+      <testset><tests><test sample="true"/></tests></testset>
+    </checker>
+    <interactor><source path="files/interactor.cpp" type="cpp.g++17"/></interactor>
+  </assets>
+</problem>
+'''
+
+
+def test_parse():
+    model = polygon.parse(io.BytesIO(PROBLEM_XML))
+    assert (model.short_name, model.revision, model.name) == ('aplusb', '3', 'A + B')
+    assert [_.language for _ in model.names] == ['english', 'russian']
+    testset = model.testset
+    assert (testset.name, testset.time_limit, testset.memory_limit, testset.test_count) == ('tests', 2000, 268435456, 3)
+    assert testset.input_path_pattern == 'tests/%02d' and testset.answer_path_pattern == 'tests/%02d.a'
+    # Not the tests of the checker.
+    assert testset.samples == [1, 3]
+    assert (model.checker.path, model.checker.type) == ('files/check.cpp', 'cpp.g++17')
+    assert model.interactor.path == 'files/interactor.cpp'
+
+
+def test_parse_invalid():
+    with pytest.raises(ValueError):
+        polygon.parse(io.BytesIO(b'<problem><names/></problem>'))
+
+
+def test_load_cache(tmpdir):
+    path = tmpdir.join('problem.xml')
+    path.write_binary(PROBLEM_XML)
+    model = polygon.load(str(path))
+    assert polygon.load(str(path)) is model
+
+    path.write_binary(PROBLEM_XML.replace(b'2000', b'1000'))
+    os.utime(str(path), ns=(1, 1))
+    assert polygon.load(str(path)).testset.time_limit == 1000
@@ -0,0 +1,69 @@
+from p2d import scan
+
+
+def scan_chunks(*chunks):
+    scanner = scan.LineEndingScanner()
+    for chunk in chunks:
+        scanner.feed(chunk)
+    return scanner
+
+
+def test_clean():
+    scanner = scan_chunks(b'1 2\n', b'3 4\n')
+    assert not scanner.has_cr
+    assert scanner.ends_with_newline
+    assert scanner.size == 8
+
+
+def test_empty():
+    scanner = scan_chunks()
+    assert not scanner.has_cr
+    assert scanner.ends_with_newline
+
+
+def test_carriage_return():
+    assert scan_chunks(b'1 2\r', b'\n').has_cr
+    assert scan_chunks(b'1 2\r\n3 4\n').has_cr
+
+
+def test_missing_final_newline():
+    assert not scan_chunks(b'1 2\n', b'3 4').ends_with_newline
+    assert scan_chunks(b'1 2\n3 4', b'\n', b'').ends_with_newline
+
+
+def test_scan_file(tmpdir, monkeypatch):
+    monkeypatch.setattr(scan, 'CHUNK_SIZE', 3)
+    path = tmpdir.join('01')
+    path.write_binary(b'\xff\xfe binary\r\ndata')
+    scanner = scan.LineEndingScanner()
+    scan.scan_file(str(path), scanner)
+    assert scanner.has_cr
+    assert not scanner.ends_with_newline
+    assert scanner.size == 15
+
+
+def lint_chunks(*chunks, max_line_length=1 << 20):
+    scanner = scan.LintScanner(max_line_length)
+    for chunk in chunks:
+        scanner.feed(chunk)
+    return scanner.stats()
+
+
+def test_lint_clean():
+    assert lint_chunks(b'1 2\n', b'3 4\n') == {'size': 8, 'lines': 2, 'max_line_length': 3, 'issues': []}
+    assert lint_chunks()['issues'] == ['empty']
+
+
+def test_lint_issues():
+    assert lint_chunks(b'1 2 \n3\n')['issues'] == ['trailing_whitespace']
+    assert lint_chunks(b'1\t2\r\n')['issues'] == ['cr', 'tab']
+    assert lint_chunks('é\n'.encode('utf-8'))['issues'] == ['non_ascii']
+    assert lint_chunks(b'1234\n12\n', max_line_length=3)['issues'] == ['long_line']
+    assert lint_chunks(b'1 2 ')['issues'] == ['no_final_newline', 'trailing_whitespace']
+
+
+def test_lint_across_chunks():
+    # Whitespace before a line break and a long line split across chunks.
+    stats = lint_chunks(b'1 2', b' ', b'\r', b'\n3 ', b'45', b'678\n9')
+    assert stats == {'size': 15, 'lines': 3, 'max_line_length': 7,
+                     'issues': ['cr', 'no_final_newline', 'trailing_whitespace']}
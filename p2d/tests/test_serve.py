@@ -0,0 +1,124 @@
+import io
+import json
+import os
+import socket
+import threading
+import urllib.error
+import urllib.request
+import zipfile
+
+import pytest
+
+from p2d import api
+from p2d import serve
+from p2d.tests import synthetic
+
+
+@pytest.fixture
+def server(tmpdir, monkeypatch):
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmpdir.join('config')))
+    monkeypatch.setenv('P2D_CACHE_DIR', str(tmpdir.join('cache')))
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=1, tests=3)
+    server = serve.ConversionServer(('127.0.0.1', 0), workers=1, queue_size=2, problemsetdir=str(tmpdir.join('set')))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.close()
+
+
+def zip_package(probdir, prefix=''):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as z:
+        for dirpath, _, filenames in os.walk(probdir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                z.write(path, prefix + os.path.relpath(path, probdir))
+    return data.getvalue()
+
+
+def request(server, path, data=None):
+    url = 'http://%s:%d%s' % (server.address[0], server.address[1], path)
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data, method='POST' if data else 'GET')) as r:
+            return r.status, r.read()
+    except urllib.error.HTTPError as err:
+        return err.code, err.read()
+
+
+def test_serve(server, tmpdir):
+    package = zip_package(str(tmpdir.join('set', 'P00')))
+
+    status, body = request(server, '/convert?name=P00', package)
+    assert status == 200
+    with zipfile.ZipFile(io.BytesIO(body)) as z:
+        assert 'data/secret/03.in' in z.namelist()
+        assert b'probid = P00' in z.read('domjudge-problem.ini')
+
+    # A package in a directory of the zip works too.
+    status, _ = request(server, '/convert?name=P00&compress_level=0',
+                        zip_package(str(tmpdir.join('set', 'P00')), 'P00/'))
+    assert status == 200
+
+    assert request(server, '/convert?name=../x', package)[0] == 400
+    assert request(server, '/convert?name=P00&bogus=1', package)[0] == 400
+    assert request(server, '/convert?name=P00&compress_level=99', package)[0] == 400
+    assert request(server, '/convert?name=P00&compress_level=x', package)[0] == 400
+    assert request(server, '/convert?name=P00', b'not a zip')[0] == 400
+
+    status, body = request(server, '/stats')
+    assert status == 200
+    stats = json.loads(body.decode('utf-8'))
+    assert (stats['completed'], stats['failed'], stats['rejected'], stats['queue_depth']) == (2, 1, 0, 0)
+    assert stats['latency']['count'] == 2 and stats['latency']['max'] >= stats['conversion']['max']
+
+
+def test_serve_errors(server, tmpdir):
+    tmpdir.join('set', 'P00', 'tests', '02').write_binary(b'1\r\n')
+    status, body = request(server, '/convert?name=P00&werror=true', zip_package(str(tmpdir.join('set', 'P00'))))
+    assert status == 422
+    result = json.loads(body.decode('utf-8'))
+    assert result['errors'] == 1 and result['messages'][0][0] == 'error'
+
+
+def test_reject_before_upload(server):
+    server.httpd.stats.pending = server.httpd.stats.max_pending
+    # The request is rejected without waiting for its body.
+    with socket.create_connection(server.address[:2], timeout=10) as sock:
+        sock.sendall(b'POST /convert?name=P00 HTTP/1.1\r\nHost: localhost\r\nContent-Length: 1000000\r\n\r\n')
+        assert sock.makefile('rb').readline().split()[1] == b'503'
+    server.httpd.stats.pending = 0
+
+
+def test_convert(tmpdir, monkeypatch):
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmpdir.join('config')))
+    # The configurations are loaded once per process.
+    monkeypatch.setattr(serve, '__configs', None)
+    synthetic.make_problemset(str(tmpdir.join('set')), str(tmpdir.join('config')), problems=1, tests=3)
+    tmpdir.join('P00.zip').write_binary(zip_package(str(tmpdir.join('set', 'P00'))))
+    output = str(tmpdir.join('out', 'P00.zip'))
+    tmpdir.mkdir('out')
+
+    convert_problem = api.convert_problem
+    options = []
+    monkeypatch.setattr(api, 'convert_problem', lambda *args: options.append(args[2]) or convert_problem(*args))
+
+    result = serve._convert(str(tmpdir.join('P00.zip')), output, {}, str(tmpdir.join('set')))
+    assert result['errors'] == 0
+    # Each worker converts a single problem at a time, on one thread.
+    assert (options[0]['threads'], options[0]['io_threads']) == (1, 1)
+    with zipfile.ZipFile(output) as z:
+        assert b'probid = P00' in z.read('domjudge-problem.ini')
+    with pytest.raises(ValueError):
+        serve._convert(str(tmpdir.join('set', 'problems.yaml')), output, {}, str(tmpdir.join('set')))
+
+
+def test_stats():
+    stats = serve.Stats(workers=1, max_pending=2)
+    assert stats.try_accept() and stats.try_accept()
+    assert not stats.try_accept()
+    assert (stats.as_dict()['running'], stats.as_dict()['queue_depth'], stats.as_dict()['rejected']) == (1, 1, 1)
+    stats.done(True, 2.0, 1.5)
+    stats.done(False, None, None)
+    summary = stats.as_dict()
+    assert (summary['completed'], summary['failed'], summary['queue_depth']) == (1, 1, 0)
+    assert summary['queue_wait']['max'] == 0.5
@@ -0,0 +1,57 @@
+import pytest
+
+from p2d import watch
+
+
+@pytest.fixture
+def tree(tmpdir):
+    tmpdir.join('A', 'tests', '01').write_binary(b'1\n', ensure=True)
+    tmpdir.join('B', 'problem.xml').write_binary(b'<problem/>', ensure=True)
+    return tmpdir
+
+
+def check_watcher(tree, watcher):
+    assert watcher.wait(0.05) == set()
+    tree.join('A', 'tests', '01').write_binary(b'22\n')
+    assert watcher.wait(1) == {'A'}
+    tree.join('C', 'tests', '01').write_binary(b'1\n', ensure=True)
+    tree.join('problems.yaml').write_binary(b'')
+    changed = set()
+    while True:
+        more = watcher.wait(0.2)
+        if not more:
+            break
+        changed |= more
+    assert changed == {'C', 'problems.yaml'}
+    # Directories created since the watch started are watched too.
+    tree.join('C', 'tests', '01').remove()
+    assert watcher.wait(1) == {'C'}
+
+
+def test_polling_watcher(tree, monkeypatch):
+    monkeypatch.setattr(watch, 'POLL_INTERVAL', 0.01)
+    check_watcher(tree, watch.PollingWatcher(str(tree)))
+
+
+def test_inotify_watcher(tree):
+    try:
+        watcher = watch.InotifyWatcher(str(tree))
+    except (OSError, AttributeError):
+        pytest.skip('inotify is not available')
+    try:
+        check_watcher(tree, watcher)
+    finally:
+        watcher.close()
+
+
+def test_debounced(tree, monkeypatch):
+    class FakeWatcher(object):
+        def __init__(self, events):
+            self.events = iter(events)
+
+        def wait(self, timeout=None):
+            return next(self.events)
+
+    changes = watch.debounced(FakeWatcher([{'A'}, {'B'}, set(), set(), {'C'}, set()]), 1)
+    assert next(changes) == {'A', 'B'}
+    assert next(changes) == {'C'}
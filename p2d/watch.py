@@ -0,0 +1,175 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+POLL_INTERVAL = 1.0
+
+
+class PollingWatcher(object):
+    """Watch a directory tree by comparing a snapshot of it (the stat()
+    of every file) taken every POLL_INTERVAL seconds with the previous
+    one.
+
+    Works everywhere, but costs a walk of the whole tree on each poll.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._snapshot = self.__snapshot()
+
+    def __snapshot(self):
+        snapshot = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for name in dirnames + filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        return snapshot
+
+    def wait(self, timeout=None):
+        """Wait for changes in the tree.
+
+        Args:
+            timeout (float): seconds to wait at most, forever if None.
+
+        Returns:
+            the set of the names of the entries of root in which
+            something changed since the last call, empty on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, deadline - time.monotonic())
+            if delay > 0:
+                time.sleep(delay)
+            snapshot = self.__snapshot()
+            changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                       if snapshot.get(path) != self._snapshot.get(path)}
+            self._snapshot = snapshot
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return {_top_name(self.root, path) for path in changed}
+
+
+class InotifyWatcher(object):
+    """Watch a directory tree with inotify(7) (Linux only), through ctypes.
+
+    Every directory of the tree is watched, directories created later
+    included, so only the changes are ever read.
+    """
+
+    __EVENT = struct.Struct('iIII')
+    __IN_NONBLOCK = os.O_NONBLOCK
+    __IN_CLOEXEC = 0o2000000
+    __IN_ISDIR = 0x40000000
+    __IN_Q_OVERFLOW = 0x4000
+    __IN_IGNORED = 0x8000
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    # IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    __MASK = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400 | 0x800
+
+    def __init__(self, root):
+        """Raises OSError if inotify is not available."""
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.root = root
+        self._fd = self._libc.inotify_init1(self.__IN_NONBLOCK | self.__IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._dirs = {}
+        try:
+            self.__add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def __add_tree(self, top):
+        for dirpath, _, _ in os.walk(top):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), self.__MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOENT:
+                    continue
+                raise OSError(err, 'inotify_add_watch failed', dirpath)
+            self._dirs[wd] = dirpath
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __read(self, timeout):
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.__EVENT.unpack_from(data, offset)
+            offset += self.__EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def wait(self, timeout=None):
+        """See PollingWatcher.wait()."""
+        changed = set()
+        for wd, mask, name in self.__read(timeout):
+            if mask & self.__IN_Q_OVERFLOW:
+                # Events were lost: consider everything changed.
+                changed.update(os.listdir(self.root))
+                continue
+            dirpath = self._dirs.get(wd)
+            if dirpath is None:
+                continue
+            if mask & self.__IN_IGNORED:
+                del self._dirs[wd]
+            path = os.path.join(dirpath, name) if name else dirpath
+            if path == self.root:
+                continue
+            if mask & self.__IN_ISDIR and os.path.isdir(path):
+                self.__add_tree(path)
+            changed.add(_top_name(self.root, path))
+        return changed
+
+
+def _top_name(root, path):
+    return os.path.relpath(path, root).split(os.sep, 1)[0]
+
+
+def watcher(root):
+    """Return a watcher of the tree at root: an InotifyWatcher if possible,
+    otherwise a PollingWatcher.
+    """
+    try:
+        return InotifyWatcher(root)
+    except (OSError, AttributeError):
+        return PollingWatcher(root)
+
+
+def debounced(watcher, delay):
+    """Yield the sets of names changed in the tree of watcher (see
+    PollingWatcher.wait()), each set gathering a burst of changes: it is
+    only yielded once nothing changed for delay seconds.
+    """
+    while True:
+        changed = watcher.wait()
+        while True:
+            more = watcher.wait(delay)
+            if not more:
+                break
+            changed |= more
+        if changed:
+            yield changed
@@ -37,7 +37,7 @@ setup(
             'p2d=p2d.main:main'
         ]
     },
-    python_requires='>=3.5',
+    python_requires='>=3.6',
     platforms='any',
     install_requires=[
         'PyYAML'